@@ -1,4 +1,7 @@
 """Импортируем основные компоненты бота."""
+from . import startup  # первым: отсчёт времени запуска
 from .handlers import router  # импортируем уже собранный router
 
+startup.mark("handlers")
+
 __all__ = ["router"]
\ No newline at end of file
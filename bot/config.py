@@ -1,10 +1,16 @@
 """Конфигурация приложения."""
 from dataclasses import dataclass
+import contextlib
+import io
+import multiprocessing
+import importlib.util
 import os
 import sys
 import re
 from pathlib import Path
 
+from bot import startup
+
 
 def get_version_from_pyproject():
     """Читает версию из pyproject.toml без toml пакета."""
@@ -32,7 +38,7 @@ IS_DEVELOPMENT = os.path.exists('.git') and not os.path.exists('/etc/systemd')
 
 
 def _parse_duration_to_seconds(val: str, default_seconds: int) -> int:
-    """Парсит длительность вида '10s', '2m', '1h' в секунды. Поддерживаются s/m/h.
+    """Парсит длительность вида '10s', '2m', '1h', '7d' в секунды. Поддерживаются s/m/h/d.
     Если парсинг не удался — возвращает default_seconds.
     """
     try:
@@ -42,7 +48,7 @@ def _parse_duration_to_seconds(val: str, default_seconds: int) -> int:
         # Если чисто число — считаем секундами
         if s.isdigit():
             return int(s)
-        m = re.match(r"^(\d+)\s*([smh])$", s)
+        m = re.match(r"^(\d+)\s*([smhd])$", s)
         if not m:
             return default_seconds
         num = int(m.group(1))
@@ -53,6 +59,8 @@ def _parse_duration_to_seconds(val: str, default_seconds: int) -> int:
             return num * 60
         if unit == 'h':
             return num * 3600
+        if unit == 'd':
+            return num * 86400
         return default_seconds
     except Exception:
         return default_seconds
@@ -70,6 +78,8 @@ class Settings:
     max_file_mb: int
     max_log_mb: int
     debug_mode: bool
+    log_format: str
+    log_sample_burst: int
     # Платформо-зависимые настройки
     platform: str
     is_windows: bool
@@ -79,12 +89,56 @@ class Settings:
     openai_timeout_seconds: int
     openai_max_retries: int
     openai_global_concurrency: int
+    whisper_concurrency: int
+    whisper_segment_seconds: int
+    image_detail: str
+    # Документы
+    document_mode: str
+    document_top_k: int
+    document_mapreduce_pages: int
+    document_map_concurrency: int
+    # Уборка файлов OpenAI
+    openai_file_ttl_seconds: int
+    openai_file_gc_concurrency: int
+    # Кэш файлов Telegram
+    tg_cache_mb: int
     # Напоминания
     reminder_poll_interval_seconds: int
     reminder_batch_limit: int
     reminder_lookahead_seconds: int
     reminder_jitter_seconds: int
     reminder_default_silent: bool
+    reminder_pregen_lead_seconds: int
+    reminder_pregen_concurrency: int
+    reminder_fast_path: bool
+    # Фоновые задачи
+    jobs_concurrency: int
+    jobs_max_attempts: int
+    jobs_retry_base_seconds: int
+    # Исходящие сообщения Telegram (flood control)
+    telegram_global_rate: float
+    telegram_chat_rate: float
+    telegram_retry_max: int
+    # Индикатор прогресса
+    progress_placeholder_delay_seconds: int
+    progress_edit_rate: float
+    # Очередь апдейтов на чат
+    chat_mailbox_limit: int
+    # Приём обновлений: polling или webhook
+    bot_mode: str
+    webhook_url: str
+    webhook_path: str
+    webhook_secret: str
+    webhook_host: str
+    webhook_port: int
+    webhook_workers: int
+    # Многопроцессный запуск
+    workers: int
+    shard_base_port: int
+    # Прогрев перед приёмом апдейтов
+    warmup_timeout_seconds: int
+    # Плавная остановка
+    drain_timeout_seconds: int
 
 
 def create_settings():
@@ -104,18 +158,16 @@ def create_settings():
     ]
 
     def check_packages():
-        print("Проверка необходимых пакетов:")
+        # find_spec только ищет пакет, не импортируя его: openai и aiogram загружаются
+        # позже и только там, где действительно нужны
         errors = []
         for pkg in REQUIRED_PACKAGES:
-            try:
-                if pkg == "python_dotenv":
-                    __import__("dotenv")
-                else:
-                    __import__(pkg)
-                print(f"✅ {pkg} установлен")
-            except ImportError:
+            module = "dotenv" if pkg == "python_dotenv" else pkg
+            if importlib.util.find_spec(module) is None:
                 print(f"❌ {pkg} не установлен")
                 errors.append(pkg)
+        if not errors:
+            print(f"✅ Необходимые пакеты установлены: {', '.join(REQUIRED_PACKAGES)}")
         return errors
 
     package_errors = check_packages()
@@ -157,8 +209,11 @@ def create_settings():
         if val is None:
             print(f"❌ Не удалось считать обязательную переменную {name}")
             raise RuntimeError(f"Не задана обязательная переменная {name}")
+        # Печатаем только обязательные и изменённые относительно умолчания переменные
+        if default is not None and val == default:
+            return val
         # Не выводим значения ключей
-        if name.lower() in {"bot_token", "openai_api_key"}:
+        if name.lower() in {"bot_token", "openai_api_key", "webhook_secret"}:
             print(f"✅ Переменная {name} успешно считана (скрыто)")
         else:
             print(f"✅ Переменная {name} = {val}")
@@ -178,15 +233,61 @@ def create_settings():
         ("MAX_FILE_MB", "20"),
         ("MAX_LOG_MB", "5"),
         ("DEBUG_MODE", "1" if IS_DEVELOPMENT else "0"),
+        ("LOG_FORMAT", "text"),
+        ("LOG_SAMPLE_BURST", "20"),
         ("OPENAI_TIMEOUT_SECONDS", "180"),
         ("OPENAI_MAX_RETRIES", "0"),
         ("OPENAI_GLOBAL_CONCURRENCY", "4"),
+        ("WHISPER_CONCURRENCY", "3"),
+        ("WHISPER_SEGMENT", "60s"),
+        ("IMAGE_DETAIL", "auto"),
+        # Документы
+        ("DOCUMENT_MODE", "file"),
+        ("DOCUMENT_TOP_K", "6"),
+        ("DOCUMENT_MAPREDUCE_PAGES", "60"),
+        ("DOCUMENT_MAP_CONCURRENCY", "3"),
+        # Уборка файлов OpenAI
+        ("OPENAI_FILE_TTL", "7d"),
+        ("OPENAI_FILE_GC_CONCURRENCY", "4"),
+        # Кэш файлов Telegram
+        ("TG_CACHE_MB", "32"),
         # Напоминания
         ("REMINDER_POLL_INTERVAL", "10s"),
         ("REMINDER_BATCH_LIMIT", "50"),
         ("REMINDER_LOOKAHEAD", "2s"),
         ("REMINDER_JITTER", "2s"),
         ("REMINDER_DEFAULT_SILENT", "1"),
+        ("REMINDER_PREGEN_LEAD", "2m"),
+        ("REMINDER_PREGEN_CONCURRENCY", "2"),
+        ("REMINDER_FAST_PATH", "1"),
+        # Фоновые задачи
+        ("JOBS_CONCURRENCY", "4"),
+        ("JOBS_MAX_ATTEMPTS", "5"),
+        ("JOBS_RETRY_BASE", "30s"),
+        # Исходящие сообщения Telegram
+        ("TELEGRAM_GLOBAL_RATE", "30"),
+        ("TELEGRAM_CHAT_RATE", "1"),
+        ("TELEGRAM_RETRY_MAX", "3"),
+        # Индикатор прогресса
+        ("PROGRESS_PLACEHOLDER_DELAY", "3s"),
+        ("PROGRESS_EDIT_RATE", "5"),
+        # Очередь апдейтов на чат
+        ("CHAT_MAILBOX_LIMIT", "10"),
+        # Приём обновлений
+        ("BOT_MODE", "polling"),
+        ("WEBHOOK_URL", ""),
+        ("WEBHOOK_PATH", "/telegram"),
+        ("WEBHOOK_SECRET", ""),
+        ("WEBHOOK_HOST", "0.0.0.0"),
+        ("WEBHOOK_PORT", "8080"),
+        ("WEBHOOK_WORKERS", "32"),
+        # Многопроцессный запуск
+        ("WORKERS", "1"),
+        ("SHARD_BASE_PORT", "8181"),
+        # Прогрев перед приёмом апдейтов
+        ("WARMUP_TIMEOUT", "10s"),
+        # Плавная остановка
+        ("DRAIN_TIMEOUT", "60s"),
     ]
 
     env_values = {}
@@ -204,6 +305,8 @@ def create_settings():
     if env_errors:
         print(f"\n❌ Не заданы обязательные переменные окружения: {', '.join(env_errors)}")
         sys.exit(1)
+    print(f"✅ Остальные {sum(1 for var, default in OPTIONAL_ENV_VARS if env_values[var] == default)} "
+          f"переменных — по умолчанию (см. .env.example)")
 
     # Создаем объект настроек
     return Settings(
@@ -217,6 +320,8 @@ def create_settings():
         max_file_mb=int(env_values["MAX_FILE_MB"]),
         max_log_mb=int(env_values["MAX_LOG_MB"]),
         debug_mode=bool(int(env_values["DEBUG_MODE"])),
+        log_format=env_values["LOG_FORMAT"].strip().lower(),
+        log_sample_burst=max(0, int(env_values["LOG_SAMPLE_BURST"])),
         # Платформо-зависимые настройки
         platform=_platform,
         is_windows=IS_WINDOWS,
@@ -226,13 +331,64 @@ def create_settings():
         openai_timeout_seconds=int(env_values["OPENAI_TIMEOUT_SECONDS"]),
         openai_max_retries=int(env_values["OPENAI_MAX_RETRIES"]),
         openai_global_concurrency=int(env_values["OPENAI_GLOBAL_CONCURRENCY"]),
+        whisper_concurrency=int(env_values["WHISPER_CONCURRENCY"]),
+        whisper_segment_seconds=_parse_duration_to_seconds(env_values["WHISPER_SEGMENT"], 60),
+        image_detail=env_values["IMAGE_DETAIL"].strip().lower(),
+        # Документы
+        document_mode=env_values["DOCUMENT_MODE"].strip().lower(),
+        document_top_k=int(env_values["DOCUMENT_TOP_K"]),
+        document_mapreduce_pages=int(env_values["DOCUMENT_MAPREDUCE_PAGES"]),
+        document_map_concurrency=int(env_values["DOCUMENT_MAP_CONCURRENCY"]),
+        # Уборка файлов OpenAI
+        openai_file_ttl_seconds=_parse_duration_to_seconds(env_values["OPENAI_FILE_TTL"], 7 * 86400),
+        openai_file_gc_concurrency=int(env_values["OPENAI_FILE_GC_CONCURRENCY"]),
+        # Кэш файлов Telegram
+        tg_cache_mb=int(env_values["TG_CACHE_MB"]),
         # Напоминания
         reminder_poll_interval_seconds=_parse_duration_to_seconds(env_values["REMINDER_POLL_INTERVAL"], 10),
         reminder_batch_limit=int(env_values["REMINDER_BATCH_LIMIT"]),
         reminder_lookahead_seconds=_parse_duration_to_seconds(env_values["REMINDER_LOOKAHEAD"], 2),
         reminder_jitter_seconds=_parse_duration_to_seconds(env_values["REMINDER_JITTER"], 2),
         reminder_default_silent=bool(int(env_values["REMINDER_DEFAULT_SILENT"])),
+        reminder_pregen_lead_seconds=_parse_duration_to_seconds(env_values["REMINDER_PREGEN_LEAD"], 120),
+        reminder_pregen_concurrency=int(env_values["REMINDER_PREGEN_CONCURRENCY"]),
+        reminder_fast_path=bool(int(env_values["REMINDER_FAST_PATH"])),
+        # Фоновые задачи
+        jobs_concurrency=int(env_values["JOBS_CONCURRENCY"]),
+        jobs_max_attempts=int(env_values["JOBS_MAX_ATTEMPTS"]),
+        jobs_retry_base_seconds=_parse_duration_to_seconds(env_values["JOBS_RETRY_BASE"], 30),
+        # Исходящие сообщения Telegram
+        telegram_global_rate=float(env_values["TELEGRAM_GLOBAL_RATE"]),
+        telegram_chat_rate=float(env_values["TELEGRAM_CHAT_RATE"]),
+        telegram_retry_max=int(env_values["TELEGRAM_RETRY_MAX"]),
+        # Индикатор прогресса
+        progress_placeholder_delay_seconds=_parse_duration_to_seconds(env_values["PROGRESS_PLACEHOLDER_DELAY"], 3),
+        progress_edit_rate=float(env_values["PROGRESS_EDIT_RATE"]),
+        # Очередь апдейтов на чат
+        chat_mailbox_limit=int(env_values["CHAT_MAILBOX_LIMIT"]),
+        # Приём обновлений
+        bot_mode="webhook" if env_values["BOT_MODE"].strip().lower() == "webhook" else "polling",
+        webhook_url=env_values["WEBHOOK_URL"].strip(),
+        webhook_path="/" + env_values["WEBHOOK_PATH"].strip().lstrip("/"),
+        webhook_secret=env_values["WEBHOOK_SECRET"].strip(),
+        webhook_host=env_values["WEBHOOK_HOST"].strip(),
+        webhook_port=int(env_values["WEBHOOK_PORT"]),
+        webhook_workers=int(env_values["WEBHOOK_WORKERS"]),
+        # Многопроцессный запуск
+        workers=max(1, int(env_values["WORKERS"])),
+        shard_base_port=int(env_values["SHARD_BASE_PORT"]),
+        # Прогрев перед приёмом апдейтов
+        warmup_timeout_seconds=_parse_duration_to_seconds(env_values["WARMUP_TIMEOUT"], 10),
+        # Плавная остановка
+        drain_timeout_seconds=_parse_duration_to_seconds(env_values["DRAIN_TIMEOUT"], 60),
     )
 
 # Создаем настройки только при импорте модуля
-settings = create_settings()
\ No newline at end of file
+if multiprocessing.parent_process() is not None:
+    # Дочерний процесс пула (spawn, см. bot/utils/pdf_text.py) заново импортирует
+    # настройки — без повторного отчёта о запуске в stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        settings = create_settings()
+else:
+    settings = create_settings()
+startup.mark("config")
\ No newline at end of file
@@ -1,5 +1,8 @@
 """Объединение всех роутеров."""
 from aiogram import Router
+from bot import startup
+
+startup.mark("aiogram")  # самый тяжёлый импорт — в отчёте о старте отдельной фазой
 from .commands import router as commands_router
 from .admin_update import router as admin_update_router
 from .text import router as text_router
@@ -6,8 +6,8 @@ from aiogram import Router, F, types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from bot.config import settings
+from bot.utils import drain
 from bot.utils.log import logger
-from bot.utils.version_checker import update_checker
 
 router = Router(name="admin_update")
 
@@ -19,6 +19,8 @@ async def cmd_update(message: types.Message):
         return  # игнорируем остальных
     
     await message.answer("🔍 Проверяю наличие обновлений...")
+    # Модуль нужен только админу и только здесь — не грузим его при старте
+    from bot.utils.version_checker import update_checker
     
     try:
         # Проверяем доступность обновлений
@@ -92,7 +94,7 @@ async def callback_update_confirm(callback: types.CallbackQuery):
         try:
             # Запускаем скрипт обновления
             proc = await asyncio.create_subprocess_exec(
-                "sudo", "bash", "-c", f"chmod +x {update_script} && {update_script} --no-restart",
+                "sudo", "bash", "-c", f"chmod +x {update_script} && {update_script} --skip-restart",
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.STDOUT,
                 cwd=str(project_root)
@@ -104,11 +106,14 @@ async def callback_update_confirm(callback: types.CallbackQuery):
                 output = stdout.decode(errors="ignore")
                 snippet = output[-1500:] if output else "(вывод пуст)"
                 await callback.message.edit_text(
-                    f"✅ <b>Обновление завершено успешно!</b>\n\n"
+                    f"✅ <b>Обновление завершено успешно!</b>\n"
+                    f"Бот перезапустится, как только завершит текущие запросы.\n\n"
                     f"<pre>{snippet}</pre>",
                     parse_mode="HTML"
                 )
                 logger.info("Ручное обновление через /update завершено успешно")
+                # Плавный рестарт: текущие запросы (включая этот callback) доработают
+                drain.request_restart("обновление")
             else:
                 # Показываем ошибку
                 error_output = stdout.decode(errors="ignore")
@@ -6,7 +6,6 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.types import ReplyKeyboardRemove
-import asyncio
 from aiogram.filters import Command
 from aiogram.enums import ParseMode
 from datetime import datetime, timezone, timedelta
@@ -19,10 +18,11 @@ from bot.config import settings, VERSION
 from bot.keyboards import main_kb
 from bot.utils.openai import OpenAIClient
 from bot.utils.db import get_conn, get_user_display_name, get_user_timezone
-from bot.utils.progress import show_progress_indicator
+from bot.utils.progress import start_progress
 from bot.utils.html import send_long_html_message, escape_html
 from bot.utils.errors import ErrorHandler
 from bot.utils.datetime_context import utc_to_user_local
+from bot.utils import doc_index
 
 router = Router()
 
@@ -81,6 +81,7 @@ async def cmd_help(msg: Message):
             "/checkmodel — проверить совместимость модели",
             "/limits — информация о rate limits",
             "/status — статус системы и служб",
+            "/deadjobs — упавшие фоновые задачи и их повтор",
             "/update — проверить и обновить бота",
             "/pricing — цены моделей"
         ])
@@ -250,9 +251,112 @@ async def cmd_status(msg: Message):
     for file_info in version_files:
         status_text += f"  {file_info}\n"
 
+    # Метрики единого планировщика фоновых задач
+    from bot.utils.jobs import get_jobs_metrics
+    from bot.utils import shards
+    jobs_metrics = get_jobs_metrics()
+    if shards.SHARD_COUNT > 1:
+        # Несколько воркеров: счётчики каждого процесса собираем из worker_stats
+        per_shard = await shards.collect_stats()
+        jobs_metrics = shards.merge_jobs_metrics(per_shard)
+        status_text += f"\n🧩 <b>Воркеры ({len(per_shard)} из {shards.SHARD_COUNT}):</b>\n"
+        for item in per_shard:
+            status_text += (
+                f"  • шард {item['shard']}: PID <code>{item['pid']}</code>, "
+                f"метрики {item['age_s']} с назад\n"
+            )
+    if jobs_metrics:
+        status_text += "\n⏰ <b>Фоновые задачи:</b>\n"
+        for name, m in jobs_metrics.items():
+            status_text += (
+                f"  • <code>{name}</code>: выполнено {m['done']}, ошибок {m['failed']} "
+                f"(повторов {m['retried']}, в dead-letter {m['dead']}), "
+                f"в работе {m['inflight']}, средняя задержка {m['avg_lag_s']} с\n"
+            )
+        status_text += "  Упавшие задачи: /deadjobs\n"
+
+    # Уборка файлов OpenAI
+    from bot.utils.file_gc import get_gc_stats
+    gc = await get_gc_stats()
+    status_text += (
+        f"\n🗑 <b>Файлы OpenAI:</b> используется {gc['tracked']}, "
+        f"в очереди на удаление {gc.get('scheduled', 0)}, удалено {gc.get('done', 0)}, "
+        f"не удалось {gc.get('dead', 0) + gc.get('error', 0)}\n"
+    )
+
+    # Кэш файлов Telegram
+    from bot.utils.tg_cache import get_cache_stats
+    tc = get_cache_stats()
+    status_text += (
+        f"📦 <b>Кэш файлов Telegram:</b> {tc['items']} файлов, "
+        f"{tc['bytes'] // 1024} из {tc['budget'] // 1024} КБ, попаданий {tc['hits']}, промахов {tc['misses']}\n"
+    )
+
     await send_long_html_message(msg, status_text)
 
 
+# ——— /deadjobs (админ) —————————————————————————————————————————— #
+async def _render_dead_jobs() -> tuple[str, InlineKeyboardMarkup | None]:
+    from bot.utils.jobs import LEGACY_ERROR_STATUS, count_dead, list_dead
+    counts = await count_dead()
+    total = sum(counts.values())
+    legacy = sum((await count_dead(LEGACY_ERROR_STATUS)).values())
+    legacy_line = f"ℹ️ Старых ошибок (до появления повторов, не повторяются): {legacy}" if legacy else ""
+    if not total:
+        text = "✅ Dead-letter пуст: все фоновые задачи выполнены или ждут повтора."
+        return ("\n\n".join(filter(None, [text, legacy_line])), None)
+    lines = [f"☠️ <b>Задачи в dead-letter:</b> {total}", ""]
+    for name, cnt in counts.items():
+        if cnt:
+            lines.append(f"• <code>{name}</code>: {cnt}")
+    if legacy_line:
+        lines.append(legacy_line)
+    lines.append("")
+    lines.append("<b>Последние:</b>")
+    for item in await list_dead(limit=10):
+        err = escape_html(str(item["last_error"] or "—"))[:200]
+        lines.append(
+            f"• <code>{item['kind']}#{item['id']}</code> chat <code>{item['chat_id']}</code>, "
+            f"срок {item['due_at']} UTC, попыток {item['attempts']}\n  {err}"
+        )
+    kb = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔁 Повторить все", callback_data="deadjobs:replay")],
+        [InlineKeyboardButton(text="🔄 Обновить", callback_data="deadjobs:refresh")],
+    ])
+    return ("\n".join(lines), kb)
+
+
+@router.message(F.text == "/deadjobs")
+@ErrorHandler.error_handler("deadjobs_command")
+async def cmd_deadjobs(msg: Message):
+    """Показывает фоновые задачи, исчерпавшие попытки (только для админа)."""
+    if msg.from_user.id != settings.admin_id:
+        return
+    text, kb = await _render_dead_jobs()
+    await msg.answer(text, reply_markup=kb, parse_mode="HTML")
+
+
+@router.callback_query(lambda c: c.data and c.data.startswith("deadjobs:"))
+@ErrorHandler.error_handler("deadjobs_callback")
+async def cb_deadjobs(callback: CallbackQuery):
+    """Повтор всех задач из dead-letter либо обновление списка."""
+    if callback.from_user.id != settings.admin_id:
+        await callback.answer("❌ Недостаточно прав", show_alert=True)
+        return
+    action = callback.data.split(":", 1)[1]
+    if action == "replay":
+        from bot.utils.jobs import replay_dead
+        replayed = await replay_dead()
+        await callback.answer(f"Возвращено в очередь: {replayed}")
+    else:
+        await callback.answer()
+    text, kb = await _render_dead_jobs()
+    try:
+        await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
+    except Exception:
+        await callback.message.answer(text, reply_markup=kb, parse_mode="HTML")
+
+
 # ——— /models (админ) —————————————————————————————————————————— #
 @router.message(F.text == "/models")
 @ErrorHandler.error_handler("models_command")
@@ -337,6 +441,7 @@ async def cmd_reset(msg: Message, state: FSMContext):
     """Удаляет сохранённый previous_response_id и все файлы OpenAI для чата. Также очищает все напоминания для этого чата."""
     # Удаляем файлы из OpenAI и БД
     await OpenAIClient.delete_files_by_chat(msg.chat.id)
+    await doc_index.clear_chat(msg.chat.id)
     # Очищаем историю чата и напоминания
     async with get_conn() as db:
         await db.execute(
@@ -353,37 +458,123 @@ async def cmd_reset(msg: Message, state: FSMContext):
 
 
 # ——— /reminders —————————————————————————————————————————— #
-async def _render_reminders_list(chat_id: int, user_id: int) -> tuple[str, InlineKeyboardMarkup | None]:
+REMINDERS_PAGE_SIZE = 10
+
+# Страница задаётся ключом (due_at, id) своей первой строки: выборка идёт по индексу
+# idx_reminders_list без OFFSET, а удаление не сдвигает соседние страницы.
+_REMINDERS_WHERE = "chat_id=? AND user_id=? AND status='scheduled'"
+_REMINDERS_FROM = "due_at >= ? AND (due_at > ? OR id >= ?)"   # (due_at, id) >= ключа
+_REMINDERS_BEFORE = "due_at <= ? AND (due_at < ? OR id < ?)"  # (due_at, id) < ключа
+
+Anchor = tuple[str, int]
+
+
+def _reminders_anchor(data: str) -> Anchor | None:
+    """Разбирает «<id>:<due_at>» из callback_data (due_at сам содержит двоеточия)."""
+    try:
+        rid, due = data.split(":", 1)
+        return (due, int(rid))
+    except ValueError:
+        return None
+
+
+def _reminders_cb(prefix: str, anchor: Anchor) -> str:
+    due, rid = anchor
+    return f"{prefix}:{rid}:{due}"
+
+
+async def _previous_reminders_anchor(db, chat_id: int, user_id: int, anchor: Anchor) -> Anchor | None:
+    """Ключ страницы, которая заканчивается прямо перед anchor (None — раньше ничего нет)."""
+    due, rid = anchor
+    cur = await db.execute(
+        f"""
+        SELECT due_at, id
+          FROM reminders
+         WHERE {_REMINDERS_WHERE} AND {_REMINDERS_BEFORE}
+         ORDER BY due_at DESC, id DESC
+         LIMIT ?
+        """,
+        (chat_id, user_id, due, due, rid, REMINDERS_PAGE_SIZE),
+    )
+    rows = await cur.fetchall()
+    return (str(rows[-1][0]), rows[-1][1]) if rows else None
+
+
+async def _fetch_reminders_page(db, chat_id: int, user_id: int, anchor: Anchor | None) -> list:
+    """Строки страницы с ключа anchor включительно плюс одна лишняя — ключ следующей страницы."""
+    where, params = _REMINDERS_WHERE, [chat_id, user_id]
+    if anchor is not None:
+        due, rid = anchor
+        where += f" AND {_REMINDERS_FROM}"
+        params += [due, due, rid]
+    cur = await db.execute(
+        f"""
+        SELECT id, text, due_at, silent
+          FROM reminders
+         WHERE {where}
+         ORDER BY due_at ASC, id ASC
+         LIMIT ?
+        """,
+        (*params, REMINDERS_PAGE_SIZE + 1),
+    )
+    return await cur.fetchall()
+
+
+async def _render_reminders_list(
+    chat_id: int, user_id: int, anchor: Anchor | None = None
+) -> tuple[str, InlineKeyboardMarkup | None]:
+    """Одна страница напоминаний, начиная с ключа anchor (None — первая страница).
+
+    Если страница опустела (удалили последние строки), показывается предыдущая.
+    """
     tz = await get_user_timezone(user_id)
-    lines = ["⏰ <b>Ваши запланированные напоминания</b>", ""]
     async with get_conn() as db:
+        rows = await _fetch_reminders_page(db, chat_id, user_id, anchor)
+        if not rows and anchor is not None:
+            anchor = await _previous_reminders_anchor(db, chat_id, user_id, anchor)
+            rows = await _fetch_reminders_page(db, chat_id, user_id, anchor)
+        if not rows:
+            return ("⏰ У вас нет запланированных напоминаний.", None)
+        page, next_row = rows[:REMINDERS_PAGE_SIZE], rows[REMINDERS_PAGE_SIZE:]
+        page_anchor: Anchor = (str(page[0][2]), page[0][0])
         cur = await db.execute(
-            """
-            SELECT id, text, due_at, silent
-              FROM reminders
-             WHERE chat_id=? AND user_id=? AND status='scheduled'
-             ORDER BY due_at ASC
-             LIMIT 50
-            """,
-            (chat_id, user_id),
+            f"SELECT 1 FROM reminders WHERE {_REMINDERS_WHERE} AND {_REMINDERS_BEFORE} LIMIT 1",
+            (chat_id, user_id, page_anchor[0], page_anchor[0], page_anchor[1]),
         )
-        rows = await cur.fetchall()
-    if not rows:
-        return ("⏰ У вас нет запланированных напоминаний.", None)
+        has_prev = await cur.fetchone() is not None
+        cur = await db.execute(f"SELECT COUNT(*) FROM reminders WHERE {_REMINDERS_WHERE}", (chat_id, user_id))
+        total = (await cur.fetchone())[0]
+
+    lines = [f"⏰ <b>Ваши запланированные напоминания</b> (всего {total})", ""]
     kb = InlineKeyboardMarkup(inline_keyboard=[])
-    for r in rows:
-        rid, text, due_utc, silent = r
+    for rid, text, due_utc, silent in page:
         due_local = utc_to_user_local(str(due_utc), tz)
         lines.append(f"• <code>{rid}</code> — {due_local} — {escape_html(str(text))}")
-        # Кнопка удаления для каждого
+        # Кнопка удаления помнит страницу: после удаления перерисовывается только она
         kb.inline_keyboard.append([
-            InlineKeyboardButton(text=f"🗑 {rid}", callback_data=f"remdel:{rid}")
+            InlineKeyboardButton(text=f"🗑 {rid}", callback_data=_reminders_cb(f"remdel:{rid}", page_anchor))
         ])
+    nav = []
+    if has_prev:
+        nav.append(InlineKeyboardButton(text="◀️ Назад", callback_data=_reminders_cb("rempgb", page_anchor)))
+    if next_row:
+        next_anchor: Anchor = (str(next_row[0][2]), next_row[0][0])
+        nav.append(InlineKeyboardButton(text="Вперёд ▶️", callback_data=_reminders_cb("rempg", next_anchor)))
+    if nav:
+        kb.inline_keyboard.append(nav)
     # Кнопка удалить все
     kb.inline_keyboard.append([InlineKeyboardButton(text="Удалить все", callback_data="remdelall")])
     return ("\n".join(lines), kb)
 
 
+async def _show_reminders_page(callback: CallbackQuery, anchor: Anchor | None) -> None:
+    text, kb = await _render_reminders_list(callback.message.chat.id, callback.from_user.id, anchor)
+    try:
+        await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
+    except Exception:
+        await callback.message.answer(text, reply_markup=kb, parse_mode="HTML")
+
+
 @router.message(F.text == "/reminders")
 @ErrorHandler.error_handler("reminders_list")
 async def cmd_reminders(msg: Message):
@@ -391,14 +582,29 @@ async def cmd_reminders(msg: Message):
     await msg.answer(text, reply_markup=kb, parse_mode="HTML")
 
 
+@router.callback_query(lambda c: c.data and c.data.startswith(("rempg:", "rempgb:")))
+@ErrorHandler.error_handler("reminders_page")
+async def cb_rempage(callback: CallbackQuery):
+    prefix, data = callback.data.split(":", 1)
+    anchor = _reminders_anchor(data)
+    if anchor is not None and prefix == "rempgb":
+        async with get_conn() as db:
+            anchor = await _previous_reminders_anchor(db, callback.message.chat.id, callback.from_user.id, anchor)
+    await callback.answer()
+    await _show_reminders_page(callback, anchor)
+
+
 @router.callback_query(lambda c: c.data and c.data.startswith("remdel:"))
 @ErrorHandler.error_handler("reminders_delete_one")
 async def cb_remdel(callback: CallbackQuery):
+    # remdel:<id>[:<ключ страницы>] — у старых сообщений ключа нет, тогда первая страница
+    parts = callback.data.split(":", 2)
     try:
-        rid = int(callback.data.split(":", 1)[1])
+        rid = int(parts[1])
     except Exception:
         await callback.answer("Некорректный ID", show_alert=True)
         return
+    anchor = _reminders_anchor(parts[2]) if len(parts) > 2 else None
     async with get_conn() as db:
         await db.execute(
             "DELETE FROM reminders WHERE id=? AND chat_id=? AND user_id=? AND status='scheduled'",
@@ -406,12 +612,8 @@ async def cb_remdel(callback: CallbackQuery):
         )
         await db.commit()
     await callback.answer("Удалено")
-    # Перерисуем список
-    text, kb = await _render_reminders_list(callback.message.chat.id, callback.from_user.id)
-    try:
-        await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
-    except Exception:
-        await callback.message.answer(text, reply_markup=kb, parse_mode="HTML")
+    # Перерисуем только текущую страницу
+    await _show_reminders_page(callback, anchor)
 
 
 @router.callback_query(lambda c: c.data == "remdelall")
@@ -424,11 +626,7 @@ async def cb_remdel_all(callback: CallbackQuery):
         )
         await db.commit()
     await callback.answer("Все напоминания удалены")
-    text, kb = await _render_reminders_list(callback.message.chat.id, callback.from_user.id)
-    try:
-        await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
-    except Exception:
-        await callback.message.answer(text, reply_markup=kb, parse_mode="HTML")
+    await _show_reminders_page(callback, None)
 
 
 # ——— /stats —————————————————————————————————————————————— #
@@ -571,18 +769,11 @@ async def imggen_get_format(callback: CallbackQuery, state: FSMContext):
         size = "1024x1024"
     # Сразу отвечаем на callback, чтобы Telegram не выдал ошибку
     await callback.answer()
-    progress_task = None
-    try:
-        progress_task = asyncio.create_task(
-            show_progress_indicator(callback.bot, callback.message.chat.id, max_time=60)
-        )
+    async with start_progress(callback.bot, callback.message.chat.id, max_time=60):
         url = await OpenAIClient.dalle(prompt, size, callback.message.chat.id, callback.from_user.id)
         if not url:
             raise ValueError("Не удалось получить изображение.")
         await callback.message.answer_photo(url, caption=f"🖼 {prompt}")
-    finally:
-        if progress_task and not progress_task.done():
-            progress_task.cancel()
     await state.clear()
 
 
@@ -1,14 +1,18 @@
 """Обработка документов → загрузка в OpenAI → анализ через Responses API."""
 from aiogram import Router
 from aiogram.types import Message, Document
-import asyncio
+import json
 from bot.config import settings
-from bot.utils.openai import OpenAIClient
-from bot.utils.http_client import download_file
-from bot.utils.progress import show_progress_indicator
-from bot.utils.html import send_long_html_message, escape_html
+from bot.utils.openai import OpenAIClient, FilesManager
+from bot.utils.http_client import download_to_spool, FileTooLargeError
+from bot.utils.progress import start_progress
+from bot.utils.html import escape_html, render_markdown
 from bot.utils.errors import error_handler
 from bot.utils.datetime_context import enhance_content_dict_with_datetime
+from bot.utils.db import get_conn
+from bot.utils.log import logger
+from bot.utils import doc_index, pdf_text, tg_cache
+from bot.utils.doc_mapreduce import summarize_parts
 
 router = Router()
 
@@ -16,11 +20,175 @@ SUPPORTED_DOCUMENT_TYPES = {
     'application/pdf': '📄 PDF',
 }
 
+# Меньше текста на документ — скорее всего скан без текстового слоя, его читает только модель
+MIN_EXTRACTED_CHARS = 200
+
+
+async def _extract_pages(doc: Document, spool) -> list[str] | None:
+    """Текст PDF постранично (pypdf в отдельном процессе).
+
+    None — если pypdf не установлен или текстового слоя нет (скан): такой документ
+    читает только модель через input_file.
+    """
+    if not pdf_text.is_available():
+        logger.warning("pypdf не установлен — документ уходит в модель целиком (poetry install -E documents)")
+        return None
+    try:
+        pages = await pdf_text.extract_pdf_pages(spool.file)
+    except Exception as e:
+        logger.warning(f"Не удалось извлечь текст из {doc.file_name}: {e}")
+        return None
+    if sum(len(p.strip()) for p in pages) < MIN_EXTRACTED_CHARS:
+        return None
+    return pages
+
+
+async def _get_prev_id(chat_id: int) -> str | None:
+    async with get_conn() as db:
+        row = await (await db.execute(
+            "SELECT last_response FROM chat_history WHERE chat_id = ?", (chat_id,)
+        )).fetchone()
+    return row[0] if row else None
+
+
+async def _answer_with_context(msg: Message, file_name: str, context_text: str, footer: str,
+                               progress_message: str) -> None:
+    """Ответ на вопрос к документу по подготовленному тексту (фрагменты или конспект) в цепочке диалога."""
+    caption = msg.caption or "Проанализируй этот документ"
+    content = [
+        {
+            "type": "message",
+            "role": "user",
+            "content": [
+                {"type": "input_text", "text": context_text},
+                {"type": "input_text", "text": f"{caption}\n\nФайл: {file_name}"}
+            ]
+        }
+    ]
+    content[0] = await enhance_content_dict_with_datetime(content[0], msg.from_user.id)
+    prev_id = await _get_prev_id(msg.chat.id)
+
+    async with start_progress(msg.bot, msg.chat.id, message=progress_message, max_time=180) as progress:
+        response_text = await OpenAIClient.responses_request(
+            msg.chat.id,
+            msg.from_user.id,
+            content,
+            prev_id,
+            enable_web_search=True
+        )
+        safe_response = render_markdown(response_text or "")
+        result_text = f"📄 <b>Анализ файла {escape_html(file_name)}:</b>\n\n{safe_response}"
+        if footer:
+            result_text += f"\n\n<i>{footer}</i>"
+        await progress.finish(msg, result_text)
+
+
+async def _answer_from_index(msg: Message, file_name: str, sha256: str, pages_count: int, footer: str) -> None:
+    """DOCUMENT_MODE=index: ответ по релевантным фрагментам из локального индекса."""
+    if msg.caption:
+        chunks = await doc_index.search(msg.chat.id, msg.caption) or await doc_index.overview(msg.chat.id, sha256)
+    else:
+        chunks = await doc_index.overview(msg.chat.id, sha256)
+    await _answer_with_context(
+        msg, f"{file_name} ({pages_count} стр.)", doc_index.format_context(chunks),
+        footer,
+        "🔍 Анализирую документ",
+    )
+
+
+async def _answer_map_reduce(msg: Message, file_name: str, pages: list[str], footer: str) -> None:
+    """Большой документ: конспекты частей параллельно, затем итоговый ответ по сводке."""
+    summary = await summarize_parts(
+        msg.bot, msg.chat.id, msg.from_user.id, file_name, pages, msg.caption or "Проанализируй этот документ"
+    )
+    context_text = f"Сводный конспект документа {file_name} ({len(pages)} стр.), составленный по частям:\n\n{summary}"
+    await _answer_with_context(msg, file_name, context_text, footer, "🧩 Формирую итоговый ответ")
+
+
+async def _answer_with_file(msg: Message, doc: Document, file_id: str) -> None:
+    """Документ целиком через input_file (файл уже загружен в OpenAI)."""
+    caption = msg.caption or "Проанализируй этот документ"
+    async with start_progress(msg.bot, msg.chat.id, message="🔍 Анализирую документ", max_time=180) as progress:
+        content = [
+            {
+                "type": "message",
+                "role": "user",
+                "content": [
+                    {"type": "input_file", "file_id": file_id},
+                    {"type": "input_text", "text": f"{caption}\n\nФайл: {doc.file_name}"}
+                ]
+            }
+        ]
+        content[0] = await enhance_content_dict_with_datetime(content[0], msg.from_user.id)
+
+        response_text = await OpenAIClient.responses_request(
+            msg.chat.id,
+            msg.from_user.id,
+            content,
+            enable_web_search=True
+        )
+        safe_response = render_markdown(response_text or "")
+        result_text = f"📄 <b>Анализ файла {escape_html(doc.file_name or '')}:</b>\n\n{safe_response}"
+        await progress.finish(msg, result_text)
+
+
+def _route(msg: Message, pages_count: int | None) -> str:
+    """Способ обработки: file (целиком в модель), index (поиск по фрагментам) или mapreduce."""
+    index_mode = settings.document_mode == "index"
+    if not pages_count:
+        return "file"
+    large = 0 < settings.document_mapreduce_pages <= pages_count
+    # Конкретный вопрос к проиндексированному документу дешевле решить поиском
+    if large and not (index_mode and msg.caption):
+        return "mapreduce"
+    return "index" if index_mode else "file"
+
+
+def _index_footer(chunks_count: int) -> str:
+    return f"Документ проиндексирован ({chunks_count} фрагм.) — задавайте вопросы по нему в чате."
+
+
+async def _answer_known(msg: Message, doc: Document) -> bool:
+    """Документ уже встречался (тот же file_unique_id): ответ без скачивания, если это возможно.
+
+    Для режима file переиспользуется загруженный в OpenAI файл, для index — готовый
+    индекс чата. Map-reduce нужен текст, поэтому такой документ скачивается заново.
+    """
+    raw = await tg_cache.get_artifact(doc.file_unique_id, tg_cache.ARTIFACT_DOCUMENT)
+    if not raw:
+        return False
+    try:
+        known = json.loads(raw)
+        sha256, size, pages_count = known["sha256"], int(known["size"]), known.get("pages")
+    except Exception:
+        return False
+    needs_text = settings.document_mode == "index" or settings.document_mapreduce_pages > 0
+    if needs_text and pages_count is None:
+        return False  # текст раньше не извлекали — маршрут неизвестен
+    route = _route(msg, pages_count) if needs_text else "file"
+    file_name = doc.file_name or "document.pdf"
+    if route == "file":
+        file_id = await FilesManager.reuse_by_hash(sha256, size, msg.chat.id)
+        if not file_id:
+            return False
+        logger.info(f"Документ {file_name} уже загружен в OpenAI — скачивание пропущено")
+        await _answer_with_file(msg, doc, file_id)
+        return True
+    if route == "index":
+        chunks_count = await doc_index.count_chunks(msg.chat.id, sha256)
+        if not chunks_count:
+            return False
+        logger.info(f"Документ {file_name} уже проиндексирован в чате — скачивание пропущено")
+        await _answer_from_index(msg, file_name, sha256, pages_count, _index_footer(chunks_count))
+        return True
+    return False
+
+
 @router.message(lambda m: m.document)
 @error_handler("document_handler")
 async def handle_document(msg: Message):
-    upload_task = None
-    analyze_task = None
+    upload_progress = None
+    spool = None
     
     try:
         doc: Document = msg.document
@@ -41,47 +209,53 @@ async def handle_document(msg: Message):
             )
             return
 
-        caption = msg.caption or "Проанализируй этот документ"
-        file = await msg.bot.get_file(doc.file_id)
-        file_url = f"https://api.telegram.org/file/bot{settings.bot_token}/{file.file_path}"
-
-        upload_task = asyncio.create_task(
-            show_progress_indicator(msg.bot, msg.chat.id, max_time=120, message="📥 Загружаю документ")
-        )
-        data = await download_file(file_url)
+        if await _answer_known(msg, doc):
+            return
+        file_path = await tg_cache.get_file_path(msg.bot, doc.file_id, doc.file_unique_id)
 
-        file_id = await OpenAIClient.upload_file(data, doc.file_name, "user_data", chat_id=msg.chat.id)
-        if upload_task and not upload_task.done():
-            upload_task.cancel()
+        upload_progress = start_progress(msg.bot, msg.chat.id, message="📥 Загружаю документ", max_time=120)
+        # Потоковая загрузка в ограниченный буфер: память на документ не растёт с его размером
+        try:
+            spool = await download_to_spool(tg_cache.file_url(file_path), max_size_mb * 1024 * 1024)
+        except FileTooLargeError:
+            await msg.reply(f"📄 Файл слишком большой (>{max_size_mb} МБ)")
+            return
 
-        analyze_task = asyncio.create_task(
-            show_progress_indicator(msg.bot, msg.chat.id, max_time=180, message="🔍 Анализирую документ")
-        )
+        index_mode = settings.document_mode == "index"
+        pages = None
+        pages_count = None
+        if index_mode or settings.document_mapreduce_pages > 0:
+            pages = await _extract_pages(doc, spool)
+            pages_count = len(pages) if pages else (0 if pdf_text.is_available() else None)
+        # Запоминаем содержимое по file_unique_id: повтор этого документа обойдётся без скачивания
+        await tg_cache.put_artifact(doc.file_unique_id, tg_cache.ARTIFACT_DOCUMENT, json.dumps(
+            {"sha256": spool.sha256, "size": spool.size, "pages": pages_count}
+        ))
 
-        content = [
-            {
-                "type": "message",
-                "role": "user",
-                "content": [
-                    {"type": "input_file", "file_id": file_id},
-                    {"type": "input_text", "text": f"{caption}\n\nФайл: {doc.file_name}"}
-                ]
-            }
-        ]
-        content[0] = await enhance_content_dict_with_datetime(content[0], msg.from_user.id)
+        route = _route(msg, pages_count)
+        if route != "file":
+            await upload_progress.close()
+            file_name = doc.file_name or "document.pdf"
+            footer = ""
+            if index_mode:
+                chunks_count = await doc_index.index_document(msg.chat.id, file_name, spool.sha256, pages)
+                footer = _index_footer(chunks_count)
+            if route == "mapreduce":
+                await _answer_map_reduce(msg, file_name, pages, footer)
+            else:
+                await _answer_from_index(msg, file_name, spool.sha256, pages_count, footer)
+            return
 
-        response_text = await OpenAIClient.responses_request(
-            msg.chat.id, 
-            msg.from_user.id,
-            content,
-            enable_web_search=True
+        file_id = await OpenAIClient.upload_file(
+            spool.file, doc.file_name, "user_data", chat_id=msg.chat.id, sha256=spool.sha256, size=spool.size
         )
-        
-        safe_response = escape_html(response_text or "")
-        result_text = f"📄 <b>Анализ файла {escape_html(doc.file_name or '')}:</b>\n\n{safe_response}"
-        await send_long_html_message(msg, result_text)
+        spool.close()
+        spool = None
+        await upload_progress.close()
+
+        await _answer_with_file(msg, doc, file_id)
     finally:
-        if upload_task and not upload_task.done():
-            upload_task.cancel()
-        if analyze_task and not analyze_task.done():
-            analyze_task.cancel()
\ No newline at end of file
+        if spool is not None:
+            spool.close()
+        if upload_progress is not None:
+            await upload_progress.close()
\ No newline at end of file
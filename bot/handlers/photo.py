@@ -2,27 +2,83 @@
 from aiogram import Router
 from aiogram.types import Message
 import asyncio
+from typing import Dict, List, Optional, Set
 from bot.config import settings
 from bot.utils.openai import OpenAIClient
 from bot.utils.db import get_conn
-from bot.utils.progress import show_progress_indicator
+from bot.utils.progress import start_progress
 from bot.utils.errors import error_handler
 from bot.utils.datetime_context import enhance_content_dict_with_datetime
-from bot.utils.html import send_long_html_message, escape_html
+from bot.utils.html import render_markdown
+from bot.utils.image_input import choose_detail, choose_photo_size, get_image_data_url
+from bot.utils.log import logger
+from bot.utils import drain
+from bot.middlewares import ChatMailboxMiddleware
 
 router = Router()
 
+# Telegram присылает альбом отдельными сообщениями с общим media_group_id почти
+# одновременно; ждём тишины ALBUM_WINDOW секунд и отвечаем на весь альбом разом
+ALBUM_WINDOW = 1.0
+
+_albums: Dict[str, List[Message]] = {}
+_album_timers: Dict[str, asyncio.Task] = {}
+# Все таймеры альбомов, включая уже отвечающие: их ждёт плавная остановка
+_album_tasks: Set[asyncio.Task] = set()
+drain.register_backlog(lambda: len(_album_tasks))
+
+
 @router.message(lambda m: m.photo)
+async def handle_photo(msg: Message, chat_mailbox: Optional[ChatMailboxMiddleware] = None):
+    if not msg.media_group_id:
+        await answer_photos(msg, [msg])
+        return
+
+    key = f"{msg.chat.id}:{msg.media_group_id}"
+    _albums.setdefault(key, []).append(msg)
+    timer = _album_timers.get(key)
+    if timer and not timer.done():
+        timer.cancel()
+    task = _album_timers[key] = asyncio.create_task(_flush_album(key, chat_mailbox), name=f"album:{key}")
+    _album_tasks.add(task)
+    task.add_done_callback(_album_tasks.discard)
+
+
+async def _flush_album(key: str, chat_mailbox: Optional[ChatMailboxMiddleware]) -> None:
+    try:
+        await asyncio.sleep(ALBUM_WINDOW)
+    except asyncio.CancelledError:
+        return  # пришло ещё одно фото альбома — таймер перезапущен
+    _album_timers.pop(key, None)
+    messages = sorted(_albums.pop(key, []), key=lambda m: m.message_id)
+    if not messages:
+        return
+    logger.info(f"Альбом {key}: {len(messages)} фото одним запросом")
+    if chat_mailbox is None:
+        await answer_photos(messages[0], messages)
+        return
+    # Ответ на альбом идёт вне хендлера — занимаем очередь чата, чтобы следующее
+    # сообщение не обрабатывалось параллельно и не разорвало цепочку last_response
+    async with chat_mailbox.turn(messages[0].chat.id):
+        await answer_photos(messages[0], messages)
+
+
 @error_handler("photo_handler")
-async def handle_photo(msg: Message):
-    caption = msg.caption or "Опиши изображение"
-    largest = max(msg.photo, key=lambda p: p.file_size)
-    if largest.file_size > settings.max_file_mb * 1024 * 1024:
-        await msg.reply("Файл слишком большой (>20 МБ)")
+async def answer_photos(msg: Message, messages: List[Message]):
+    """Один запрос к модели на одно фото или весь альбом; msg — сообщение для ответа."""
+    # Подпись у альбома ставится на одно из фото
+    caption_src = next((m.caption for m in messages if m.caption), None)
+    caption = caption_src or ("Опиши изображения" if len(messages) > 1 else "Опиши изображение")
+    # Размер выбирается под нужную детализацию, самый крупный нужен редко
+    detail = choose_detail(caption_src)
+    limit = settings.max_file_mb * 1024 * 1024
+    sizes = [choose_photo_size(m.photo, detail) for m in messages]
+    sizes = [s for s in sizes if (s.file_size or 0) <= limit]
+    if not sizes:
+        await msg.reply(f"Файл слишком большой (>{settings.max_file_mb} МБ)")
         return
 
-    file = await msg.bot.get_file(largest.file_id)
-    file_url = f"https://api.telegram.org/file/bot{settings.bot_token}/{file.file_path}"
+    image_urls = await asyncio.gather(*(get_image_data_url(msg.bot, s) for s in sizes))
 
     async with get_conn() as db:
         row = await (await db.execute(
@@ -36,26 +92,23 @@ async def handle_photo(msg: Message):
             "role": "user",
             "content": [
                 {"type": "input_text", "text": caption},
-                {"type": "input_image", "image_url": file_url}
+                *({"type": "input_image", "image_url": url, "detail": detail} for url in image_urls)
             ]
         }
     ]
     content[0] = await enhance_content_dict_with_datetime(content[0], msg.from_user.id)
 
-    progress_task = asyncio.create_task(
-        show_progress_indicator(msg.bot, msg.chat.id)
-    )
+    progress = start_progress(msg.bot, msg.chat.id)
 
     try:
         response_text = await OpenAIClient.responses_request(
-            msg.chat.id, 
+            msg.chat.id,
             msg.from_user.id,
-            content, 
+            content,
             prev_id,
             enable_web_search=True
         )
-        safe_text = escape_html(response_text or "")
-        await send_long_html_message(msg, safe_text)
+        safe_text = render_markdown(response_text or "")
+        await progress.finish(msg, safe_text)
     finally:
-        if progress_task and not progress_task.done():
-            progress_task.cancel()
\ No newline at end of file
+        await progress.close()
@@ -1,13 +1,14 @@
 """Обработка обычных текстовых сообщений."""
-import asyncio
 from aiogram import Router, F
 from aiogram.types import Message
 from bot.utils.db import get_conn
 from bot.utils.openai import OpenAIClient
-from bot.utils.progress import show_progress_indicator
+from bot.utils.progress import start_progress
 from bot.utils.errors import error_handler
 from bot.utils.datetime_context import enhance_content_dict_with_datetime
-from bot.utils.html import send_long_html_message, escape_html
+from bot.utils.html import render_markdown
+from bot.utils.reminder_parser import try_schedule_reminder_locally
+from bot.utils import doc_index
 
 router = Router()
 
@@ -15,6 +16,12 @@ router = Router()
 @error_handler("text_handler")
 async def handle_text(msg: Message):
     """Обработка текстовых сообщений с индикатором прогресса и веб-поиском."""
+    # Простые просьбы о напоминании разбираем локально — без запроса к модели
+    ack = await try_schedule_reminder_locally(msg.chat.id, msg.from_user.id, msg.text, msg.message_id)
+    if ack:
+        await msg.answer(ack)
+        return
+
     async with get_conn() as db:
         cur = await db.execute(
             "SELECT last_response FROM chat_history WHERE chat_id = ?",
@@ -23,7 +30,7 @@ async def handle_text(msg: Message):
         row = await cur.fetchone()
         prev_id = row[0] if row else None
 
-    progress_task = asyncio.create_task(show_progress_indicator(msg.bot, msg.chat.id))
+    progress = start_progress(msg.bot, msg.chat.id)
 
     try:
         content = [{
@@ -33,6 +40,10 @@ async def handle_text(msg: Message):
         }]
         # Добавляем временной контекст с учётом TZ пользователя
         content[0] = await enhance_content_dict_with_datetime(content[0], msg.from_user.id)
+        # В режиме индекса документов — только релевантные фрагменты, а не весь файл
+        doc_context = await doc_index.context_message(msg.chat.id, msg.text)
+        if doc_context:
+            content.insert(0, doc_context)
 
         response_text = await OpenAIClient.responses_request(
             msg.chat.id,
@@ -41,8 +52,7 @@ async def handle_text(msg: Message):
             prev_id,
             enable_web_search=True
         )
-        safe_text = escape_html(response_text or "")
-        await send_long_html_message(msg, safe_text)
+        safe_text = render_markdown(response_text or "")
+        await progress.finish(msg, safe_text)
     finally:
-        if progress_task and not progress_task.done():
-            progress_task.cancel()
+        await progress.close()
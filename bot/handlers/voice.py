@@ -1,18 +1,18 @@
 """Голосовые сообщения → Whisper → текст → модель."""
 from aiogram import Router
 from aiogram.types import Message
-import asyncio
 import io
-import math
 
 from bot.config import settings
 from bot.utils.openai import OpenAIClient
-from bot.utils.http_client import download_file
-from bot.utils.progress import show_progress_indicator
+from bot.utils.openai.whisper import GAP_MARKER
+from bot.utils import tg_cache
+from bot.utils.progress import start_progress
 from bot.utils.errors import error_handler
 from bot.utils.datetime_context import enhance_content_dict_with_datetime
-from bot.utils.db import get_conn
-from bot.utils.html import send_long_html_message, escape_html
+from bot.utils.html import escape_html, render_markdown
+from bot.utils.reminder_parser import try_schedule_reminder_locally
+from bot.utils import doc_index
 
 router = Router()
 
@@ -24,56 +24,57 @@ async def handle_voice(msg: Message):
         await msg.reply(f"Файл слишком большой (>{settings.max_file_mb} МБ)")
         return
 
-    file = await msg.bot.get_file(v.file_id)
-    url = f"https://api.telegram.org/file/bot{settings.bot_token}/{file.file_path}"
-
-    # Запускаем индикатор прогресса
-    progress_task = asyncio.create_task(
-        show_progress_indicator(msg.bot, msg.chat.id)
-    )
+    # Индикатор распознавания; его заглушка станет сообщением с расшифровкой
+    progress = start_progress(msg.bot, msg.chat.id)
     
     try:
-        # Загружаем файл
-        data = await download_file(url)
-        
-        audio_file = io.BytesIO(data)
-        audio_file.name = "voice.ogg"
+        # То же голосовое (пересланное или повторное) уже расшифровано — без скачивания и Whisper
+        text = await tg_cache.get_artifact(v.file_unique_id, tg_cache.ARTIFACT_TRANSCRIPT)
+        if text is None:
+            data = await tg_cache.download(msg.bot, v.file_id, v.file_unique_id, settings.max_file_mb * 1024 * 1024)
+
+            audio_file = io.BytesIO(data)
+            audio_file.name = "voice.ogg"
 
-        # Расшифровываем через Whisper
-        text = await OpenAIClient.whisper(audio_file, msg.chat.id, msg.from_user.id)
+            # Расшифровываем через Whisper
+            # Длинные голосовые режутся на сегменты и распознаются параллельно;
+            # стоимость учитывается внутри по каждому запросу к Whisper
+            text = await OpenAIClient.whisper(audio_file, msg.chat.id, msg.from_user.id, duration=v.duration)
+            # Расшифровку с нераспознанными фрагментами не кэшируем — в следующий раз попробуем целиком
+            if text.strip() and GAP_MARKER not in text:
+                await tg_cache.put_artifact(v.file_unique_id, tg_cache.ARTIFACT_TRANSCRIPT, text)
         
         if not text.strip():
             await msg.answer("❌ Не удалось распознать речь в голосовом сообщении")
             return
 
-        await send_long_html_message(msg, f"🗣 Вы сказали: {escape_html(text)}")
+        await progress.finish(msg, f"🗣 Вы сказали: {escape_html(text)}")
 
-        # Учёт расходов Whisper: стоимость за полные минуты
-        minutes = max(1, math.ceil((v.duration or 0) / 60))
-        cost = minutes * settings.whisper_price
-        async with get_conn() as db:
-            await db.execute(
-                "INSERT INTO usage(chat_id, user_id, tokens, cost, model) VALUES (?, ?, ?, ?, ?)",
-                (msg.chat.id, msg.from_user.id, 0, cost, "whisper-1")
-            )
-            await db.commit()
+        # Простую просьбу о напоминании создаём сразу, без запроса к модели
+        ack = await try_schedule_reminder_locally(msg.chat.id, msg.from_user.id, text, msg.message_id)
+        if ack:
+            await msg.answer(ack)
+            return
 
-        # Получаем ответ от модели с веб-поиском
+        # Получаем ответ от модели с веб-поиском — новый индикатор под расшифровкой
+        progress = start_progress(msg.bot, msg.chat.id)
         content = [{"type": "message", "role": "user", "content": text}]
         
         # Добавляем временной контекст (TZ пользователя)
         content[0] = await enhance_content_dict_with_datetime(content[0], msg.from_user.id)
-        
+        doc_context = await doc_index.context_message(msg.chat.id, text)
+        if doc_context:
+            content.insert(0, doc_context)
+
         response_text = await OpenAIClient.responses_request(
             msg.chat.id, 
             msg.from_user.id,
             content,
             enable_web_search=True  # Включаем веб-поиск
         )
-        safe_text = escape_html(response_text or "")
-        await send_long_html_message(msg, safe_text)
+        safe_text = render_markdown(response_text or "")
+        await progress.finish(msg, safe_text)
 
     finally:
-        # Гарантированно отменяем задачу индикации
-        if progress_task and not progress_task.done():
-            progress_task.cancel()
\ No newline at end of file
+        # Гарантированно останавливаем индикатор
+        await progress.close()
\ No newline at end of file
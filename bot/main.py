@@ -2,7 +2,6 @@
 import asyncio
 import os
 import atexit
-import signal
 from pathlib import Path
 from typing import Optional
 
@@ -12,11 +11,25 @@ from aiogram.enums import ParseMode
 from aiogram.types import BotCommand, BotCommandScopeDefault, BotCommandScopeChat
 
 from bot.config import settings, VERSION
-from bot.middlewares import UserMiddleware, ErrorMiddleware
+from bot.middlewares import ChatMailboxMiddleware, RequestIdMiddleware, UserMiddleware, ErrorMiddleware
 from bot import router
 from bot.utils.log import logger
 from bot.utils.http_client import close_session
-from bot.utils.reminders import start_reminders_scheduler, start_self_calls_scheduler
+from bot.utils import pdf_text
+from bot.utils.outbound import OutboundMiddleware
+from bot.utils.jobs import start_jobs_scheduler, stop_jobs_scheduler
+from bot.utils.reminders import register_reminder_jobs
+from bot.utils.file_gc import register_file_gc_jobs
+from bot.utils.tg_cache import register_tg_cache_jobs
+from bot.webhook import run_polling, run_webhook, stop_polling
+from bot.utils import drain
+from bot.utils.drain import DrainMiddleware
+from bot.utils.log import stop_listener
+from bot.utils.warmup import warm_up
+from bot.utils import shards
+from bot import startup
+
+startup.mark("modules")
 
 # Путь к lock-файлу для single-instance
 LOCK_PATH = Path(__file__).parent.parent / "gpttg-bot.lock"
@@ -25,6 +38,9 @@ _LOCK_PID: Optional[int] = None
 # Режим разрешения нескольких экземпляров (для разработки / отладки)
 ALLOW_MULTI = os.getenv("GPTTG_ALLOW_MULTI", "0") == "1"
 
+# Сколько секунд без новых апдейтов ждёт воркер шарда, прежде чем считать очередь пустой
+DRAIN_QUIET_SECONDS = 2.0
+
 
 def _pid_running(pid: int) -> bool:
     """Проверяет, существует ли процесс с данным PID."""
@@ -84,12 +100,6 @@ def release_single_instance_lock() -> None:
         pass
 
 
-def _signal_handler(signum, frame):
-    # Чистим lock и выходим
-    release_single_instance_lock()
-    raise SystemExit(0)
-
-
 async def _configure_bot_commands(bot: Bot) -> None:
     """Регистрирует slash-команды в меню Telegram."""
     # Команды по умолчанию (для всех пользователей)
@@ -117,26 +127,46 @@ async def _configure_bot_commands(bot: Bot) -> None:
             BotCommand(command="checkmodel", description="Проверка модели"),
             BotCommand(command="limits", description="Информация о лимитах"),
             BotCommand(command="status", description="Статус системы"),
+            BotCommand(command="deadjobs", description="Упавшие фоновые задачи"),
             BotCommand(command="update", description="Проверить обновление"),
             BotCommand(command="pricing", description="Цены моделей"),
         ]
         await bot.set_my_commands(admin_commands, scope=BotCommandScopeChat(chat_id=admin_id))
 
 
+async def _register_bot_commands(bot: Bot) -> None:
+    """Регистрирует slash-команды; ошибка не мешает работе бота."""
+    try:
+        await _configure_bot_commands(bot)
+    except Exception as e:
+        logger.warning(f"Не удалось зарегистрировать slash-команды: {e}")
+
+
 async def main():
     """Основная функция запуска бота."""
+    # SIGTERM/SIGINT — плавная остановка; повторный Ctrl+C прерывает её
+    drain.install_signal_handlers(on_repeat=asyncio.current_task().cancel)
+
     # Инициализация БД только один раз при старте
     from bot.utils.db import init_db, close_pool
     await init_db()
+    startup.mark("init_db")
 
     bot = Bot(
         token=settings.bot_token,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+    # Все исходящие вызовы Telegram проходят через общий канал с flood control
+    bot.session.middleware(OutboundMiddleware())
 
     dp = Dispatcher()
 
     # Регистрируем middleware
+    dp.update.outer_middleware(RequestIdMiddleware())
+    dp.update.outer_middleware(DrainMiddleware())
+    if settings.chat_mailbox_limit > 0:
+        # Апдейты одного чата — строго по очереди, до любой работы хендлеров
+        dp.update.outer_middleware(ChatMailboxMiddleware(settings.chat_mailbox_limit))
     dp.message.middleware(UserMiddleware())
     dp.message.middleware(ErrorMiddleware())
     dp.callback_query.middleware(ErrorMiddleware())
@@ -146,55 +176,118 @@ async def main():
 
     logger.info(f"🚀 Запуск GPTTG бота версии {VERSION}")
 
-    # Настраиваем slash-команды в меню Telegram
-    try:
-        await _configure_bot_commands(bot)
-    except Exception as e:
-        logger.warning(f"Не удалось зарегистрировать slash-команды: {e}")
-
-    # Запускаем планировщики в фоне
-    reminders_task = start_reminders_scheduler(bot)
-    self_calls_task = start_self_calls_scheduler(bot)
+    # Настраиваем slash-команды в меню Telegram (при нескольких воркерах — один раз).
+    # В фоне: это несколько запросов к Bot API, а приём апдейтов от них не зависит
+    commands_task = asyncio.create_task(_register_bot_commands(bot)) if shards.is_primary() else None
+
+    # Запускаем единый планировщик фоновых задач (напоминания, самовызовы и т.д.)
+    register_reminder_jobs()
+    register_file_gc_jobs()
+    register_tg_cache_jobs()
+    shards.register_shard_jobs()
+    jobs_task = start_jobs_scheduler(bot)
+    startup.mark("dispatcher")
+
+    # Апдейты начинаем принимать только после прогрева (не дольше WARMUP_TIMEOUT)
+    await warm_up(bot)
+    startup.mark("warmup")
+    logger.info(startup.report())
+
+    if shards.is_worker():
+        # Воркер шарда: апдейты пересылает супервизор на локальный порт
+        intake = run_webhook(dp, bot, host="127.0.0.1", port=shards.SHARD_PORT,
+                             secret=shards.SHARD_SECRET, register=False)
+    elif settings.bot_mode == "webhook":
+        if not settings.webhook_secret:
+            logger.warning("WEBHOOK_SECRET не задан — вебхук примет запросы от кого угодно")
+        intake = run_webhook(dp, bot)
+    else:
+        intake = run_polling(dp, bot)
+    intake_task = asyncio.create_task(intake, name="intake")
+    drain_wait = asyncio.create_task(drain.wait_requested(), name="drain_wait")
 
     try:
-        await dp.start_polling(bot, allowed_updates=["message", "callback_query"])
+        await asyncio.wait({intake_task, drain_wait}, return_when=asyncio.FIRST_COMPLETED)
+        if intake_task.done():
+            intake_task.result()  # приём апдейтов завершился сам — ошибку пробрасываем
+        else:
+            await _drain(dp, bot, jobs_task)
     finally:
-        # Останавливаем планировщики
-        try:
-            for t in (reminders_task, self_calls_task):
-                stop_event = getattr(t, "_gpttg_stop_event", None)
-                if stop_event is not None:
-                    stop_event.set()
-                t.cancel()
-        except Exception:
-            pass
+        drain_wait.cancel()
+        intake_task.cancel()
+        await asyncio.gather(intake_task, return_exceptions=True)
+        # Останавливаем планировщик (после drain он уже остановлен)
+        if not jobs_task.done():
+            await stop_jobs_scheduler(jobs_task, 0)
+        if commands_task is not None:
+            commands_task.cancel()
+        pdf_text.shutdown()
         await close_session()
         await close_pool()
         await bot.session.close()
 
 
+async def _drain(dp: Dispatcher, bot: Bot, jobs_task: asyncio.Task) -> None:
+    """Плавная остановка: без новых апдейтов, с завершением начатой работы до DRAIN_TIMEOUT."""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + settings.drain_timeout_seconds
+    if not shards.is_worker() and settings.bot_mode != "webhook":
+        await stop_polling(dp, bot)
+    # Воркеру шарда супервизор ещё досылает уже принятые апдейты — ждём тишины
+    quiet = DRAIN_QUIET_SECONDS if shards.is_worker() else 0.0
+    idle, interrupted = await asyncio.gather(
+        drain.wait_idle(deadline, quiet),
+        stop_jobs_scheduler(jobs_task, deadline - loop.time()),
+    )
+    if idle and not interrupted:
+        logger.info(f"✅ Работа завершена за {loop.time() - started:.1f} с — выхожу")
+    else:
+        logger.warning(
+            f"DRAIN_TIMEOUT истёк: не завершено апдейтов {drain.pending_work()}, "
+            f"прервано фоновых задач {interrupted}"
+        )
+
+
+def _entrypoint():
+    """Один процесс или супервизор с WORKERS воркерами."""
+    if settings.workers > 1:
+        from bot.supervisor import run_supervisor
+        return run_supervisor(settings.workers)
+    return main()
+
+
+def _run(coro) -> None:
+    """asyncio.run с тихим выходом по повторному сигналу; в конце дописывает логи."""
+    try:
+        asyncio.run(coro)
+    except (asyncio.CancelledError, KeyboardInterrupt):
+        logger.warning("Остановка прервана повторным сигналом")
+    finally:
+        stop_listener()
+
+
 def run_bot():
     """Запуск бота с защитой от второго экземпляра."""
+    # Воркер шарда: lock-файл держит супервизор
+    if shards.is_worker():
+        logger.info(f"🚀 Воркер шарда {shards.SHARD_INDEX}/{shards.SHARD_COUNT} (PID {os.getpid()})")
+        _run(main())
+        return
+
     # Для разрешённого мультизапуска просто предупреждаем
     if ALLOW_MULTI:
         logger.warning("⚠️  GPTTG_ALLOW_MULTI=1 — защита single-instance отключена (dev mode)")
-        asyncio.run(main())
+        _run(_entrypoint())
         return
 
     # Регистрируем очистку lock-файла
     atexit.register(release_single_instance_lock)
     try:
-        # Устанавливаем обработчики сигналов для корректного завершения
-        try:
-            signal.signal(signal.SIGINT, _signal_handler)
-            signal.signal(signal.SIGTERM, _signal_handler)
-        except Exception:
-            # На некоторых платформах недоступно
-            pass
-
         acquire_single_instance_lock()
         logger.info("🚀 Запуск бота...")
-        asyncio.run(main())
+        # Сигналы остановки обрабатываются внутри цикла (bot/utils/drain.py)
+        _run(_entrypoint())
     finally:
         release_single_instance_lock()
 
@@ -1,13 +1,166 @@
-"""Простые middlewares: инициализация БД и глобальный обработчик ошибок."""
+"""Middlewares: метка запроса в логах, очередь обновлений по чатам, пользователи и глобальный обработчик ошибок."""
+import asyncio
+import contextvars
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, Optional
+
 from aiogram import BaseMiddleware
-from aiogram.types import TelegramObject, Message, CallbackQuery
-from bot.utils.log import logger
+from aiogram.types import TelegramObject, Message, CallbackQuery, Update
+from bot.utils.log import logger, request_id_var
 from bot.utils.db import save_user, mark_user_welcomed
 from bot.utils.errors import ErrorHandler
 from bot.keyboards import main_kb
 from bot.config import settings
 
 
+class RequestIdMiddleware(BaseMiddleware):
+    """Outer-middleware апдейтов: все записи лога при обработке апдейта помечаются его id."""
+
+    async def __call__(self, handler, event: TelegramObject, data):
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        token = request_id_var.set(f"u{event.update_id}")
+        try:
+            return await handler(event, data)
+        finally:
+            request_id_var.reset(token)
+
+
+class ProcessingSlot:
+    """Место апдейта в пуле обработки (WEBHOOK_WORKERS), которое можно вернуть на время ожидания."""
+
+    __slots__ = ("_sem", "held")
+
+    def __init__(self, sem: asyncio.Semaphore):
+        self._sem = sem
+        self.held = True  # создаётся уже после sem.acquire()
+
+    def release(self) -> None:
+        if self.held:
+            self.held = False
+            self._sem.release()
+
+    async def acquire(self) -> None:
+        if not self.held:
+            await self._sem.acquire()
+            self.held = True
+
+
+# Слот пула текущего апдейта (задаёт webhook-сервер; при polling пула нет)
+processing_slot: contextvars.ContextVar[Optional[ProcessingSlot]] = contextvars.ContextVar(
+    "processing_slot", default=None
+)
+
+
+class _ChatMailbox:
+    """Очередь одного чата: обновления обрабатываются строго по одному в порядке поступления."""
+
+    __slots__ = ("busy", "waiting", "dropped")
+
+    def __init__(self):
+        self.busy = False
+        self.waiting: Deque[asyncio.Future] = deque()
+        self.dropped = 0  # пропущено с начала текущей серии (предупреждаем один раз)
+
+
+class ChatMailboxMiddleware(BaseMiddleware):
+    """Outer-middleware апдейтов: последовательно внутри чата, параллельно между чатами.
+
+    aiogram обрабатывает каждый апдейт отдельной задачей, поэтому сообщения одного чата
+    шли бы наперегонки — с лишними чтениями БД, заглушками прогресса и ответами не по
+    порядку. Здесь апдейт ждёт своей очереди до любой работы хендлеров; очередь чата
+    ограничена CHAT_MAILBOX_LIMIT, а опустевшая очередь сразу удаляется. Нажатия
+    inline-кнопок идут мимо очереди: Telegram ждёт ответа на них всего несколько секунд.
+
+    Пока апдейт ждёт очереди, его слот пула обработки свободен для других чатов.
+    Работа вне хендлера (ответ на альбом по таймеру) занимает очередь через `turn()`;
+    хендлеры получают middleware аргументом `chat_mailbox`.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._mailboxes: Dict[int, _ChatMailbox] = {}
+
+    async def __call__(self, handler, event: TelegramObject, data):
+        chat = data.get("event_chat")
+        if not isinstance(event, Update) or event.callback_query is not None or chat is None:
+            return await handler(event, data)
+
+        slot = processing_slot.get()
+        if not await self.acquire(chat.id, self.limit, on_wait=slot.release if slot else None):
+            await self._drop(self._mailboxes[chat.id], chat.id, event)
+            return None
+        try:
+            if slot is not None:
+                await slot.acquire()
+            data["chat_mailbox"] = self
+            return await handler(event, data)
+        finally:
+            self.release(chat.id)
+
+    async def acquire(self, chat_id: int, limit: Optional[int] = None,
+                      on_wait: Optional[Callable[[], None]] = None) -> bool:
+        """Занимает очередь чата, дожидаясь предыдущих; False — ждущих уже `limit`.
+
+        `on_wait` вызывается, если придётся ждать. После True обязателен `release()`.
+        """
+        box = self._mailboxes.get(chat_id)
+        if box is None:
+            box = self._mailboxes[chat_id] = _ChatMailbox()
+        if box.busy:
+            if limit is not None and len(box.waiting) >= limit:
+                return False
+            turn = asyncio.get_running_loop().create_future()
+            box.waiting.append(turn)
+            if on_wait is not None:
+                on_wait()
+            try:
+                await turn
+            except asyncio.CancelledError:
+                if turn.done() and not turn.cancelled():
+                    self._next(chat_id, box)  # очередь уже передана нам — отдаём следующему
+                else:
+                    box.waiting.remove(turn)
+                raise
+        box.busy = True
+        return True
+
+    def release(self, chat_id: int) -> None:
+        """Передаёт очередь чата следующему ждущему."""
+        box = self._mailboxes.get(chat_id)
+        if box is not None:
+            self._next(chat_id, box)
+
+    @asynccontextmanager
+    async def turn(self, chat_id: int) -> AsyncIterator[None]:
+        """Очередь чата для работы вне хендлера (без лимита ожидающих)."""
+        await self.acquire(chat_id)
+        try:
+            yield
+        finally:
+            self.release(chat_id)
+
+    def _next(self, chat_id: int, box: _ChatMailbox) -> None:
+        while box.waiting:
+            turn = box.waiting.popleft()
+            if not turn.done():
+                turn.set_result(None)
+                return
+        box.busy = False
+        box.dropped = 0
+        self._mailboxes.pop(chat_id, None)
+
+    async def _drop(self, box: _ChatMailbox, chat_id: int, event: Update) -> None:
+        box.dropped += 1
+        logger.warning(f"Очередь чата {chat_id} переполнена ({self.limit}) — апдейт {event.update_id} пропущен")
+        if box.dropped == 1 and event.message is not None:
+            try:
+                await event.message.answer("⏳ Я ещё отвечаю на предыдущие сообщения — это сообщение пропущено.")
+            except Exception as e:
+                logger.debug(f"Не удалось предупредить о переполнении очереди: {e}")
+
+
 class UserMiddleware(BaseMiddleware):
     """Middleware для обработки пользователей и приветственных сообщений."""
     
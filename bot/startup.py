@@ -0,0 +1,48 @@
+"""Быстрый старт: отложенный импорт тяжёлых модулей и отчёт о времени запуска по фазам.
+
+Модуль импортируется первым (из `bot/__init__.py`) и зависит только от стандартной
+библиотеки, поэтому отсчёт начинается до загрузки aiogram, openai и настроек.
+`mark()` закрывает очередную фазу; `report()` даёт строку для лога вида
+«старт за 1.42 с: config 0.05, handlers 1.10, …».
+"""
+import importlib.util
+import sys
+import time
+from types import ModuleType
+from typing import List, Tuple
+
+_started = time.perf_counter()
+_last = _started
+_phases: List[Tuple[str, float]] = []
+
+
+def lazy_module(name: str) -> ModuleType:
+    """Модуль, который загружается при первом обращении к его атрибуту.
+
+    Подходит для тяжёлых зависимостей, нужных только при обработке запросов
+    (`openai`, `pytz`): импорт на старте откладывается до первого использования.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Модуль {name} не найден")
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def mark(phase: str) -> None:
+    """Закрывает фазу запуска: время с предыдущей отметки записывается под именем `phase`."""
+    global _last
+    now = time.perf_counter()
+    _phases.append((phase, now - _last))
+    _last = now
+
+
+def report() -> str:
+    total = time.perf_counter() - _started
+    parts = ", ".join(f"{name} {seconds:.2f}" for name, seconds in _phases)
+    return f"⏱ Старт за {total:.2f} с: {parts}"
@@ -0,0 +1,252 @@
+"""Многопроцессный запуск: супервизор и WORKERS воркеров, шардированных по чатам.
+
+Супервизор сам не обрабатывает апдейты: он получает их (long polling или webhook —
+как задано BOT_MODE), определяет chat_id и пересылает в воркер `|chat_id| % WORKERS`
+по локальному HTTP (тот же приёмник, что и у webhook-режима, с внутренним секретом).
+В каждый воркер апдейты уходят по одному в порядке поступления, поэтому очередь чата
+сохраняется. Упавший воркер перезапускается; пока его нет, апдейты ждут в очереди.
+
+По SIGTERM супервизор перестаёт забирать апдейты у Telegram, досылает воркерам уже
+принятые и только затем останавливает воркеров — каждый завершает начатую работу
+(см. `bot/utils/drain.py`).
+
+Воркеры — обычные процессы `python -m bot.main` с номером шарда в окружении
+(см. `bot/utils/shards.py`); фоновые задачи они делят по тем же шардам.
+"""
+from __future__ import annotations
+
+import asyncio
+import hmac
+import json
+import os
+import secrets
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiogram import Bot
+from aiohttp import web
+
+from bot.config import settings
+from bot.utils import drain
+from bot.utils.log import logger
+from bot.utils.shards import shard_for
+from bot.webhook import ALLOWED_UPDATES, SECRET_HEADER, confirm_updates, register_webhook
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+WORKER_RESTART_DELAY = 2.0
+FORWARD_RETRY_MAX_DELAY = 10.0
+WORKER_QUEUE_LIMIT = 10000  # при переполнении перестаём забирать апдейты у Telegram
+STOP_GRACE = 5.0  # сверх DRAIN_TIMEOUT воркеров, прежде чем добить их SIGKILL
+
+
+def chat_id_of(update: Dict[str, Any]) -> Optional[int]:
+    """chat_id апдейта без полного разбора в объекты aiogram."""
+    for key, value in update.items():
+        if not isinstance(value, dict):
+            continue
+        if key == "callback_query":
+            chat = (value.get("message") or {}).get("chat") or {}
+        else:
+            chat = value.get("chat") or {}
+        chat_id = chat.get("id") or (value.get("from") or {}).get("id")
+        if chat_id is not None:
+            return int(chat_id)
+    return None
+
+
+class _Worker:
+    def __init__(self, index: int, port: int):
+        self.index = index
+        self.port = port
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.busy = False  # апдейт отправлен, ответа ещё нет
+        self.queue: asyncio.Queue[Dict[str, Any]] = asyncio.Queue(maxsize=WORKER_QUEUE_LIMIT)
+
+
+class Supervisor:
+    def __init__(self, count: int):
+        self.count = count
+        self.secret = secrets.token_urlsafe(32)
+        self.workers = [_Worker(i, settings.shard_base_port + i) for i in range(count)]
+        self._stopping = False
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._last_update_id: Optional[int] = None
+
+    async def _spawn(self, worker: _Worker) -> None:
+        env = dict(os.environ)
+        env.update(
+            GPTTG_SHARD=str(worker.index),
+            GPTTG_SHARDS=str(self.count),
+            GPTTG_SHARD_PORT=str(worker.port),
+            GPTTG_SHARD_SECRET=self.secret,
+        )
+        worker.process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "bot.main", env=env, cwd=str(PROJECT_ROOT)
+        )
+        logger.info(f"[supervisor] воркер {worker.index} запущен (PID {worker.process.pid}, порт {worker.port})")
+
+    async def _watch(self, worker: _Worker) -> None:
+        while not self._stopping:
+            code = await worker.process.wait()
+            if self._stopping:
+                return
+            logger.error(f"[supervisor] воркер {worker.index} завершился с кодом {code} — перезапуск")
+            await asyncio.sleep(WORKER_RESTART_DELAY)
+            await self._spawn(worker)
+
+    async def _forward(self, worker: _Worker) -> None:
+        """Пересылает апдейты воркеру строго по одному; недоступный воркер ждём с повторами."""
+        url = f"http://127.0.0.1:{worker.port}{settings.webhook_path}"
+        headers = {SECRET_HEADER: self.secret}
+        while True:
+            update = await worker.queue.get()
+            worker.busy = True
+            delay = 0.5
+            while True:
+                try:
+                    async with self._session.post(url, json=update, headers=headers) as resp:
+                        if resp.status == 200:
+                            break
+                        if resp.status == 400:
+                            logger.warning(f"[supervisor] воркер {worker.index} отверг апдейт {update.get('update_id')}")
+                            break
+                except aiohttp.ClientError:
+                    pass  # воркер ещё стартует или перезапускается
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, FORWARD_RETRY_MAX_DELAY)
+            worker.busy = False
+
+    async def route(self, update: Dict[str, Any]) -> None:
+        await self.workers[shard_for(chat_id_of(update), self.count)].queue.put(update)
+
+    async def _poll(self, bot: Bot) -> None:
+        try:
+            await bot.delete_webhook(drop_pending_updates=False)
+        except Exception as e:
+            logger.warning(f"Не удалось снять webhook перед polling: {e}")
+        offset: Optional[int] = None
+        backoff = 1.0
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=ALLOWED_UPDATES)
+                backoff = 1.0
+            except Exception as e:
+                logger.warning(f"[supervisor] getUpdates: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            for update in updates:
+                # by_alias: в формате Bot API ("from", а не "from_user") — как приходит в webhook
+                await self.route(update.model_dump(mode="json", exclude_none=True, by_alias=True))
+                offset = update.update_id + 1
+                self._last_update_id = update.update_id
+
+    async def _serve_webhook(self, bot: Bot) -> None:
+        async def handle(request: web.Request) -> web.Response:
+            if settings.webhook_secret and not hmac.compare_digest(
+                request.headers.get(SECRET_HEADER, ""), settings.webhook_secret
+            ):
+                return web.Response(status=401)
+            if drain.is_draining():
+                return web.Response(status=503)  # Telegram повторит доставку новому процессу
+            try:
+                update = await request.json(loads=json.loads)
+            except ValueError:
+                return web.Response(status=400)
+            await self.route(update)
+            return web.Response()
+
+        async def health(request: web.Request) -> web.Response:
+            return web.json_response({
+                "workers": [
+                    {"shard": w.index, "pid": w.process.pid if w.process else None,
+                     "alive": bool(w.process and w.process.returncode is None), "queue": w.queue.qsize()}
+                    for w in self.workers
+                ]
+            })
+
+        app = web.Application()
+        app.router.add_post(settings.webhook_path, handle)
+        app.router.add_get("/healthz", health)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, settings.webhook_host, settings.webhook_port).start()
+        logger.info(f"🌐 Супервизор принимает webhook на {settings.webhook_host}:{settings.webhook_port}")
+        try:
+            await register_webhook(bot)
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    def _backlog(self) -> int:
+        return sum(w.queue.qsize() + int(w.busy) for w in self.workers)
+
+    async def _flush(self, deadline: float) -> None:
+        """Досылает воркерам уже принятые апдейты (не дольше deadline по loop.time())."""
+        loop = asyncio.get_running_loop()
+        while self._backlog() and loop.time() < deadline:
+            await asyncio.sleep(drain.POLL_SECONDS)
+        if self._backlog():
+            logger.warning(f"[supervisor] не досланы воркерам {self._backlog()} апдейт(ов)")
+
+    async def _stop_workers(self, timeout: float) -> None:
+        self._stopping = True
+        procs = [w.process for w in self.workers if w.process and w.process.returncode is None]
+        for proc in procs:
+            proc.terminate()  # воркер выполнит drain
+        try:
+            await asyncio.wait_for(asyncio.gather(*(p.wait() for p in procs)), timeout=timeout)
+        except asyncio.TimeoutError:
+            for proc in procs:
+                if proc.returncode is None:
+                    proc.kill()
+
+    async def run(self) -> None:
+        from bot.utils.db import init_db, close_pool
+
+        drain.install_signal_handlers(on_repeat=asyncio.current_task().cancel)
+        # Схему и миграции применяем один раз, до старта воркеров
+        await init_db()
+        await close_pool()
+
+        bot = Bot(token=settings.bot_token)
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        loop = asyncio.get_running_loop()
+        tasks: List[asyncio.Task] = []
+        stop_timeout = settings.drain_timeout_seconds + STOP_GRACE
+        try:
+            for worker in self.workers:
+                await self._spawn(worker)
+                tasks.append(asyncio.create_task(self._watch(worker), name=f"watch:{worker.index}"))
+                tasks.append(asyncio.create_task(self._forward(worker), name=f"forward:{worker.index}"))
+            logger.info(f"🚀 Супервизор: {self.count} воркеров, приём обновлений — {settings.bot_mode}")
+            intake = self._serve_webhook(bot) if settings.bot_mode == "webhook" else self._poll(bot)
+            intake_task = asyncio.create_task(intake, name="intake")
+            tasks.append(intake_task)
+            drain_wait = asyncio.create_task(drain.wait_requested(), name="drain_wait")
+            tasks.append(drain_wait)
+            await asyncio.wait({intake_task, drain_wait}, return_when=asyncio.FIRST_COMPLETED)
+            if intake_task.done():
+                intake_task.result()
+            else:
+                self._stopping = True
+                deadline = loop.time() + settings.drain_timeout_seconds
+                if settings.bot_mode != "webhook":
+                    intake_task.cancel()
+                    await asyncio.gather(intake_task, return_exceptions=True)
+                    await confirm_updates(bot, self._last_update_id)
+                await self._flush(deadline)
+                stop_timeout = max(0.0, deadline - loop.time()) + STOP_GRACE
+        finally:
+            await self._stop_workers(stop_timeout)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._session.close()
+            await bot.session.close()
+
+
+async def run_supervisor(count: int) -> None:
+    await Supervisor(count).run()
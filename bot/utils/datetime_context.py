@@ -1,11 +1,14 @@
 """Утилиты для обработки времени и контекста сообщений."""
-from datetime import datetime, timezone
-import pytz
+from datetime import datetime, timezone, tzinfo
 from typing import Optional
+
+from bot.startup import lazy_module
 from .db import get_conn, get_user_timezone
 
+pytz = lazy_module("pytz")
+
 
-def _safe_get_tz(tz_name: Optional[str]) -> pytz.timezone:
+def _safe_get_tz(tz_name: Optional[str]) -> tzinfo:
     try:
         return pytz.timezone(tz_name or 'Europe/Moscow')
     except Exception:
@@ -5,7 +5,10 @@ from contextlib import asynccontextmanager
 import logging
 from aiogram.types import User
 import asyncio
-import pytz
+
+from bot.startup import lazy_module
+
+pytz = lazy_module("pytz")
 _schema_applied = False
 _schema_lock = asyncio.Lock()
 
@@ -18,6 +21,21 @@ _connection_pool = []
 _pool_lock = asyncio.Lock()
 MAX_POOL_SIZE = 5
 
+# Профили уже поприветствованных пользователей: сообщение от них с тем же именем
+# не требует обращения к БД (см. save_user)
+_known_users: dict[int, tuple] = {}
+KNOWN_USERS_LIMIT = 10000
+
+
+async def _connect():
+    db = await aiosqlite.connect(DB_PATH)
+    # Настройки производительности
+    await db.execute("PRAGMA journal_mode=WAL")
+    await db.execute("PRAGMA synchronous=NORMAL")
+    await db.execute("PRAGMA cache_size=10000")
+    await db.execute("PRAGMA temp_store=MEMORY")
+    return db
+
 
 @asynccontextmanager
 async def get_conn():
@@ -26,12 +44,7 @@ async def get_conn():
         if _connection_pool:
             db = _connection_pool.pop()
         else:
-            db = await aiosqlite.connect(DB_PATH)
-            # Настройки производительности
-            await db.execute("PRAGMA journal_mode=WAL")
-            await db.execute("PRAGMA synchronous=NORMAL")
-            await db.execute("PRAGMA cache_size=10000")
-            await db.execute("PRAGMA temp_store=MEMORY")
+            db = await _connect()
 
     try:
         yield db
@@ -59,7 +72,7 @@ async def _ensure_users_timezone_column():
 
 
 async def _ensure_reminders_columns():
-    """Гарантирует наличие новых столбцов/индексов в reminders для цепочек и идемпотентности."""
+    """Гарантирует наличие новых столбцов/индексов в reminders для цепочек, идемпотентности и предгенерации."""
     async with get_conn() as db:
         try:
             cur = await db.execute("PRAGMA table_info(reminders)")
@@ -74,6 +87,12 @@ async def _ensure_reminders_columns():
                 to_add.append(("idempotency_key", "TEXT"))
             if "meta_json" not in col_names:
                 to_add.append(("meta_json", "TEXT"))
+            if "pregen_text" not in col_names:
+                to_add.append(("pregen_text", "TEXT"))
+            if "pregen_at" not in col_names:
+                to_add.append(("pregen_at", "DATETIME"))
+            if "pregen_picked_at" not in col_names:
+                to_add.append(("pregen_picked_at", "DATETIME"))
             for name, typ in to_add:
                 try:
                     await db.execute(f"ALTER TABLE reminders ADD COLUMN {name} {typ}")
@@ -89,7 +108,11 @@ async def _ensure_reminders_columns():
             except Exception:
                 pass
             try:
-                await db.execute("CREATE INDEX IF NOT EXISTS idx_reminders_chat ON reminders(chat_id)")
+                # Постраничный /reminders; префикс chat_id заменяет прежний idx_reminders_chat
+                await db.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_reminders_list ON reminders(chat_id, user_id, status, due_at)"
+                )
+                await db.execute("DROP INDEX IF EXISTS idx_reminders_chat")
             except Exception:
                 pass
             # Индекс идемпотентности (создаём только если есть столбец)
@@ -122,7 +145,10 @@ async def _ensure_self_calls_table():
                     picked_at       DATETIME,
                     fired_at        DATETIME,
                     executed_at     DATETIME,
-                    created_at      DATETIME DEFAULT CURRENT_TIMESTAMP
+                    created_at      DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    attempts        INTEGER DEFAULT 0,
+                    last_error      TEXT,
+                    retry_at        DATETIME
                 )
                 """
             )
@@ -133,6 +159,43 @@ async def _ensure_self_calls_table():
             logger.debug(f"ensure self_calls table: {e}")
 
 
+async def _ensure_job_retry_columns():
+    """Гарантирует столбцы повторов (attempts, last_error, retry_at) в таблицах фоновых задач."""
+    async with get_conn() as db:
+        for table in ("reminders", "self_calls"):
+            try:
+                cur = await db.execute(f"PRAGMA table_info({table})")
+                col_names = {c[1] for c in await cur.fetchall()}
+                for name, typ in (("attempts", "INTEGER DEFAULT 0"), ("last_error", "TEXT"), ("retry_at", "DATETIME")):
+                    if name not in col_names:
+                        try:
+                            await db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {typ}")
+                        except Exception as e:
+                            logger.debug(f"alter {table} add {name}: {e}")
+                await db.commit()
+            except Exception as e:
+                logger.debug(f"ensure {table} retry columns: {e}")
+
+
+async def _ensure_openai_files_hash_columns():
+    """Гарантирует столбцы sha256/size и индекс по содержимому в openai_files (дедупликация загрузок)."""
+    async with get_conn() as db:
+        try:
+            cur = await db.execute("PRAGMA table_info(openai_files)")
+            col_names = {c[1] for c in await cur.fetchall()}
+            for name, typ in (("sha256", "TEXT"), ("size", "INTEGER")):
+                if name not in col_names:
+                    try:
+                        await db.execute(f"ALTER TABLE openai_files ADD COLUMN {name} {typ}")
+                    except Exception as e:
+                        logger.debug(f"alter openai_files add {name}: {e}")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_openai_files_sha ON openai_files(sha256, size)")
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_openai_files_file_id ON openai_files(file_id)")
+            await db.commit()
+        except Exception as e:
+            logger.debug(f"ensure openai_files hash columns: {e}")
+
+
 async def init_db():
     """Применяет schema.sql ровно один раз, потокобезопасно."""
     global _schema_applied
@@ -153,6 +216,8 @@ async def init_db():
             await _ensure_users_timezone_column()
             await _ensure_reminders_columns()
             await _ensure_self_calls_table()
+            await _ensure_job_retry_columns()
+            await _ensure_openai_files_hash_columns()
             _schema_applied = True
             logger.debug("↪️  Schema applied")
         except Exception as e:
@@ -160,8 +225,17 @@ async def init_db():
             raise
 
 
+def _remember_user(user_id: int, profile: tuple) -> None:
+    if len(_known_users) >= KNOWN_USERS_LIMIT:
+        _known_users.pop(next(iter(_known_users)))
+    _known_users[user_id] = profile
+
+
 async def save_user(user: User) -> bool:
     """Сохраняет информацию о пользователе. Возвращает True, если пользователь новый."""
+    profile = (user.username, user.first_name, user.last_name)
+    if _known_users.get(user.id) == profile:
+        return False  # уже поприветствован, имя не менялось
     async with get_conn() as db:
         # Проверяем, есть ли уже пользователь
         cur = await db.execute(
@@ -187,6 +261,8 @@ async def save_user(user: User) -> bool:
                 (user.username, user.first_name, user.last_name, user.id),
             )
             await db.commit()
+            if existing[0]:
+                _remember_user(user.id, profile)
             return not existing[0]  # Возвращаем True, если еще не приветствовали
 
 
@@ -223,35 +299,158 @@ async def get_user_display_name(user_id: int) -> str:
             return str(user_id)
 
 
-async def save_openai_file_id(chat_id: int, file_id: str):
-    """Сохраняет file_id загруженного в OpenAI файла для чата."""
+async def save_openai_file_id(chat_id: int, file_id: str, sha256: str | None = None, size: int | None = None):
+    """Сохраняет file_id загруженного в OpenAI файла для чата (одна ссылка на пару чат/файл).
+
+    Для уже существующей ссылки обновляет `uploaded` — это время последнего использования.
+    """
     async with get_conn() as db:
-        await db.execute(
-            "INSERT INTO openai_files (chat_id, file_id) VALUES (?, ?)",
+        cur = await db.execute(
+            "SELECT 1 FROM openai_files WHERE chat_id = ? AND file_id = ?",
             (chat_id, file_id),
         )
+        if await cur.fetchone():
+            # Повторное использование продлевает жизнь ссылки (срок OPENAI_FILE_TTL считается от него)
+            await db.execute(
+                "UPDATE openai_files SET uploaded = CURRENT_TIMESTAMP WHERE chat_id = ? AND file_id = ?",
+                (chat_id, file_id),
+            )
+            await db.commit()
+            return
+        await db.execute(
+            "INSERT INTO openai_files (chat_id, file_id, sha256, size) VALUES (?, ?, ?, ?)",
+            (chat_id, file_id, sha256, size),
+        )
         await db.commit()
 
 
-async def get_openai_file_ids_by_chat(chat_id: int) -> list[str]:
-    """Возвращает список file_id для данного чата."""
+async def find_openai_file_by_hash(sha256: str, size: int) -> str | None:
+    """Ищет уже загруженный в OpenAI файл с тем же содержимым (sha256 + размер)."""
     async with get_conn() as db:
         cur = await db.execute(
-            "SELECT file_id FROM openai_files WHERE chat_id = ?",
-            (chat_id,),
+            "SELECT file_id FROM openai_files WHERE sha256 = ? AND size = ? ORDER BY uploaded DESC LIMIT 1",
+            (sha256, size),
         )
-        rows = await cur.fetchall()
-        return [row[0] for row in rows]
+        row = await cur.fetchone()
+        return row[0] if row else None
+
+
+async def count_openai_file_refs(file_id: str, exclude_chat_id: int | None = None) -> int:
+    """Сколько чатов ссылаются на file_id (без учёта exclude_chat_id)."""
+    async with get_conn() as db:
+        if exclude_chat_id is None:
+            cur = await db.execute("SELECT COUNT(*) FROM openai_files WHERE file_id = ?", (file_id,))
+        else:
+            cur = await db.execute(
+                "SELECT COUNT(*) FROM openai_files WHERE file_id = ? AND chat_id != ?",
+                (file_id, exclude_chat_id),
+            )
+        row = await cur.fetchone()
+        return int(row[0]) if row else 0
 
 
-async def delete_openai_file_ids_by_chat(chat_id: int):
-    """Удаляет все file_id для данного чата из таблицы openai_files."""
+async def delete_openai_file_refs(file_id: str):
+    """Удаляет все ссылки на file_id (файл больше не существует в OpenAI)."""
+    async with get_conn() as db:
+        await db.execute("DELETE FROM openai_files WHERE file_id = ?", (file_id,))
+        await db.commit()
+
+
+async def claim_openai_file_hash(sha256: str, owner: str, stale_seconds: int) -> bool:
+    """Пытается захватить содержимое sha256 для owner; True — захват получен.
+
+    Захват старше stale_seconds считается брошенным (процесс упал) и снимается.
+    """
     async with get_conn() as db:
         await db.execute(
-            "DELETE FROM openai_files WHERE chat_id = ?",
-            (chat_id,),
+            "DELETE FROM openai_file_claims WHERE sha256 = ? AND claimed_at < DATETIME('now', ?)",
+            (sha256, f"-{int(stale_seconds)} seconds"),
+        )
+        cur = await db.execute(
+            "INSERT OR IGNORE INTO openai_file_claims (sha256, owner) VALUES (?, ?)",
+            (sha256, owner),
+        )
+        claimed = cur.rowcount == 1
+        await db.commit()
+    return claimed
+
+
+async def release_openai_file_hash(sha256: str, owner: str):
+    """Снимает захват содержимого, если он всё ещё принадлежит owner."""
+    async with get_conn() as db:
+        await db.execute("DELETE FROM openai_file_claims WHERE sha256 = ? AND owner = ?", (sha256, owner))
+        await db.commit()
+
+
+async def release_openai_files(chat_id: int | None = None, older_than_seconds: int | None = None) -> int:
+    """Снимает ссылки на файлы OpenAI и ставит осиротевшие файлы в очередь удаления.
+
+    chat_id — все ссылки чата (/reset); older_than_seconds — ссылки, не использовавшиеся
+    дольше срока. Файл попадает в `openai_file_deletions`, только если на него больше
+    никто не ссылается и он ещё не в очереди. Само удаление в OpenAI выполняет фоновая
+    задача. Возвращает число поставленных в очередь файлов.
+    """
+    where, params = [], []
+    if chat_id is not None:
+        where.append("chat_id = ?")
+        params.append(chat_id)
+    if older_than_seconds is not None:
+        where.append("uploaded < DATETIME('now', ?)")
+        params.append(f"-{int(older_than_seconds)} seconds")
+    if not where:
+        raise ValueError("release_openai_files: нужен chat_id или older_than_seconds")
+    cond = " AND ".join(where)
+    async with get_conn() as db:
+        rows = await (await db.execute(
+            f"SELECT id, chat_id, file_id, sha256 FROM openai_files WHERE {cond}", params
+        )).fetchall()
+        if not rows:
+            return 0
+        await db.executemany("DELETE FROM openai_files WHERE id = ?", [(r[0],) for r in rows])
+        before = db.total_changes
+        await db.executemany(
+            """
+            INSERT INTO openai_file_deletions(chat_id, file_id, sha256, due_at)
+            SELECT ?, ?, ?, CURRENT_TIMESTAMP
+             WHERE NOT EXISTS (SELECT 1 FROM openai_files WHERE file_id = ?)
+               AND NOT EXISTS (SELECT 1 FROM openai_file_deletions WHERE file_id = ? AND status = 'scheduled')
+            """,
+            [(r[1], r[2], r[3], r[2], r[2]) for r in {r[2]: r for r in rows}.values()],
         )
+        queued = db.total_changes - before
         await db.commit()
+    return queued
+
+
+async def insert_reminders_bulk(rows: list[tuple]) -> dict[str, int]:
+    """Вставляет пачку напоминаний одной транзакцией.
+
+    rows: (chat_id, user_id, text, due_at, silent, meta_json, idempotency_key).
+    Строки с уже существующим idempotency_key пропускаются, поэтому повтор того же
+    вызова не создаёт дублей. Возвращает {idempotency_key: id} для всех строк, включая
+    ранее созданные.
+    """
+    if not rows:
+        return {}
+    keys = [r[6] for r in rows]
+    ids: dict[str, int] = {}
+    async with get_conn() as db:
+        await db.executemany(
+            """INSERT OR IGNORE INTO reminders(chat_id, user_id, text, due_at, silent, status, meta_json, idempotency_key)
+               VALUES (?, ?, ?, ?, ?, 'scheduled', ?, ?)""",
+            rows,
+        )
+        # SQLite ограничивает число параметров — читаем id порциями
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cur = await db.execute(
+                f"SELECT idempotency_key, id FROM reminders WHERE idempotency_key IN ({placeholders})",
+                chunk,
+            )
+            ids.update({k: rid for k, rid in await cur.fetchall()})
+        await db.commit()
+    return ids
 
 
 async def get_user_timezone(user_id: int) -> str:
@@ -296,6 +495,33 @@ async def set_user_timezone(user_id: int, tz_name: str) -> bool:
     return True
 
 
+async def warm_pool() -> int:
+    """Заранее открывает соединения пула (до MAX_POOL_SIZE); возвращает их число."""
+    async with _pool_lock:
+        missing = MAX_POOL_SIZE - len(_connection_pool)
+        if missing > 0:
+            _connection_pool.extend(await asyncio.gather(*(_connect() for _ in range(missing))))
+        return len(_connection_pool)
+
+
+async def prime_user_cache(limit: int) -> int:
+    """Загружает в кэш профили недавно активных поприветствованных пользователей."""
+    async with get_conn() as db:
+        cur = await db.execute(
+            """SELECT u.user_id, u.username, u.first_name, u.last_name
+               FROM users u
+               JOIN (SELECT user_id, MAX(id) AS last_id FROM usage
+                     WHERE user_id IS NOT NULL GROUP BY user_id) a ON a.user_id = u.user_id
+               WHERE u.is_welcomed
+               ORDER BY a.last_id DESC LIMIT ?""",
+            (limit,),
+        )
+        rows = await cur.fetchall()
+    for user_id, username, first_name, last_name in reversed(rows):
+        _remember_user(user_id, (username, first_name, last_name))
+    return len(rows)
+
+
 async def close_pool():
     """Закрывает все соединения в пуле (вызывать при завершении приложения)."""
     async with _pool_lock:
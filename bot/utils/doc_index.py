@@ -0,0 +1,222 @@
+"""Поисковый индекс по документам чата (DOCUMENT_MODE=index).
+
+Текст PDF режется на фрагменты, для каждого фрагмента в SQLite сохраняется
+инвертированный индекс (терм → фрагмент, частота). На каждый вопрос в модель
+уходят только top-k фрагментов по BM25, а не весь документ через цепочку
+previous_response_id — входные токены перестают расти с длиной документа.
+
+Стемминг грубый: слово обрезается до STEM_LEN символов. Для русских словоформ
+этого хватает, чтобы «договора»/«договору» совпадали, а лемматизатор не нужен.
+"""
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from bot.config import settings
+from bot.utils.db import get_conn
+from bot.utils.log import logger
+
+CHUNK_CHARS = 1500
+CHUNK_OVERLAP = 200
+STEM_LEN = 6
+MAX_QUERY_TERMS = 32
+BM25_K1 = 1.2
+BM25_B = 0.75
+MIN_SCORE_RATIO = 0.3  # фрагменты слабее этой доли лучшего в контекст не берём
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне было вот от "
+    "меня еще нет о из ему теперь когда даже ну вдруг ли если уже или ни быть был него до вас нибудь опять уж "
+    "вам ведь там потом себя ничего ей может они тут где есть надо ней для мы тебя их чем была сам чтоб без "
+    "будто чего раз тоже себе под будет ж тогда кто этот того потому этого какой совсем ним здесь этом один "
+    "почти мой тем чтобы нее сейчас были куда зачем всех никогда можно при наконец два об другой хоть после "
+    "над больше тот через эти нас про всего них какая много разве три эту моя впрочем хорошо свою этой перед "
+    "иногда лучше чуть том нельзя такой им более всегда конечно всю между это документ документе документа "
+    "the a an and or of to in on for is are was were be by with as at from that this it its not no but "
+    "what which who how do does did can could should would about into than then there their they them".split()
+)
+
+
+@dataclass
+class DocChunk:
+    file_name: str
+    page: int
+    text: str
+    score: float = 0.0
+
+
+def tokenize(text: str) -> List[str]:
+    """Термы для индекса и запроса: нижний регистр, без стоп-слов, с обрезкой до STEM_LEN."""
+    terms = []
+    for word in _WORD_RE.findall(text.lower()):
+        if len(word) < 2 or word in _STOPWORDS:
+            continue
+        terms.append(word[:STEM_LEN])
+    return terms
+
+
+def chunk_pages(pages: Sequence[str]) -> List[Tuple[int, str]]:
+    """Режет постраничный текст на фрагменты ~CHUNK_CHARS с перекрытием; [(номер страницы, текст)]."""
+    chunks: List[Tuple[int, str]] = []
+    for page_no, raw in enumerate(pages, start=1):
+        text = re.sub(r"[ \t]+", " ", raw or "").strip()
+        pos = 0
+        while pos < len(text):
+            end = min(len(text), pos + CHUNK_CHARS)
+            if end < len(text):
+                # Стараемся резать по концу абзаца или предложения
+                cut = max(text.rfind("\n", pos + CHUNK_CHARS // 2, end), text.rfind(". ", pos + CHUNK_CHARS // 2, end))
+                if cut > pos:
+                    end = cut + 1
+            piece = text[pos:end].strip()
+            if piece:
+                chunks.append((page_no, piece))
+            if end >= len(text):
+                break
+            pos = max(pos + 1, end - CHUNK_OVERLAP)
+    return chunks
+
+
+async def index_document(chat_id: int, file_name: str, sha256: str, pages: Sequence[str]) -> int:
+    """Индексирует документ для чата (повторная загрузка того же файла переиндексирует его).
+
+    Возвращает число фрагментов. Всё пишется одной транзакцией.
+    """
+    chunks = chunk_pages(pages)
+    async with get_conn() as db:
+        await _delete_document(db, chat_id, sha256)
+        term_rows: List[Tuple[int, str, int, int]] = []
+        for seq, (page_no, text) in enumerate(chunks):
+            terms = Counter(tokenize(text))
+            cur = await db.execute(
+                "INSERT INTO doc_chunks(chat_id, doc_sha256, file_name, seq, page, length, text) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (chat_id, sha256, file_name, seq, page_no, sum(terms.values()), text),
+            )
+            chunk_id = cur.lastrowid
+            term_rows.extend((chat_id, term, chunk_id, tf) for term, tf in terms.items())
+        await db.executemany(
+            "INSERT OR REPLACE INTO doc_terms(chat_id, term, chunk_id, tf) VALUES (?, ?, ?, ?)", term_rows
+        )
+        await db.commit()
+    logger.info(f"doc_index: {file_name} для chat_id={chat_id}: {len(pages)} стр., {len(chunks)} фрагм., {len(term_rows)} термов")
+    return len(chunks)
+
+
+async def _delete_document(db, chat_id: int, sha256: str) -> None:
+    await db.execute(
+        "DELETE FROM doc_terms WHERE chat_id = ? AND chunk_id IN "
+        "(SELECT id FROM doc_chunks WHERE chat_id = ? AND doc_sha256 = ?)",
+        (chat_id, chat_id, sha256),
+    )
+    await db.execute("DELETE FROM doc_chunks WHERE chat_id = ? AND doc_sha256 = ?", (chat_id, sha256))
+
+
+async def clear_chat(chat_id: int) -> None:
+    """Удаляет индекс всех документов чата."""
+    async with get_conn() as db:
+        await db.execute("DELETE FROM doc_terms WHERE chat_id = ?", (chat_id,))
+        await db.execute("DELETE FROM doc_chunks WHERE chat_id = ?", (chat_id,))
+        await db.commit()
+
+
+async def count_chunks(chat_id: int, sha256: str) -> int:
+    """Сколько фрагментов документа уже проиндексировано в чате (0 — не проиндексирован)."""
+    async with get_conn() as db:
+        row = await (await db.execute(
+            "SELECT COUNT(*) FROM doc_chunks WHERE chat_id = ? AND doc_sha256 = ?", (chat_id, sha256)
+        )).fetchone()
+    return int(row[0]) if row else 0
+
+
+async def has_documents(chat_id: int) -> bool:
+    async with get_conn() as db:
+        row = await (await db.execute("SELECT 1 FROM doc_chunks WHERE chat_id = ? LIMIT 1", (chat_id,))).fetchone()
+    return row is not None
+
+
+async def search(chat_id: int, query: str, k: Optional[int] = None) -> List[DocChunk]:
+    """Top-k фрагментов документов чата по BM25."""
+    k = k or settings.document_top_k
+    q_terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not q_terms:
+        return []
+    placeholders = ",".join("?" * len(q_terms))
+    async with get_conn() as db:
+        n_docs, avgdl = await (await db.execute(
+            "SELECT COUNT(*), AVG(length) FROM doc_chunks WHERE chat_id = ?", (chat_id,)
+        )).fetchone()
+        if not n_docs:
+            return []
+        postings = await (await db.execute(
+            f"SELECT term, chunk_id, tf FROM doc_terms WHERE chat_id = ? AND term IN ({placeholders})",
+            (chat_id, *q_terms),
+        )).fetchall()
+        if not postings:
+            return []
+        df = Counter(term for term, _, _ in postings)
+        candidate_ids = list({chunk_id for _, chunk_id, _ in postings})
+        lengths: Dict[int, int] = {}
+        for i in range(0, len(candidate_ids), 500):
+            part = candidate_ids[i:i + 500]
+            rows = await (await db.execute(
+                f"SELECT id, length FROM doc_chunks WHERE id IN ({','.join('?' * len(part))})", part
+            )).fetchall()
+            lengths.update(rows)
+
+        avgdl = avgdl or 1.0
+        scores: Dict[int, float] = {}
+        for term, chunk_id, tf in postings:
+            idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+            norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * lengths.get(chunk_id, avgdl) / avgdl))
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * norm
+        top = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+        rows = await (await db.execute(
+            f"SELECT id, file_name, page, text FROM doc_chunks WHERE id IN ({','.join('?' * len(top))})",
+            [cid for cid, _ in top],
+        )).fetchall()
+    by_id = {r[0]: r for r in rows}
+    return [DocChunk(by_id[cid][1], by_id[cid][2], by_id[cid][3], score) for cid, score in top if cid in by_id]
+
+
+async def overview(chat_id: int, sha256: str, k: Optional[int] = None) -> List[DocChunk]:
+    """Фрагменты для общего вопроса «что в документе»: начало и равномерная выборка по тексту."""
+    k = k or settings.document_top_k
+    async with get_conn() as db:
+        rows = await (await db.execute(
+            "SELECT file_name, page, text FROM doc_chunks WHERE chat_id = ? AND doc_sha256 = ? ORDER BY seq",
+            (chat_id, sha256),
+        )).fetchall()
+    if len(rows) > k:
+        step = len(rows) / k
+        rows = [rows[int(i * step)] for i in range(k)]
+    return [DocChunk(r[0], r[1], r[2]) for r in rows]
+
+
+def format_context(chunks: Sequence[DocChunk]) -> str:
+    """Текстовый блок с фрагментами для запроса к модели."""
+    parts = [f"[{c.file_name}, стр. {c.page}]\n{c.text}" for c in chunks]
+    return (
+        "Фрагменты из документов пользователя (отвечай по ним и указывай страницы; "
+        "если ответа в них нет — так и скажи):\n\n" + "\n\n---\n\n".join(parts)
+    )
+
+
+async def context_message(chat_id: int, query: str) -> Optional[dict]:
+    """Сообщение с релевантными фрагментами для обычного вопроса в чате, если есть индекс."""
+    if settings.document_mode != "index" or not query:
+        return None
+    try:
+        chunks = await search(chat_id, query)
+    except Exception as e:
+        logger.warning(f"doc_index: поиск не удался для chat_id={chat_id}: {e}")
+        return None
+    chunks = [c for c in chunks if c.score >= chunks[0].score * MIN_SCORE_RATIO] if chunks else []
+    if not chunks:
+        return None
+    return {"type": "message", "role": "user", "content": [{"type": "input_text", "text": format_context(chunks)}]}
@@ -0,0 +1,190 @@
+"""Map-reduce анализ больших PDF.
+
+Документ режется на диапазоны страниц под контекст текущей модели; каждая часть
+анализируется отдельным запросом без цепочки диалога (параллельно, под глобальным
+лимитом OpenAI), затем частичные конспекты сводятся в итоговый ответ. Время ответа
+ограничено самой медленной частью, а не одним гигантским запросом.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+from aiogram import Bot
+
+from bot.config import settings
+from bot.utils.log import logger
+from bot.utils.openai.chat import ChatManager
+from bot.utils.openai.models import ModelsManager
+from bot.utils.outbound import Priority, outbound_priority
+
+CHARS_PER_TOKEN = 3          # консервативно для смеси кириллицы и латиницы
+PART_CONTEXT_SHARE = 8       # часть занимает не больше 1/8 контекста модели…
+PART_MIN_TOKENS = 8_000
+PART_MAX_TOKENS = 50_000     # …и не больше этого, чтобы одна часть не стала узким местом
+MAX_PARTS = 24
+PROGRESS_MIN_INTERVAL = 2.0  # правки сообщения о прогрессе не чаще, секунд
+
+MAP_INSTRUCTIONS = (
+    "Ты анализируешь часть большого документа. Составь плотный конспект этой части: "
+    "ключевые факты, цифры, даты, определения, выводы — с указанием страниц. "
+    "Учитывай вопрос пользователя: всё, что к нему относится, передай подробно. "
+    "Не добавляй вступлений и ничего, чего нет в тексте."
+)
+REDUCE_INSTRUCTIONS = (
+    "Ниже конспекты частей одного документа по порядку. Объедини их в один конспект "
+    "без повторов, сохрани факты, цифры и номера страниц."
+)
+
+
+@dataclass
+class DocPart:
+    first_page: int
+    last_page: int
+    text: str
+
+    @property
+    def label(self) -> str:
+        if self.first_page == self.last_page:
+            return f"стр. {self.first_page}"
+        return f"стр. {self.first_page}–{self.last_page}"
+
+
+def part_char_budget(model: str, total_chars: int) -> int:
+    """Размер части в символах под контекст модели (и не больше MAX_PARTS частей)."""
+    context = ModelsManager.get_context_tokens(model)
+    tokens = max(PART_MIN_TOKENS, min(PART_MAX_TOKENS, context // PART_CONTEXT_SHARE))
+    budget = tokens * CHARS_PER_TOKEN
+    # Слишком много частей — укрупняем, но не больше половины контекста
+    if total_chars > budget * MAX_PARTS:
+        budget = min(-(-total_chars // MAX_PARTS), context // 2 * CHARS_PER_TOKEN)
+    return budget
+
+
+def split_by_pages(pages: Sequence[str], budget_chars: int) -> List[DocPart]:
+    """Жадно собирает подряд идущие страницы в части не больше budget_chars."""
+    parts: List[DocPart] = []
+    buf: List[str] = []
+    size = 0
+    first = 1
+    for page_no, text in enumerate(pages, start=1):
+        text = (text or "").strip()
+        block = f"[стр. {page_no}]\n{text}\n"
+        if buf and size + len(block) > budget_chars:
+            parts.append(DocPart(first, page_no - 1, "\n".join(buf)))
+            buf, size, first = [], 0, page_no
+        # Одна огромная страница обрезается до размера части
+        buf.append(block[:budget_chars])
+        size += min(len(block), budget_chars)
+    if buf:
+        parts.append(DocPart(first, len(pages), "\n".join(buf)))
+    return parts
+
+
+class _PartsProgress:
+    """Сообщение «готово N из M частей», правки не чаще PROGRESS_MIN_INTERVAL."""
+
+    def __init__(self, bot: Bot, chat_id: int, file_name: str, total: int):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.file_name = file_name
+        self.total = total
+        self.done = 0
+        self.message_id: Optional[int] = None
+        self._last_edit = 0.0
+
+    def _text(self) -> str:
+        return f"🔍 Анализирую {self.file_name}: готово частей {self.done} из {self.total}"
+
+    async def start(self) -> None:
+        try:
+            with outbound_priority(Priority.PROGRESS):
+                msg = await self.bot.send_message(self.chat_id, self._text())
+            self.message_id = msg.message_id
+            self._last_edit = time.monotonic()
+        except Exception as e:
+            logger.debug(f"mapreduce progress start: {e}")
+
+    async def part_done(self) -> None:
+        self.done += 1
+        now = time.monotonic()
+        if self.message_id is None or (now - self._last_edit < PROGRESS_MIN_INTERVAL and self.done < self.total):
+            return
+        self._last_edit = now
+        text = self._text() if self.done < self.total else f"🧩 Свожу результаты {self.total} частей…"
+        try:
+            with outbound_priority(Priority.PROGRESS):
+                await self.bot.edit_message_text(text=text, chat_id=self.chat_id, message_id=self.message_id)
+        except Exception as e:
+            logger.debug(f"mapreduce progress edit: {e}")
+
+    async def close(self) -> None:
+        if self.message_id is None:
+            return
+        try:
+            await self.bot.delete_message(chat_id=self.chat_id, message_id=self.message_id)
+        except Exception:
+            pass
+
+
+async def summarize_parts(bot: Bot, chat_id: int, user_id: int, file_name: str,
+                          pages: Sequence[str], question: str) -> str:
+    """Map-этап (+ промежуточные reduce): возвращает сводный конспект документа.
+
+    Итоговый ответ на вопрос пользователя формирует вызывающий обычным запросом в
+    цепочке диалога, чтобы дальнейшие вопросы могли опираться на результат.
+    """
+    model = await ModelsManager.get_current_model()
+    budget = part_char_budget(model, sum(len(p or "") for p in pages))
+    parts = split_by_pages(pages, budget)
+    logger.info(f"mapreduce: {file_name} chat_id={chat_id}: {len(pages)} стр. → {len(parts)} частей по ≤{budget} симв.")
+
+    progress = _PartsProgress(bot, chat_id, file_name, len(parts))
+    await progress.start()
+    lane = asyncio.Semaphore(max(1, settings.document_map_concurrency))
+
+    async def _map(part: DocPart) -> str:
+        async with lane:
+            try:
+                summary = await ChatManager.complete_stateless(
+                    chat_id, user_id, MAP_INSTRUCTIONS,
+                    f"Вопрос пользователя: {question}\n\nФайл: {file_name}, {part.label}\n\n{part.text}",
+                    model=model,
+                )
+            except Exception as e:
+                logger.warning(f"mapreduce: часть {part.label} не обработана: {e}")
+                summary = ""
+        await progress.part_done()
+        return f"### {part.label}\n{summary.strip() or '(часть не удалось обработать)'}"
+
+    async def _reduce(group: List[str]) -> str:
+        text = "\n\n".join(group)
+        async with lane:
+            try:
+                merged = await ChatManager.complete_stateless(chat_id, user_id, REDUCE_INSTRUCTIONS, text, model=model)
+            except Exception as e:
+                logger.warning(f"mapreduce: сводка {len(group)} частей не получена, оставляем их как есть: {e}")
+                merged = ""
+        # Без сводки группа остаётся склеенной: уже полученные конспекты частей не теряются
+        return merged.strip() or text
+
+    try:
+        summaries = list(await asyncio.gather(*(_map(p) for p in parts)))
+        # Сводка не помещается в одну часть — сворачиваем группами, пока не поместится
+        while len(summaries) > 1 and sum(len(s) for s in summaries) > budget:
+            groups: List[List[str]] = [[]]
+            size = 0
+            for s in summaries:
+                if groups[-1] and size + len(s) > budget:
+                    groups.append([])
+                    size = 0
+                groups[-1].append(s)
+                size += len(s)
+            if len(groups) == len(summaries):
+                break  # каждая сводка сама по себе больше части — дальше не сжать
+            summaries = list(await asyncio.gather(*(_reduce(g) for g in groups)))
+    finally:
+        await progress.close()
+    return "\n\n".join(summaries)
@@ -0,0 +1,131 @@
+"""Плавная остановка (drain) по SIGTERM/SIGINT и после /update.
+
+Вместо мгновенного выхода бот перестаёт принимать новые апдейты, даёт
+обрабатываемым запросам, альбомам и фоновым задачам завершиться за DRAIN_TIMEOUT,
+дописывает логи и только потом выходит. Так рестарт не обрывает напоминание между
+отправкой и отметкой в БД и не теряет ответ модели, а последняя пачка апдейтов
+не приходит повторно новому процессу.
+
+Модули, у которых есть отложенная работа вне хендлеров (очередь вебхука, таймеры
+альбомов), сообщают её объём через `register_backlog()`.
+"""
+import asyncio
+import os
+import signal
+import time
+from typing import Callable, List, Optional, Set
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from bot.utils.log import logger
+
+POLL_SECONDS = 0.2
+
+_requested: Optional[asyncio.Event] = None
+_reason: Optional[str] = None
+_inflight: Set[asyncio.Task] = set()
+_backlogs: List[Callable[[], int]] = []
+_last_activity = 0.0
+last_update_id: Optional[int] = None
+
+
+def _event() -> asyncio.Event:
+    global _requested
+    if _requested is None:
+        _requested = asyncio.Event()
+    return _requested
+
+
+def is_draining() -> bool:
+    return _requested is not None and _requested.is_set()
+
+
+def request_drain(reason: str) -> None:
+    """Переводит процесс в режим остановки; повторный вызов ничего не меняет."""
+    global _reason
+    if is_draining():
+        return
+    _reason = reason
+    logger.info(f"⏳ Плавная остановка ({reason}): новые апдейты больше не принимаются")
+    _event().set()
+
+
+async def wait_requested() -> str:
+    await _event().wait()
+    return _reason or ""
+
+
+def install_signal_handlers(on_repeat: Optional[Callable[[], None]] = None) -> None:
+    """SIGTERM/SIGINT запускают drain; повторный SIGINT (Ctrl+C) вызывает `on_repeat`.
+
+    Повторный SIGTERM игнорируется: воркер шарда получает его и от systemd, и от
+    супервизора, а drain уже идёт.
+    """
+    loop = asyncio.get_running_loop()
+
+    def handle(name: str) -> None:
+        if not is_draining():
+            request_drain(name)
+        elif name == "SIGINT" and on_repeat is not None:
+            logger.warning("Повторный SIGINT — останавливаюсь без ожидания")
+            on_repeat()
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, handle, sig.name)
+        except (NotImplementedError, RuntimeError, AttributeError):
+            # Windows: обработчик цикла недоступен, сигнал передаём в цикл вручную
+            signal.signal(sig, lambda signum, frame, name=sig.name: loop.call_soon_threadsafe(handle, name))
+
+
+def request_restart(reason: str) -> None:
+    """Плавный перезапуск всего бота: процесс завершается после drain, systemd запускает его снова.
+
+    Воркер шарда передаёт запрос супервизору — останавливаться должны все процессы.
+    """
+    if int(os.getenv("GPTTG_SHARD_PORT", "0")) > 0:
+        logger.info(f"Перезапуск ({reason}): передаю запрос супервизору")
+        os.kill(os.getppid(), signal.SIGTERM)
+        return
+    request_drain(reason)
+
+
+def register_backlog(pending: Callable[[], int]) -> None:
+    """Регистрирует счётчик отложенной работы, которую drain должен дождаться."""
+    _backlogs.append(pending)
+
+
+def pending_work() -> int:
+    return len(_inflight) + sum(pending() for pending in _backlogs)
+
+
+async def wait_idle(deadline: float, quiet: float = 0.0) -> bool:
+    """Ждёт, пока не останется работы (и `quiet` секунд без новых апдейтов), не дольше deadline.
+
+    `deadline` — время по `loop.time()`. Возвращает False, если работа не успела завершиться.
+    """
+    loop = asyncio.get_running_loop()
+    while loop.time() < deadline:
+        if pending_work() == 0 and time.monotonic() - _last_activity >= quiet:
+            return True
+        await asyncio.sleep(POLL_SECONDS)
+    return pending_work() == 0
+
+
+class DrainMiddleware(BaseMiddleware):
+    """Outer-middleware апдейтов: учитывает обрабатываемые апдейты для drain."""
+
+    async def __call__(self, handler, event: TelegramObject, data):
+        global _last_activity, last_update_id
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        task = asyncio.current_task()
+        _inflight.add(task)
+        _last_activity = time.monotonic()
+        if last_update_id is None or event.update_id > last_update_id:
+            last_update_id = event.update_id
+        try:
+            return await handler(event, data)
+        finally:
+            _inflight.discard(task)
@@ -3,10 +3,12 @@ import traceback
 from typing import Optional, Any, Callable, Awaitable
 from functools import wraps
 from aiogram.types import Message, CallbackQuery
-import openai
 
+from bot.startup import lazy_module
 from bot.utils.log import logger
 
+openai = lazy_module("openai")
+
 
 class ErrorType:
     """Типы ошибок с пользовательскими сообщениями."""
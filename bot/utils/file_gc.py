@@ -0,0 +1,74 @@
+"""Фоновая уборка файлов OpenAI.
+
+Файлы, на которые не осталось ссылок (после /reset или по сроку OPENAI_FILE_TTL),
+попадают в очередь `openai_file_deletions` и удаляются в OpenAI задачей
+`openai_file_gc` общего планировщика: параллельно (OPENAI_FILE_GC_CONCURRENCY),
+с повторами по экспоненте и dead-letter (/deadjobs). Ход уборки виден админу в /status.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict
+
+from aiogram import Bot
+
+from bot.config import settings
+from bot.utils.db import get_conn, release_openai_files
+from bot.utils.jobs import JobKind, register_job_kind, register_periodic
+from bot.utils.log import logger
+from bot.utils.openai import FilesManager
+
+EXPIRE_INTERVAL_SECONDS = 3600  # как часто искать просроченные ссылки
+
+
+@dataclass
+class FileDeletion:
+    id: int
+    file_id: str
+    sha256: str | None
+    due_at: str
+
+
+async def _delete_one(bot: Bot, job: FileDeletion) -> None:
+    # Исключение — повтор с паузой движком задач, после JOBS_MAX_ATTEMPTS — dead-letter
+    if await FilesManager.delete_remote(job.file_id, job.sha256):
+        logger.info(f"[file_gc] удалён файл OpenAI {job.file_id}")
+    else:
+        logger.info(f"[file_gc] файл {job.file_id} снова используется — не удаляем")
+
+
+async def _expire_files(bot: Bot) -> None:
+    """Снимает ссылки, не использовавшиеся дольше OPENAI_FILE_TTL, и ставит файлы в очередь."""
+    queued = await release_openai_files(older_than_seconds=settings.openai_file_ttl_seconds)
+    if queued:
+        logger.info(f"[file_gc] просрочено и поставлено в очередь удаления: {queued}")
+
+
+async def get_gc_stats() -> Dict[str, int]:
+    """Состояние очереди удаления по статусам (для /status)."""
+    async with get_conn() as db:
+        rows = await (await db.execute(
+            "SELECT status, COUNT(*) FROM openai_file_deletions GROUP BY status"
+        )).fetchall()
+        tracked = await (await db.execute("SELECT COUNT(DISTINCT file_id) FROM openai_files")).fetchone()
+    stats = {status: int(cnt) for status, cnt in rows}
+    stats["tracked"] = int(tracked[0]) if tracked else 0
+    return stats
+
+
+FILE_GC_JOB = JobKind(
+    name="openai_file_gc",
+    table="openai_file_deletions",
+    columns=("id", "file_id", "sha256", "due_at"),
+    factory=lambda r: FileDeletion(id=r[0], file_id=r[1], sha256=r[2], due_at=r[3]),
+    handler=_delete_one,
+    concurrency=settings.openai_file_gc_concurrency,
+    shard_column="chat_id",
+)
+
+
+def register_file_gc_jobs() -> None:
+    """Регистрирует удаление файлов и периодическую проверку срока хранения."""
+    register_job_kind(FILE_GC_JOB)
+    if settings.openai_file_ttl_seconds > 0:
+        register_periodic("openai_files_expire", EXPIRE_INTERVAL_SECONDS, _expire_files)
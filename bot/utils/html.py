@@ -1,5 +1,7 @@
 """Утилиты для работы с HTML форматированием в Telegram."""
-from typing import List
+import re
+from typing import List, Optional, Tuple
+
 from aiogram.types import Message
 
 
@@ -13,6 +15,7 @@ def escape_html(text: str) -> str:
     Returns:
         str: Экранированный текст
     """
+    # Цепочка replace на C быстрее str.translate для кириллицы (см. scripts/bench_html.py)
     return (text
             .replace('&', '&amp;')
             .replace('<', '&lt;')
@@ -20,9 +23,319 @@ def escape_html(text: str) -> str:
             .replace('"', '&quot;'))
 
 
+# ——— Markdown модели → HTML Telegram ——————————————————————————————————————— #
+# Внутренние классы без вложенного разделителя: каждая попытка совпадения
+# упирается в ближайший разделитель, поэтому разбор строки линейный.
+_INLINE_RE = re.compile(
+    r"`([^`\n]+)`"
+    r"|\*\*([^*\n]+)\*\*"
+    r"|__([^_\n]+)__"
+    r"|~~([^~\n]+)~~"
+    r"|(?<![\w*])\*(?=\S)([^*\n]+?)(?<=\S)\*(?![\w*])"
+    r"|(?<![\w_])_(?=\S)([^_\n]+?)(?<=\S)_(?![\w_])"
+    r"|\[([^\]\n]+)\]\((https?://[^\s)]+)\)"
+)
+_INLINE_TAGS = {2: "b", 3: "b", 4: "s", 5: "i", 6: "i"}
+_HEADING_RE = re.compile(r"#{1,6}\s+(.*?)\s*#*\s*$")
+_BULLET_RE = re.compile(r"(\s*)[-*+]\s+(.*)")
+_RULE_RE = re.compile(r"\s*([-*_])(\s*\1){2,}\s*")
+MAX_LANG_LEN = 20  # язык блока кода — первое слово после ```
+
+
+def _render_inline(text: str) -> str:
+    """Строчная разметка: `код`, **жирный**, *курсив*, ~~зачёркнутый~~, [ссылка](url)."""
+    out = []
+    pos = 0
+    for m in _INLINE_RE.finditer(text):
+        out.append(escape_html(text[pos:m.start()]))
+        group = m.lastindex
+        if group == 1:
+            out.append(f"<code>{escape_html(m.group(1))}</code>")
+        elif group in _INLINE_TAGS:
+            tag = _INLINE_TAGS[group]
+            out.append(f"<{tag}>{_render_inline(m.group(group))}</{tag}>")
+        else:
+            out.append(f'<a href="{escape_html(m.group(8))}">{_render_inline(m.group(7))}</a>')
+        pos = m.end()
+    out.append(escape_html(text[pos:]))
+    return "".join(out)
+
+
+class MarkdownRenderer:
+    """Потоковый перевод Markdown-подмножества модели в HTML Telegram.
+
+    `feed()` принимает очередной кусок текста и возвращает HTML для всех завершённых
+    строк, `close()` — остаток и закрытие открытых блоков. Каждая строка разбирается
+    один раз, поэтому время линейно по длине ответа.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._first = True
+        self._fence: Optional[str] = None   # открытый блок ``` (открывающий тег)
+        self._fence_started = False
+        self._fence_blank = 0               # пустые строки в начале блока
+        self._quote = False
+
+    def _sep(self) -> str:
+        if self._first:
+            self._first = False
+            return ""
+        return "\n"
+
+    def _line(self, line: str) -> str:
+        stripped = line.strip()
+        out = []
+        if self._fence is not None:
+            if stripped.startswith("```"):
+                # Блок без содержимого не выводим: Telegram показал бы пустую рамку
+                if self._fence_started:
+                    out.append("</code></pre>")
+                self._fence = None
+                return "".join(out)
+            if self._fence_started:
+                return "\n" + escape_html(line)
+            if not stripped:
+                self._fence_blank += 1
+                return ""
+            self._fence_started = True
+            return self._sep() + self._fence + "\n" * self._fence_blank + escape_html(line)
+
+        is_quote = stripped.startswith(">")
+        if self._quote and not is_quote:
+            out.append("</blockquote>")
+            self._quote = False
+        if stripped.startswith("```"):
+            info = stripped[3:].split(maxsplit=1)
+            lang = re.sub(r"[^\w+-]", "", info[0])[:MAX_LANG_LEN] if info else ""
+            self._fence = f'<pre><code class="language-{lang}">' if lang else "<pre><code>"
+            self._fence_started = False
+            self._fence_blank = 0
+            return "".join(out)
+
+        sep = self._sep()
+        if is_quote:
+            body = stripped[1:].removeprefix(" ")
+            if not self._quote:
+                self._quote = True
+                return "".join(out) + sep + "<blockquote>" + _render_inline(body)
+            return "".join(out) + sep + _render_inline(body)
+        heading = _HEADING_RE.fullmatch(stripped) if stripped.startswith("#") else None
+        if heading:
+            return "".join(out) + sep + f"<b>{_render_inline(heading.group(1))}</b>"
+        if _RULE_RE.fullmatch(line):
+            return "".join(out) + sep + "——————"
+        bullet = _BULLET_RE.fullmatch(line)
+        if bullet:
+            return "".join(out) + sep + bullet.group(1) + "• " + _render_inline(bullet.group(2))
+        return "".join(out) + sep + _render_inline(line)
+
+    def feed(self, text: str) -> str:
+        self._buf += text
+        *lines, self._buf = self._buf.split("\n")
+        return "".join(self._line(line) for line in lines)
+
+    def close(self) -> str:
+        out = [self._line(self._buf)] if self._buf else []
+        self._buf = ""
+        if self._fence is not None:
+            if self._fence_started:
+                out.append("</code></pre>")
+            self._fence = None
+        if self._quote:
+            out.append("</blockquote>")
+            self._quote = False
+        return "".join(out)
+
+
+def render_markdown(text: str) -> str:
+    """HTML для Telegram из ответа модели: Markdown-разметка отображается, остальное экранируется."""
+    renderer = MarkdownRenderer()
+    return renderer.feed(text or "") + renderer.close()
+
+
+# ——— Разбиение HTML на сообщения ———————————————————————————————————————————— #
+_TOKEN_RE = re.compile(r"<[^<>]*>|\n|(?:[^<&\n]|&#?\w+;)+|[<&]")
+_ENTITY_RE = re.compile(r"&#?\w+;")
+_TAG_NAME_RE = re.compile(r"</?\s*([a-zA-Z0-9-]+)")
+
+
+def _is_tag(token: str) -> bool:
+    return token.startswith("<") and token.endswith(">") and len(token) > 1
+
+
+def _has_visible_text(pieces: List[str]) -> bool:
+    return any(not _is_tag(p) and not p.isspace() for p in pieces)
+
+
+def _tag_name(tag: str) -> str:
+    m = _TAG_NAME_RE.match(tag)
+    return m.group(1).lower() if m else ""
+
+
+class HTMLChunker:
+    """Режет HTML на сообщения не длиннее max_length без разрыва тегов и сущностей.
+
+    Открытые на границе теги закрываются в конце куска и открываются заново в начале
+    следующего; разрыв по возможности делается по переносу строки, затем по пробелу.
+    Работает потоково: `feed()` возвращает готовые куски, `close()` — последний.
+
+    Открытые теги вместе с закрывающими занимают не больше половины куска: тег сверх
+    этого (длинная ссылка при маленьком max_length) пропускается — текст остаётся,
+    теряется только разметка, зато кусок никогда не длиннее max_length.
+    """
+
+    def __init__(self, max_length: int = 4096):
+        self.max_length = max_length
+        self._tail = ""                          # незавершённый тег или сущность
+        self._pieces: List[str] = []
+        self._size = 0
+        self._stack: List[Tuple[str, str]] = []  # (имя, открывающий тег)
+        self._closing = 0                        # длина закрывающих тегов стека
+        self._opening = 0                        # длина открывающих тегов стека
+        self._safe: Optional[Tuple[int, int, List[Tuple[str, str]]]] = None
+        self._has_text = False                   # в куске есть видимый текст
+        self._chunks: List[str] = []
+
+    def _room(self) -> int:
+        return self.max_length - self._size - self._closing
+
+    def _has_content(self) -> bool:
+        # В куске есть что-то кроме заново открытых тегов — разрыв не будет пустым
+        return self._size > self._opening
+
+    def _append(self, piece: str) -> None:
+        self._pieces.append(piece)
+        self._size += len(piece)
+
+    def _emit(self, pieces: List[str], stack: List[Tuple[str, str]]) -> None:
+        chunk = "".join(pieces) + "".join(f"</{name}>" for name, _ in reversed(stack))
+        if _TOKEN_RE.sub(lambda m: "" if m.group(0).startswith("<") else m.group(0), chunk).strip():
+            self._chunks.append(chunk)
+
+    def _break(self) -> None:
+        safe = self._safe
+        # Разрыв по переносу строки — только если до него есть видимый текст
+        if safe is not None and safe[1] >= self.max_length // 2 and _has_visible_text(self._pieces[:safe[0]]):
+            idx, _, stack = safe
+            head, carry = self._pieces[:idx], self._pieces[idx:]
+        else:
+            head, carry, stack = list(self._pieces), [], list(self._stack)
+        # Теги, открытые прямо перед разрывом, не оставляем пустыми в конце куска —
+        # они и так откроются заново в следующем
+        emit_stack = list(stack)
+        while head and emit_stack and head[-1] == emit_stack[-1][1]:
+            head.pop()
+            emit_stack.pop()
+        self._emit(head, emit_stack)
+        # Если перенесённое начинается с закрытия тегов, открывать их заново незачем
+        reopen = list(stack)
+        while carry and reopen and carry[0].startswith("</") and _tag_name(carry[0]) == reopen[-1][0]:
+            carry.pop(0)
+            reopen.pop()
+        self._pieces = [raw for _, raw in reopen] + carry
+        self._size = sum(len(p) for p in self._pieces)
+        self._has_text = _has_visible_text(carry)
+        self._safe = None
+
+    def _push_tag(self, tag: str) -> None:
+        name = _tag_name(tag)
+        if tag.startswith("</"):
+            for i in range(len(self._stack) - 1, -1, -1):
+                if self._stack[i][0] == name:
+                    if i == len(self._stack) - 1 and self._pieces and self._pieces[-1] == self._stack[i][1]:
+                        # Элемент вышел пустым (например, заново открыт после разрыва) — убираем целиком
+                        self._size -= len(self._pieces.pop())
+                    else:
+                        self._append(tag)
+                    self._closing -= len(name) + 3
+                    self._opening -= len(self._stack[i][1])
+                    del self._stack[i]
+                    break
+            # Закрывающий тег без открытого (пропущенного) не пишем
+            return
+        if tag.endswith("/>"):
+            if len(tag) > self._room() and self._has_content():
+                self._break()
+            if len(tag) <= self._room():
+                self._append(tag)
+            return
+        cost = len(tag) + len(name) + 3
+        if self._opening + self._closing + cost > self.max_length // 2:
+            return  # разметка не помещается в кусок — оставляем только текст
+        if cost > self._room() and self._has_content():
+            self._break()
+        self._append(tag)
+        self._stack.append((name, tag))
+        self._closing += len(name) + 3
+        self._opening += len(tag)
+
+    def _push_text(self, text: str) -> None:
+        while text:
+            room = self._room()
+            if len(text) <= room:
+                self._append(text)
+                self._has_text = self._has_text or not text.isspace()
+                return
+            # Пробельный хвост сам по себе не повод для разрыва: пустой кусок не отправить
+            if (room <= 0 and self._has_content()) or (self._has_text and (text == "\n" or self._safe is not None)):
+                self._break()
+                continue
+            part = text[:max(room, 1)]
+            amp = part.rfind("&")
+            if amp != -1 and ";" not in part[amp:]:
+                # Сущность не режем: переносим её в следующий кусок целиком
+                if amp == 0 and self._has_content():
+                    self._break()
+                    continue
+                m = _ENTITY_RE.match(text, amp)
+                part = part[:amp] if amp else (m.group(0) if m else part)
+            space = part.rfind(" ")
+            if space >= len(part) // 2:
+                part = part[:space + 1]
+            self._append(part)
+            self._has_text = self._has_text or not part.isspace()
+            text = text[len(part):]
+            if text:
+                self._break()
+
+    def _push(self, token: str) -> None:
+        if _is_tag(token):
+            self._push_tag(token)
+            return
+        self._push_text(token)
+        if token == "\n":
+            self._safe = (len(self._pieces), self._size, list(self._stack))
+
+    def feed(self, html: str) -> List[str]:
+        data = self._tail + html
+        # Хвост может оказаться началом тега или сущности — ждём продолжения
+        cut = len(data)
+        lt = data.rfind("<")
+        if lt != -1 and data.find(">", lt) == -1:
+            cut = lt
+        amp = data.rfind("&", 0, cut)
+        if amp != -1 and cut - amp < 12 and data.find(";", amp, cut) == -1 and re.fullmatch(r"&#?\w*", data[amp:cut]):
+            cut = amp
+        self._tail = data[cut:]
+        for m in _TOKEN_RE.finditer(data, 0, cut):
+            self._push(m.group(0))
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+    def close(self) -> List[str]:
+        chunks = self.feed("")
+        if self._tail:
+            self._push_text(self._tail)
+            self._tail = ""
+        self._emit(self._pieces, self._stack)
+        self._pieces, self._size, self._has_text, self._safe = [], 0, False, None
+        return chunks + self._chunks
+
+
 def split_long_html_message(text: str, max_length: int = 4096) -> List[str]:
     """
-    Разбивает длинное HTML сообщение на части, сохраняя читаемость.
+    Разбивает длинное HTML сообщение на части с сохранением парности тегов.
     
     Args:
         text: Исходный HTML текст
@@ -33,33 +346,8 @@ def split_long_html_message(text: str, max_length: int = 4096) -> List[str]:
     """
     if len(text) <= max_length:
         return [text]
-    
-    chunks = []
-    current_pos = 0
-    
-    while current_pos < len(text):
-        # Определяем границу следующего чанка
-        end_pos = current_pos + max_length
-        
-        if end_pos >= len(text):
-            # Последний кусок
-            chunks.append(text[current_pos:])
-            break
-        
-        # Ищем удобное место для разрыва (по переносу строки)
-        safe_break = text.rfind('\n', current_pos, end_pos)
-        if safe_break == -1 or safe_break == current_pos:
-            # Если нет переноса строки, ищем пробел
-            safe_break = text.rfind(' ', current_pos, end_pos)
-        
-        if safe_break == -1 or safe_break == current_pos:
-            # Если нет пробела, режем по максимальной длине
-            safe_break = end_pos
-        
-        chunks.append(text[current_pos:safe_break])
-        current_pos = safe_break + (1 if text[safe_break:safe_break+1] in ['\n', ' '] else 0)
-    
-    return chunks
+    chunker = HTMLChunker(max_length)
+    return chunker.feed(text) + chunker.close()
 
 
 async def send_long_html_message(message: Message, text: str, max_length: int = 4096) -> None:
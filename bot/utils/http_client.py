@@ -1,7 +1,37 @@
 """HTTP клиент для загрузки файлов из Telegram и сетевых источников."""
+import hashlib
+import tempfile
+from dataclasses import dataclass
+from typing import BinaryIO
+
 import aiohttp
 from bot.utils.log import logger
 
+CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024  # больше — файл уходит во временный файл на диске
+
+
+class FileTooLargeError(Exception):
+    """Файл превышает допустимый размер (проверяется по мере скачивания)."""
+
+    def __init__(self, limit_bytes: int):
+        super().__init__(f"file exceeds {limit_bytes} bytes")
+        self.limit_bytes = limit_bytes
+
+
+@dataclass
+class SpooledDownload:
+    """Скачанный файл: буфер в памяти до SPOOL_MAX_MEMORY, дальше — временный файл."""
+    file: BinaryIO
+    size: int
+    sha256: str
+
+    def close(self) -> None:
+        try:
+            self.file.close()
+        except Exception:
+            pass
+
 _session: aiohttp.ClientSession | None = None
 
 def get_session() -> aiohttp.ClientSession:
@@ -27,21 +57,58 @@ async def download_file(url: str) -> bytes:
     try:
         async with session.get(url) as resp:
             if resp.status != 200:
-                text = await resp.text()
-                msg = f"Ошибка загрузки файла {url}: {resp.status} {text[:200]}"
-                logger.error(msg)
-                raise aiohttp.ClientResponseError(
-                    request_info=resp.request_info,
-                    history=resp.history,
-                    status=resp.status,
-                    message=msg,
-                    headers=resp.headers,
-                )
+                _raise_for_status(resp, url, await resp.text())
             return await resp.read()
     except Exception as e:
         logger.error(f"download_file: {e}")
         raise
 
+def _raise_for_status(resp: aiohttp.ClientResponse, url: str, body: str) -> None:
+    msg = f"Ошибка загрузки файла {url}: {resp.status} {body[:200]}"
+    logger.error(msg)
+    raise aiohttp.ClientResponseError(
+        request_info=resp.request_info,
+        history=resp.history,
+        status=resp.status,
+        message=msg,
+        headers=resp.headers,
+    )
+
+
+async def download_to_spool(url: str, max_bytes: int) -> SpooledDownload:
+    """Скачивает файл потоком в ограниченный буфер, считая sha256 на лету.
+
+    Память на один файл не превышает SPOOL_MAX_MEMORY; лимит max_bytes проверяется
+    по Content-Length и по мере чтения — загрузка обрывается сразу при превышении.
+    Вызывающий обязан закрыть результат (`close()`).
+    """
+    session = get_session()
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with session.get(url) as resp:
+            if resp.status != 200:
+                _raise_for_status(resp, url, await resp.text())
+            if resp.content_length is not None and resp.content_length > max_bytes:
+                raise FileTooLargeError(max_bytes)
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise FileTooLargeError(max_bytes)
+                digest.update(chunk)
+                spool.write(chunk)
+        spool.seek(0)
+        return SpooledDownload(file=spool, size=size, sha256=digest.hexdigest())
+    except FileTooLargeError:
+        spool.close()
+        raise
+    except Exception as e:
+        spool.close()
+        logger.error(f"download_to_spool: {e}")
+        raise
+
+
 async def close_session():
     global _session
     if _session and not _session.closed:
@@ -0,0 +1,99 @@
+"""Подготовка изображений из Telegram для мультимодальных запросов.
+
+Выбирает самый маленький PhotoSize, которого достаточно для нужного уровня
+детализации модели, скачивает его один раз и передаёт в OpenAI inline (base64)
+с явным `detail`. Ссылка Telegram с токеном бота наружу не уходит.
+
+Модель масштабирует картинку сама: при detail=low — до 512×512 (фиксированная
+цена), при detail=high — до 2048 по длинной стороне и 768 по короткой, после чего
+режет на плитки 512×512. Всё, что крупнее, только увеличивает трафик и задержку.
+"""
+from __future__ import annotations
+
+import base64
+import re
+from typing import Optional, Sequence
+
+from aiogram import Bot
+from aiogram.types import PhotoSize
+
+from bot.config import settings
+from bot.utils import tg_cache
+from bot.utils.log import logger
+
+LOW_DETAIL_SIDE = 512     # detail=low: модель видит не больше 512 по длинной стороне
+HIGH_DETAIL_SHORT = 768   # detail=high: короткая сторона приводится к 768
+
+# Подписи, для которых нужна мелкая детализация: текст, цифры, схемы
+_HIGH_DETAIL_RE = re.compile(
+    r"(текст|прочита|распозна|переведи|перевод|мелк|детал|цифр|номер|чек|таблиц|документ|скрин|схем|график|формул|код"
+    r"|read|text|ocr|translat|detail|small|number|receipt|table|document|screenshot|diagram|chart|formula|code)",
+    re.IGNORECASE,
+)
+
+
+# Подписи, которым хватает общего вида картинки (512 px): цвет, настроение, «что это»
+_LOW_DETAIL_RE = re.compile(
+    r"(что (это|на (фото|картинке|снимке)|изображено)|в (двух|паре) слов|в целом|общ(ее|ий) (вид|впечатлени)|цвет|настроени"
+    r"|what is this|what'?s (this|in the (photo|picture|image))|in a few words|overall|colou?r|mood)",
+    re.IGNORECASE,
+)
+
+
+def choose_detail(caption: Optional[str]) -> str:
+    """Уровень детализации по настройке IMAGE_DETAIL.
+
+    auto — high, как и раньше; low только если подпись явно просит общий вид и не
+    упоминает ничего мелкого (текст, цифры, схемы).
+    """
+    mode = (settings.image_detail or "auto").lower()
+    if mode in ("low", "high"):
+        return mode
+    if caption and _LOW_DETAIL_RE.search(caption) and not _HIGH_DETAIL_RE.search(caption):
+        return "low"
+    return "high"
+
+
+def choose_photo_size(sizes: Sequence[PhotoSize], detail: str) -> PhotoSize:
+    """Самый маленький размер, которого хватает модели при данном detail.
+
+    Telegram присылает превью по возрастанию (≈90, 320, 800, 1280 px); если ни один
+    не дотягивает до порога — берётся самый крупный.
+    """
+    ordered = sorted(sizes, key=lambda p: p.width * p.height)
+    for size in ordered:
+        if detail == "low" and max(size.width, size.height) >= LOW_DETAIL_SIDE:
+            return size
+        if detail == "high" and min(size.width, size.height) >= HIGH_DETAIL_SHORT:
+            return size
+    return ordered[-1]
+
+
+def _mime_type(data: bytes) -> str:
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:3] == b"GIF":
+        return "image/gif"
+    return "image/jpeg"
+
+
+async def get_image_data_url(bot: Bot, size: PhotoSize) -> str:
+    """data URL картинки; байты берутся из кэша файлов Telegram (tg_cache) по file_unique_id."""
+    data = await tg_cache.download(bot, size.file_id, size.file_unique_id, settings.max_file_mb * 1024 * 1024)
+    logger.info(f"Изображение {size.width}x{size.height} ({len(data)} байт) подготовлено для модели")
+    return f"data:{_mime_type(data)};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def redact_data_urls(text: str) -> str:
+    """Укорачивает base64 картинок в отладочных логах."""
+    return re.sub(r"(data:image/[a-z]+;base64,)[A-Za-z0-9+/=]{64,}", r"\1…", text)
+
+
+__all__ = [
+    "choose_detail",
+    "choose_photo_size",
+    "get_image_data_url",
+    "redact_data_urls",
+]
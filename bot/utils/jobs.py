@@ -0,0 +1,479 @@
+"""Единый движок фоновых задач: один цикл опроса, общий захват (lease), статусы и метрики.
+
+Виды задач (напоминания, самовызовы и т.д.) регистрируются через `register_job_kind`
+и хранятся каждый в своей таблице с общим набором служебных столбцов:
+id, status, due_at, picked_at, executed_at, fired_at.
+Периодическая фоновая работа без таблицы регистрируется через `register_periodic`
+и выполняется тем же циклом, не создавая отдельных опросов SQLite.
+
+Неудачная задача не теряется: счётчик attempts растёт, а retry_at откладывает
+повтор по экспоненте (JOBS_RETRY_BASE · 2^(n-1)). После JOBS_MAX_ATTEMPTS попыток
+задача получает статус `dead` (dead-letter) и ждёт ручного повтора через `replay_dead`.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+from dataclasses import dataclass
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiogram import Bot
+
+from bot.config import settings
+from bot.utils.db import get_conn
+from bot.utils.log import logger, set_request_id
+from bot.utils.shards import is_primary, shard_where
+
+
+LEASE_SECONDS = 60  # если picked_at старше — считаем задачу «осиротевшей»
+MAX_IDLE_BACKOFF_SECONDS = 300  # потолок паузы цикла при серии ошибок выборки
+MAX_RETRY_DELAY_SECONDS = 3600  # потолок паузы перед повтором упавшей задачи
+LEGACY_ERROR_STATUS = "error"  # упавшие задачи до появления повторов: только показываем, не повторяем
+DT_FMT = "%Y-%m-%d %H:%M:%S"
+
+
+def utcnow_str() -> str:
+    return datetime.now(timezone.utc).strftime(DT_FMT)
+
+
+def parse_utc(s: str) -> datetime:
+    return datetime.strptime(s, DT_FMT).replace(tzinfo=timezone.utc)
+
+
+@dataclass
+class JobKind:
+    """Вид задач, хранящихся в таблице `table`.
+
+    factory превращает строку выборки (столбцы `columns`, первый — id) в объект задачи,
+    у которого должны быть атрибуты `id` и `due_at`. handler выполняет задачу;
+    успешное завершение помечает её `done`, исключение — повтор с паузой или `dead`.
+
+    Несколько видов могут обслуживать одну таблицу (например, предгенерация и отправка
+    напоминаний): каждый со своим условием `extra_where` и своим столбцом захвата
+    `lease_column`. Вид с `finalize=False` не меняет статус строки и не повторяется
+    движком — итог записывает handler.
+    Вид с `exact_time=True` выбирается заранее (за `lookahead_seconds`), а выполняется
+    ровно в `due_at`: ожидание идёт вне семафора и не занимает слот параллельности.
+    Вид с `concurrency` получает собственный семафор вместо общего JOBS_CONCURRENCY —
+    массовая служебная работа (удаление файлов и т.п.) не задерживает напоминания.
+    При запуске в несколько процессов (WORKERS > 1) строки делятся между шардами по
+    столбцу `shard_column` (обычно chat_id); вид без него выполняет только шард 0.
+    """
+    name: str
+    table: str
+    columns: Sequence[str]
+    factory: Callable[[tuple], Any]
+    handler: Callable[[Bot, Any], Awaitable[None]]
+    lookahead_seconds: Callable[[], float] = lambda: float(settings.reminder_lookahead_seconds)
+    extra_where: str = ""
+    lease_column: str = "picked_at"
+    lease_seconds: Callable[[], float] = lambda: float(LEASE_SECONDS)
+    finalize: bool = True
+    exact_time: bool = False
+    concurrency: Optional[int] = None
+    shard_column: Optional[str] = None
+
+
+@dataclass
+class PeriodicJob:
+    """Периодическая фоновая работа без собственной таблицы (GC, свёртки и т.п.).
+
+    При нескольких процессах выполняется только в шарде 0, если не `every_shard`.
+    """
+    name: str
+    interval_seconds: float
+    handler: Callable[[Bot], Awaitable[None]]
+    next_run: float = 0.0
+    every_shard: bool = False
+
+
+@dataclass
+class JobMetrics:
+    done: int = 0
+    failed: int = 0
+    retried: int = 0
+    dead: int = 0
+    lost_claims: int = 0
+    fetch_errors: int = 0
+    lag_sum: float = 0.0
+    lag_count: int = 0
+    last_run_at: Optional[str] = None
+
+    @property
+    def avg_lag(self) -> float:
+        return (self.lag_sum / self.lag_count) if self.lag_count else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "done": self.done,
+            "failed": self.failed,
+            "retried": self.retried,
+            "dead": self.dead,
+            "lost_claims": self.lost_claims,
+            "fetch_errors": self.fetch_errors,
+            "avg_lag_s": round(self.avg_lag, 2),
+            "last_run_at": self.last_run_at,
+        }
+
+
+_kinds: Dict[str, JobKind] = {}
+_periodic: Dict[str, PeriodicJob] = {}
+_metrics: Dict[str, JobMetrics] = {}
+# Задачи в работе: ключ (вид, id) — не берём повторно, даже если lease истёк
+_inflight: Dict[Tuple[str, Any], asyncio.Task] = {}
+
+
+def register_job_kind(kind: JobKind) -> None:
+    """Регистрирует вид задач в общем планировщике."""
+    _kinds[kind.name] = kind
+    _metrics.setdefault(kind.name, JobMetrics())
+
+
+def register_periodic(name: str, interval_seconds: float, handler: Callable[[Bot], Awaitable[None]],
+                      every_shard: bool = False) -> None:
+    """Регистрирует периодическую фоновую работу (выполняется тем же циклом)."""
+    _periodic[name] = PeriodicJob(
+        name=name, interval_seconds=float(interval_seconds), handler=handler, every_shard=every_shard
+    )
+    _metrics.setdefault(name, JobMetrics())
+
+
+def get_jobs_metrics() -> Dict[str, Dict[str, Any]]:
+    """Снимок метрик по всем видам задач (для /status и логов)."""
+    result = {name: m.as_dict() for name, m in _metrics.items()}
+    for name in result:
+        result[name]["inflight"] = sum(1 for k in _inflight if k[0] == name)
+    return result
+
+
+async def _fetch_due(kind: JobKind, limit: int) -> List[Any]:
+    # lookahead и анти-дрейф, исключаем недавно взятые задачи
+    now = datetime.now(timezone.utc)
+    horizon = (now + timedelta(seconds=kind.lookahead_seconds())).strftime(DT_FMT)
+    stale_limit = (now - timedelta(seconds=kind.lease_seconds())).strftime(DT_FMT)
+    cols = ", ".join(kind.columns)
+    lease = kind.lease_column
+    extra = f"AND ({kind.extra_where})" if kind.extra_where else ""
+    shard = shard_where(kind.shard_column)
+    if shard:
+        extra += f" AND {shard}"
+    params: List[Any] = [horizon, stale_limit]
+    if kind.finalize:
+        # Отложенные повторы не берём раньше retry_at
+        extra += " AND (retry_at IS NULL OR retry_at <= ?)"
+        params.append(now.strftime(DT_FMT))
+    params.append(limit)
+    async with get_conn() as db:
+        cur = await db.execute(
+            f"""
+            SELECT {cols}
+              FROM {kind.table}
+             WHERE status = 'scheduled'
+               AND due_at <= ?
+               AND ({lease} IS NULL OR {lease} <= ?)
+               {extra}
+             ORDER BY due_at ASC
+             LIMIT ?
+            """,
+            params,
+        )
+        rows = await cur.fetchall()
+    return [kind.factory(r) for r in rows]
+
+
+async def _claim(kind: JobKind, job_id: int) -> bool:
+    """Атомарно отмечает задачу как взятую воркером (условный UPDATE — защита от дублей)."""
+    lease = kind.lease_column
+    extra = f"AND ({kind.extra_where})" if kind.extra_where else ""
+    if kind.finalize:
+        extra += " AND (retry_at IS NULL OR retry_at <= CURRENT_TIMESTAMP)"
+    async with get_conn() as db:
+        cur = await db.execute(
+            f"""
+            UPDATE {kind.table}
+               SET {lease}=CURRENT_TIMESTAMP
+             WHERE id=? AND status='scheduled'
+               AND ({lease} IS NULL OR {lease} <= DATETIME('now', ?))
+               {extra}
+            """,
+            (job_id, f'-{int(kind.lease_seconds())} seconds'),
+        )
+        await db.commit()
+        return cur.rowcount == 1
+
+
+async def mark_status(table: str, job_id: int, status: str) -> None:
+    async with get_conn() as db:
+        if status == "done":
+            await db.execute(
+                f"UPDATE {table} SET status='done', executed_at=CURRENT_TIMESTAMP, fired_at=CURRENT_TIMESTAMP WHERE id=?",
+                (job_id,),
+            )
+        else:
+            await db.execute(
+                f"UPDATE {table} SET status=?, executed_at=CURRENT_TIMESTAMP WHERE id=?",
+                (status, job_id),
+            )
+        await db.commit()
+
+
+def retry_delay_seconds(attempt: int) -> float:
+    """Пауза перед повтором после attempt-й неудачи: экспонента с потолком и небольшим разбросом."""
+    base = max(1, settings.jobs_retry_base_seconds)
+    delay = min(MAX_RETRY_DELAY_SECONDS, base * (2 ** max(0, attempt - 1)))
+    return delay + random.uniform(0, delay * 0.1)
+
+
+async def _record_failure(kind: JobKind, job_id: int, error: str) -> str:
+    """Увеличивает attempts и откладывает повтор либо переводит задачу в dead-letter.
+
+    Возвращает новый статус: 'scheduled' (будет повтор) или 'dead'.
+    """
+    async with get_conn() as db:
+        cur = await db.execute(f"SELECT COALESCE(attempts, 0) FROM {kind.table} WHERE id=?", (job_id,))
+        row = await cur.fetchone()
+        attempts = (int(row[0]) if row else 0) + 1
+        error = error[:500]
+        if attempts >= max(1, settings.jobs_max_attempts):
+            await db.execute(
+                f"""
+                UPDATE {kind.table}
+                   SET status='dead', attempts=?, last_error=?, retry_at=NULL, executed_at=CURRENT_TIMESTAMP
+                 WHERE id=?
+                """,
+                (attempts, error, job_id),
+            )
+            status = "dead"
+        else:
+            delay = int(retry_delay_seconds(attempts))
+            await db.execute(
+                f"""
+                UPDATE {kind.table}
+                   SET attempts=?, last_error=?, retry_at=DATETIME('now', ?), {kind.lease_column}=NULL
+                 WHERE id=?
+                """,
+                (attempts, error, f'+{delay} seconds', job_id),
+            )
+            status = "scheduled"
+        await db.commit()
+    return status
+
+
+def _dead_letter_kinds() -> List[JobKind]:
+    return [k for k in _kinds.values() if k.finalize]
+
+
+async def count_dead(status: str = "dead") -> Dict[str, int]:
+    """Количество задач в dead-letter по видам.
+
+    С status=LEGACY_ERROR_STATUS — старые упавшие задачи, оставшиеся с версий без
+    повторов: их показываем, но не повторяем (срок таких напоминаний давно прошёл).
+    """
+    result: Dict[str, int] = {}
+    async with get_conn() as db:
+        for kind in _dead_letter_kinds():
+            cur = await db.execute(f"SELECT COUNT(*) FROM {kind.table} WHERE status=?", (status,))
+            row = await cur.fetchone()
+            result[kind.name] = int(row[0]) if row else 0
+    return result
+
+
+async def list_dead(limit: int = 20) -> List[Dict[str, Any]]:
+    """Последние задачи в dead-letter по всем видам (для админской команды)."""
+    items: List[Dict[str, Any]] = []
+    async with get_conn() as db:
+        for kind in _dead_letter_kinds():
+            cur = await db.execute(
+                f"""
+                SELECT id, chat_id, due_at, COALESCE(attempts, 0), last_error, executed_at
+                  FROM {kind.table}
+                 WHERE status='dead'
+                 ORDER BY executed_at DESC
+                 LIMIT ?
+                """,
+                (limit,),
+            )
+            for r in await cur.fetchall():
+                items.append({
+                    "kind": kind.name, "id": r[0], "chat_id": r[1], "due_at": r[2],
+                    "attempts": r[3], "last_error": r[4], "failed_at": r[5],
+                })
+    items.sort(key=lambda x: x["failed_at"] or "", reverse=True)
+    return items[:limit]
+
+
+async def replay_dead(kind_name: Optional[str] = None) -> int:
+    """Возвращает задачи из dead-letter в очередь со сброшенным счётчиком попыток.
+
+    Просроченные задачи будут выполнены при ближайшем проходе планировщика.
+    """
+    total = 0
+    async with get_conn() as db:
+        for kind in _dead_letter_kinds():
+            if kind_name and kind.name != kind_name:
+                continue
+            cur = await db.execute(
+                f"""
+                UPDATE {kind.table}
+                   SET status='scheduled', attempts=0, retry_at=NULL, {kind.lease_column}=NULL, executed_at=NULL
+                 WHERE status='dead'
+                """
+            )
+            total += cur.rowcount or 0
+        await db.commit()
+    if total:
+        logger.info(f"[jobs] replayed {total} dead-letter job(s){f' of {kind_name}' if kind_name else ''}")
+    return total
+
+
+async def _run_job(bot: Bot, kind: JobKind, job: Any, sem: asyncio.Semaphore) -> None:
+    metrics = _metrics[kind.name]
+    set_request_id(f"{kind.name}:{job.id}")  # у каждой задачи свой контекст — сбрасывать не нужно
+    if kind.exact_time:
+        try:
+            delay = (parse_utc(job.due_at) - datetime.now(timezone.utc)).total_seconds()
+        except Exception:
+            delay = 0.0
+        if delay > 0:
+            await asyncio.sleep(delay)
+    async with sem:
+        if not await _claim(kind, job.id):
+            metrics.lost_claims += 1
+            return
+        try:
+            lag = max(0.0, (datetime.now(timezone.utc) - parse_utc(job.due_at)).total_seconds())
+            metrics.lag_sum += lag
+            metrics.lag_count += 1
+        except Exception:
+            pass
+        try:
+            await kind.handler(bot, job)
+        except Exception as e:
+            metrics.failed += 1
+            if not kind.finalize:
+                logger.warning(f"[jobs] {kind.name} id={job.id} failed: {e}")
+                return
+            try:
+                status = await _record_failure(kind, job.id, f"{type(e).__name__}: {e}")
+            except Exception as db_err:
+                logger.warning(f"[jobs] {kind.name} id={job.id} failed: {e}; record failure: {db_err}")
+                return
+            if status == "dead":
+                metrics.dead += 1
+                logger.error(f"[jobs] {kind.name} id={job.id} moved to dead-letter: {e}")
+            else:
+                metrics.retried += 1
+                logger.warning(f"[jobs] {kind.name} id={job.id} failed, will retry: {e}")
+            return
+        if kind.finalize:
+            try:
+                await mark_status(kind.table, job.id, "done")
+            except Exception as e:
+                logger.warning(f"[jobs] {kind.name} id={job.id} mark done failed: {e}")
+        metrics.done += 1
+        metrics.last_run_at = utcnow_str()
+
+
+async def _run_periodic(bot: Bot, job: PeriodicJob) -> None:
+    metrics = _metrics[job.name]
+    set_request_id(job.name)
+    try:
+        await job.handler(bot)
+        metrics.done += 1
+    except Exception as e:
+        metrics.failed += 1
+        logger.warning(f"[jobs] periodic {job.name} failed: {e}")
+    metrics.last_run_at = utcnow_str()
+
+
+def _spawn(key: Tuple[str, Any], coro: Awaitable[None]) -> None:
+    task = asyncio.create_task(coro, name=f"job:{key[0]}:{key[1]}")
+    _inflight[key] = task
+    task.add_done_callback(lambda _t, k=key: _inflight.pop(k, None))
+
+
+def start_jobs_scheduler(bot: Bot) -> asyncio.Task:
+    """Запускает единственный цикл опроса для всех зарегистрированных видов задач."""
+    stop_event = asyncio.Event()
+    sem = asyncio.Semaphore(max(1, settings.jobs_concurrency))
+    kind_sems = {k.name: asyncio.Semaphore(max(1, k.concurrency)) for k in _kinds.values() if k.concurrency}
+
+    async def _loop():
+        logger.info(f"⏰ Jobs scheduler started (kinds={', '.join(_kinds) or '-'}; periodic={', '.join(_periodic) or '-'})")
+        error_streak = 0
+        loop = asyncio.get_running_loop()
+        try:
+            while not stop_event.is_set():
+                had_errors = False
+                batch_limit = max(1, settings.reminder_batch_limit)
+                for kind in list(_kinds.values()):
+                    try:
+                        due = await _fetch_due(kind, limit=batch_limit)
+                    except Exception as e:
+                        _metrics[kind.name].fetch_errors += 1
+                        had_errors = True
+                        logger.warning(f"jobs loop warn ({kind.name}): {e}")
+                        continue
+                    for job in due:
+                        key = (kind.name, job.id)
+                        if key not in _inflight:
+                            _spawn(key, _run_job(bot, kind, job, kind_sems.get(kind.name, sem)))
+                now_mono = loop.time()
+                for pjob in list(_periodic.values()):
+                    if not (pjob.every_shard or is_primary()):
+                        continue
+                    key = (pjob.name, "periodic")
+                    if now_mono >= pjob.next_run and key not in _inflight:
+                        pjob.next_run = now_mono + pjob.interval_seconds
+                        _spawn(key, _run_periodic(bot, pjob))
+                # Экспоненциальная пауза при серии ошибок выборки (например, БД заблокирована)
+                error_streak = error_streak + 1 if had_errors else 0
+                pause = float(settings.reminder_poll_interval_seconds) * (2 ** min(error_streak, 5))
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=min(pause, MAX_IDLE_BACKOFF_SECONDS))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            summary = "; ".join(
+                f"{name}: done={m.done}, failed={m.failed}, avg_lag_s={m.avg_lag:.2f}"
+                for name, m in _metrics.items()
+            )
+            logger.info(f"⏹ Jobs scheduler stopped ({summary or 'no jobs'})")
+
+    task = asyncio.create_task(_loop(), name="jobs_scheduler")
+    # Помечаем стоп-событие для корректной остановки снаружи
+    setattr(task, "_gpttg_stop_event", stop_event)
+    return task
+
+
+async def stop_jobs_scheduler(task: asyncio.Task, timeout: float) -> int:
+    """Останавливает выборку новых задач и ждёт выполняемые не дольше timeout.
+
+    Незавершённые к сроку задачи отменяются (возвращается их число): их аренда
+    истечёт, и задачу подберёт следующий запуск. Если отменяют саму остановку,
+    планировщик и задачи отменяются сразу, а CancelledError пробрасывается дальше.
+    """
+    stop_event = getattr(task, "_gpttg_stop_event", None)
+    if stop_event is not None:
+        stop_event.set()
+    try:
+        await asyncio.wait_for(asyncio.shield(task), timeout=max(0.1, timeout))
+    except asyncio.CancelledError:
+        if not task.cancelled():
+            # Отменяют саму остановку — не ждём дальше, гасим планировщик и задачи
+            task.cancel()
+            for t in _inflight.values():
+                t.cancel()
+            raise
+    except (asyncio.TimeoutError, Exception):
+        task.cancel()
+    running = [t for t in _inflight.values() if not t.done()]
+    if running and timeout > 0:
+        _, running = await asyncio.wait(running, timeout=timeout)
+    for t in running:
+        t.cancel()
+    if running:
+        await asyncio.gather(*running, return_exceptions=True)
+        logger.warning(f"[jobs] {len(running)} задач(и) прервано при остановке — будут подобраны после рестарта")
+    return len(running)
@@ -1,11 +1,157 @@
-"""Базовая настройка логирования с ротацией файлов."""
+"""Настройка логирования: запись в фоновом потоке, структурированные записи, сэмплирование.
+
+Обработчики вывода (stdout и файл с ротацией) работают в отдельном потоке
+`QueueListener`; в цикле событий запись только кладётся в очередь, поэтому медленный
+диск или терминал не задерживают обработку апдейтов. К каждой записи добавляется
+идентификатор запроса (апдейт или фоновая задача) из contextvar, LOG_FORMAT=json
+даёт по одной JSON-строке на запись, а шумные строки DEBUG/INFO ограничиваются
+LOG_SAMPLE_BURST записями в минуту с одного места в коде.
+
+Тяжёлые аргументы передавайте через `lazy()` — они будут отформатированы уже в
+потоке записи и только если запись действительно пишется.
+"""
+import atexit
+import contextvars
+import json
 import logging
+import multiprocessing
 import sys
 import os
 import glob
-from logging.handlers import RotatingFileHandler
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Callable, Dict, Optional, Tuple
+from bot import startup
 from bot.config import settings
 
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s%(request_tag)s: %(message)s"
+SAMPLE_WINDOW_SECONDS = 60.0
+
+# Номер шарда при запуске в несколько процессов (см. bot/utils/shards.py)
+_SHARD = os.getenv("GPTTG_SHARD")
+_IS_SHARD_WORKER = int(os.getenv("GPTTG_SHARD_PORT", "0")) > 0
+# Дочерний процесс пула (spawn заново импортирует модули бота, см. bot/utils/pdf_text.py):
+# чужие лог-файлы не трогаем и пишем только в stdout
+_IS_POOL_CHILD = multiprocessing.parent_process() is not None
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+
+def set_request_id(request_id: Optional[str]) -> contextvars.Token:
+    """Помечает все записи текущей задачи (и созданных из неё) идентификатором запроса."""
+    return request_id_var.set(request_id)
+
+
+class lazy:
+    """Аргумент лога, который вычисляется только при записи и вне цикла событий.
+
+    Передавайте данные, которые после вызова уже не меняются (например, копию словаря).
+    """
+
+    __slots__ = ("_fn", "_args", "_text")
+
+    def __init__(self, fn: Callable[..., Any], *args: Any):
+        self._fn = fn
+        self._args = args
+        self._text: Optional[str] = None
+
+    def __str__(self) -> str:
+        # Запись уходит в несколько обработчиков — вычисляем один раз
+        if self._text is None:
+            self._text = str(self._fn(*self._args))
+        return self._text
+
+
+class _ContextFilter(logging.Filter):
+    """Добавляет request_id и шард; работает в потоке вызова, где виден contextvar."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        record.shard = _SHARD
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Не больше `burst` записей ниже WARNING в окно с одного места в коде.
+
+    Сколько записей пропущено, сообщает первая запись следующего окна (`suppressed`).
+    """
+
+    def __init__(self, burst: int, window: float = SAMPLE_WINDOW_SECONDS):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._sites: Dict[Tuple[str, int], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0 or record.levelno >= logging.WARNING:
+            return True
+        now = time.monotonic()
+        site = self._sites.get((record.pathname, record.lineno))
+        if site is None or now - site[0] >= self.window:
+            suppressed = site[2] if site else 0
+            self._sites[(record.pathname, record.lineno)] = [now, 1, 0]
+            if suppressed:
+                record.suppressed = suppressed
+            return True
+        if site[1] < self.burst:
+            site[1] += 1
+            return True
+        site[2] += 1
+        return False
+
+
+class _LazyQueueHandler(QueueHandler):
+    """QueueHandler без форматирования в цикле событий.
+
+    Стандартный `prepare()` целиком форматирует запись в потоке вызова; здесь текст
+    собирается заранее только из обычных аргументов, а `lazy()` и трейсбеки
+    форматируются обработчиками в потоке записи.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args and not any(isinstance(a, lazy) for a in _iter_args(record.args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def _iter_args(args: Any):
+    return args.values() if isinstance(args, dict) else args
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время, уровень, логгер, текст, request_id, шард."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in ("request_id", "shard", "suppressed"):
+            value = getattr(record, key, None)
+            if value is not None:
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Прежний текстовый формат плюс [request_id] и счётчик пропущенных записей."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        request_id = getattr(record, "request_id", None)
+        record.request_tag = f" [{request_id}]" if request_id else ""
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", None)
+        if suppressed:
+            text += f" (пропущено похожих: {suppressed})"
+        return text
+
 
 def _purge_old_logs() -> None:
     """Удаляет старые лог-файлы при старте.
@@ -37,8 +183,11 @@ def _purge_old_logs() -> None:
         print(f"[log] Не удалось очистить старые логи: {e}")
 
 
-# Очищаем логи до настройки обработчиков
-_purge_old_logs()
+# Очищаем логи до настройки обработчиков (воркеры шардов не трогают логи соседей)
+if not _IS_SHARD_WORKER and not _IS_POOL_CHILD:
+    _purge_old_logs()
+
+_formatter = JsonFormatter() if settings.log_format == "json" else TextFormatter(TEXT_FORMAT)
 
 # Потоковый обработчик (stdout) всегда включен
 log_handlers = [logging.StreamHandler(sys.stdout)]
@@ -47,32 +196,55 @@ log_handlers = [logging.StreamHandler(sys.stdout)]
 # но с разными уровнями:
 #  - DEBUG_MODE=1 → пишем всё (DEBUG)
 #  - DEBUG_MODE=0 → пишем только ошибки (ERROR)
-try:
-    os.makedirs("logs", exist_ok=True)
-    max_bytes = getattr(settings, "max_log_mb", 5) * 1024 * 1024
-    rotating_handler = RotatingFileHandler(
-        filename="logs/bot.log",
-        maxBytes=max_bytes,
-        backupCount=3,
-        encoding="utf-8",
-    )
-    rotating_handler.setLevel(logging.DEBUG if getattr(settings, "debug_mode", False) else logging.ERROR)
-    log_handlers.append(rotating_handler)
-    print(
-        f"📝 Логи пишутся в logs/bot.log (уровень: "
-        f"{'DEBUG' if getattr(settings, 'debug_mode', False) else 'ERROR'}; "
-        f"лимит {max_bytes // (1024*1024)} МБ)"
-    )
-except Exception as e:
-    print(f"[log] Не удалось создать файловый обработчик: {e}")
+if not _IS_POOL_CHILD:
+    try:
+        os.makedirs("logs", exist_ok=True)
+        max_bytes = getattr(settings, "max_log_mb", 5) * 1024 * 1024
+        # У каждого воркера шарда свой файл: ротация одного файла из нескольких процессов ломается
+        log_file = f"logs/bot.shard{_SHARD}.log" if _IS_SHARD_WORKER else "logs/bot.log"
+        rotating_handler = RotatingFileHandler(
+            filename=log_file,
+            maxBytes=max_bytes,
+            backupCount=3,
+            encoding="utf-8",
+        )
+        rotating_handler.setLevel(logging.DEBUG if getattr(settings, "debug_mode", False) else logging.ERROR)
+        log_handlers.append(rotating_handler)
+        print(
+            f"📝 Логи пишутся в {log_file} (уровень: "
+            f"{'DEBUG' if getattr(settings, 'debug_mode', False) else 'ERROR'}; "
+            f"лимит {max_bytes // (1024*1024)} МБ)"
+        )
+    except Exception as e:
+        print(f"[log] Не удалось создать файловый обработчик: {e}")
+
+for _handler in log_handlers:
+    _handler.setFormatter(_formatter)
+
+# В цикле событий — только постановка в очередь; запись выполняет поток listener
+_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+queue_handler = _LazyQueueHandler(_queue)
+queue_handler.addFilter(_ContextFilter())
+queue_handler.addFilter(SamplingFilter(settings.log_sample_burst))
+listener = QueueListener(_queue, *log_handlers, respect_handler_level=True)
+listener.start()
+
+
+def stop_listener() -> None:
+    """Дописывает всё, что осталось в очереди, и останавливает поток записи (повторный вызов безопасен)."""
+    if listener._thread is not None:
+        listener.stop()
+
+
+atexit.register(stop_listener)
 
 # Уровень корневого логгера:
 #  - DEBUG_MODE=1 → DEBUG (и stdout, и файл получают debug)
 #  - DEBUG_MODE=0 → INFO (stdout INFO+, файл отфильтрует до ERROR)
 logging.basicConfig(
     level=logging.DEBUG if getattr(settings, "debug_mode", False) else logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    handlers=log_handlers,
+    handlers=[queue_handler],
 )
 
-logger = logging.getLogger("bot")
\ No newline at end of file
+logger = logging.getLogger("bot")
+startup.mark("logging")
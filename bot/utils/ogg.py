@@ -0,0 +1,200 @@
+"""Разбор и нарезка Ogg/Opus (голосовые Telegram) по границам страниц без перекодирования.
+
+Сегмент — самостоятельный .ogg: те же заголовки OpusHead/OpusTags, аудиостраницы
+с перенумерованными sequence number, пересчитанной granule position и CRC.
+Резать можно только между страницами, на которых пакет не продолжается, а место
+разреза выбирается там, где пакеты самые маленькие — Opus кодирует паузы очень
+компактно, поэтому это ближайшая к тишине граница.
+"""
+from __future__ import annotations
+
+import struct
+from dataclasses import dataclass
+from typing import List, Optional
+
+OPUS_RATE = 48000  # granule position в Ogg Opus всегда в отсчётах 48 кГц
+_HEADER = struct.Struct("<4sBBqIIIB")  # capture, version, type, granule, serial, seq, crc, nsegs
+
+FLAG_CONTINUED = 0x01
+FLAG_BOS = 0x02
+FLAG_EOS = 0x04
+
+
+def _crc_table() -> List[int]:
+    table = []
+    for i in range(256):
+        r = i << 24
+        for _ in range(8):
+            r = ((r << 1) ^ 0x04C11DB7) if r & 0x80000000 else (r << 1)
+        table.append(r & 0xFFFFFFFF)
+    return table
+
+
+_CRC_TABLE = _crc_table()
+
+
+def ogg_crc(data: bytes) -> int:
+    """CRC-32 Ogg (полином 0x04C11DB7, без отражения, начальное значение 0)."""
+    crc = 0
+    for b in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ _CRC_TABLE[((crc >> 24) & 0xFF) ^ b]
+    return crc
+
+
+@dataclass
+class OggPage:
+    header_type: int
+    granule: int
+    serial: int
+    seq: int
+    lacing: bytes
+    body: bytes
+
+    @property
+    def continued(self) -> bool:
+        return bool(self.header_type & FLAG_CONTINUED)
+
+    @property
+    def packets(self) -> int:
+        """Сколько пакетов завершается на странице."""
+        return sum(1 for v in self.lacing if v < 255)
+
+    def to_bytes(self) -> bytes:
+        header = _HEADER.pack(b"OggS", 0, self.header_type, self.granule, self.serial, self.seq, 0, len(self.lacing))
+        raw = bytearray(header + self.lacing + self.body)
+        struct.pack_into("<I", raw, 22, ogg_crc(bytes(raw)))
+        return bytes(raw)
+
+
+def parse_pages(data: bytes) -> List[OggPage]:
+    """Разбирает поток Ogg на страницы. ValueError — если это не Ogg."""
+    pages: List[OggPage] = []
+    pos = 0
+    while pos < len(data):
+        if data[pos:pos + 4] != b"OggS" or pos + _HEADER.size > len(data):
+            raise ValueError(f"not an Ogg page at offset {pos}")
+        _, _, htype, granule, serial, seq, _, nsegs = _HEADER.unpack_from(data, pos)
+        lacing_start = pos + _HEADER.size
+        lacing = data[lacing_start:lacing_start + nsegs]
+        body_len = sum(lacing)
+        body_start = lacing_start + nsegs
+        if body_start + body_len > len(data):
+            raise ValueError("truncated Ogg page")
+        pages.append(OggPage(htype, granule, serial, seq, bytes(lacing), data[body_start:body_start + body_len]))
+        pos = body_start + body_len
+    return pages
+
+
+@dataclass
+class OpusStream:
+    headers: List[OggPage]  # OpusHead + OpusTags
+    audio: List[OggPage]
+    pre_skip: int
+
+    @property
+    def duration(self) -> float:
+        last = next((p.granule for p in reversed(self.audio) if p.granule >= 0), 0)
+        return max(0.0, (last - self.pre_skip) / OPUS_RATE)
+
+
+def parse_opus(data: bytes) -> Optional[OpusStream]:
+    """Разбирает одноканальный поток Ogg/Opus; None — если формат не подходит для нарезки."""
+    try:
+        pages = parse_pages(data)
+    except ValueError:
+        return None
+    if len(pages) < 3 or not pages[0].body.startswith(b"OpusHead"):
+        return None
+    if len({p.serial for p in pages}) != 1:
+        return None  # мультиплексированные потоки не режем
+    pre_skip = struct.unpack_from("<H", pages[0].body, 10)[0] if len(pages[0].body) >= 12 else 0
+    # OpusTags может занимать несколько страниц и заканчивается на странице, где
+    # завершается его пакет; аудио по спецификации начинается с новой страницы
+    idx = 1
+    while idx < len(pages) and pages[idx].packets == 0:
+        idx += 1
+    headers = pages[:idx + 1]
+    audio = pages[idx + 1:]
+    if not audio:
+        return None
+    return OpusStream(headers=headers, audio=audio, pre_skip=pre_skip)
+
+
+def _page_loudness(page: OggPage) -> float:
+    """Средний размер пакета на странице: в паузах Opus отдаёт пакеты в единицы байт."""
+    return len(page.body) / max(1, page.packets)
+
+
+def _build_segment(stream: OpusStream, start: int, end: int, base_granule: int) -> bytes:
+    out = bytearray()
+    seq = 0
+    for page in stream.headers:
+        out += OggPage(page.header_type & ~FLAG_EOS, page.granule, page.serial, seq, page.lacing, page.body).to_bytes()
+        seq += 1
+    for i in range(start, end):
+        page = stream.audio[i]
+        htype = page.header_type & ~(FLAG_EOS | FLAG_BOS)
+        if i == end - 1:
+            htype |= FLAG_EOS
+        granule = page.granule - base_granule + stream.pre_skip if page.granule >= 0 else page.granule
+        out += OggPage(htype, granule, page.serial, seq, page.lacing, page.body).to_bytes()
+        seq += 1
+    return bytes(out)
+
+
+def split_opus(data: bytes, target_seconds: float, window: float = 0.25) -> List[tuple[bytes, float]]:
+    """Режет Ogg/Opus на сегменты около target_seconds; возвращает [(ogg, длительность, с)].
+
+    Разрез ищется в окне ±window·target вокруг целевой длины на самой «тихой» границе
+    страниц. Если поток не разбирается или короткий — один сегмент с исходными данными.
+    """
+    stream = parse_opus(data)
+    if stream is None:
+        return [(data, 0.0)]
+    total = stream.duration
+    if total <= target_seconds * (1 + window):
+        return [(data, total)]
+
+    # Конец каждой аудиостраницы в секундах от начала (по granule; -1 — пакет не завершён)
+    ends: List[Optional[float]] = [
+        (p.granule - stream.pre_skip) / OPUS_RATE if p.granule >= 0 else None for p in stream.audio
+    ]
+    segments: List[tuple[bytes, float]] = []
+    start = 0
+    start_time = 0.0
+    base_granule = stream.pre_skip
+    n = len(stream.audio)
+    while start < n:
+        remaining = (ends[-1] or total) - start_time
+        if remaining <= target_seconds * (1 + window):
+            cut = n
+        else:
+            lo, hi = start_time + target_seconds * (1 - window), start_time + target_seconds * (1 + window)
+            best, best_score = None, None
+            for i in range(start, n - 1):
+                t = ends[i]
+                if t is None or t < lo:
+                    continue
+                if t > hi:
+                    break
+                # Следующая страница должна начинаться с нового пакета; крошечный хвост не оставляем
+                if stream.audio[i + 1].continued or (ends[-1] or total) - t < target_seconds * window:
+                    continue
+                score = _page_loudness(stream.audio[i]) + _page_loudness(stream.audio[i + 1])
+                if best_score is None or score < best_score:
+                    best, best_score = i, score
+            if best is None:
+                # В окне нет подходящей границы — первая допустимая после него
+                best = next(
+                    (i for i in range(start, n - 1)
+                     if ends[i] is not None and ends[i] >= hi and not stream.audio[i + 1].continued),
+                    n - 1,
+                )
+            cut = best + 1
+        end_time = ends[cut - 1] if ends[cut - 1] is not None else total
+        segments.append((_build_segment(stream, start, cut, base_granule), max(0.0, end_time - start_time)))
+        if cut >= n:
+            break
+        base_granule = stream.audio[cut - 1].granule
+        start, start_time = cut, end_time
+    return segments
@@ -3,15 +3,32 @@ import asyncio
 from contextlib import asynccontextmanager
 from typing import Dict
 
-from openai import AsyncOpenAI
 from bot.config import settings
 
+
+class _LazyClient:
+    """Клиент OpenAI, который создаётся при первом запросе.
+
+    Импорт пакета openai занимает заметную долю времени запуска, а до первого
+    сообщения пользователя он не нужен.
+    """
+
+    _client = None
+
+    def __getattr__(self, name: str):
+        if self._client is None:
+            from openai import AsyncOpenAI
+
+            type(self)._client = AsyncOpenAI(
+                api_key=settings.openai_api_key,
+                timeout=settings.openai_timeout_seconds,  # Таймаут из настроек (по умолчанию 180 сек)
+                max_retries=settings.openai_max_retries  # Количество ретраев из настроек (по умолчанию 0)
+            )
+        return getattr(self._client, name)
+
+
 # Общий клиент OpenAI с настройками
-client = AsyncOpenAI(
-    api_key=settings.openai_api_key,
-    timeout=settings.openai_timeout_seconds,  # Таймаут из настроек (по умолчанию 180 сек)
-    max_retries=settings.openai_max_retries  # Количество ретраев из настроек (по умолчанию 0)
-)
+client = _LazyClient()
 
 # ——— Ограничение параллелизма ——————————————————————————————
 # Глобальный лимит параллельных запросов к OpenAI (на весь процесс)
@@ -2,14 +2,16 @@
 from typing import Any, Dict, List, Tuple
 import re
 import json
+import hashlib
+import uuid
 import asyncio
+import logging
 from datetime import datetime, timezone, timedelta
-import openai
-import pytz
 
 from bot.config import settings
-from bot.utils.db import get_conn, get_user_timezone, set_user_timezone
-from bot.utils.log import logger
+from bot.startup import lazy_module
+from bot.utils.db import get_conn, get_user_timezone, set_user_timezone, insert_reminders_bulk
+from bot.utils.log import lazy, logger
 from .base import client, oai_limiter
 from .models import ModelsManager
 from bot.utils.http_client import get_session  # may still be used elsewhere
@@ -19,6 +21,9 @@ from bot.utils.prompts import (
     build_per_request_system_prompt,
 )
 
+openai = lazy_module("openai")
+pytz = lazy_module("pytz")
+
 
 class ChatManager:
     """Управление чатом через OpenAI Responses API."""
@@ -120,96 +125,107 @@ class ChatManager:
         return None
 
     @staticmethod
-    async def _handle_schedule_reminder_tool(chat_id: int, user_id: int, args: Dict[str, Any]) -> Tuple[str | None, Dict[str, Any] | None]:
-        when = str(args.get("when", "")).strip()
-        text_val = str(args.get("text", "")).strip()
-        silent = args.get("silent")
+    def _prepare_reminder_row(chat_id: int, user_id: int, item: Any, idempotency_key: str) -> tuple | None:
+        """Проверяет и разбирает один элемент schedule_reminder(s) в строку для вставки.
+
+        Возвращает (chat_id, user_id, text, due_at, silent, meta_json, idempotency_key) или None.
+        """
+        if not isinstance(item, dict):
+            return None
+        when = str(item.get("when", "")).strip()
+        text_val = str(item.get("text", "")).strip()[:200]
+        if not when or not text_val:
+            return None
+        silent = item.get("silent")
         if silent is None:
             silent = settings.reminder_default_silent
         silent = bool(silent)
-        chain = args.get("chain") if isinstance(args, dict) else None
-        if not when or not text_val:
-            return None, None
         due_at_utc = ChatManager._parse_when_to_utc(when)
         if not due_at_utc:
-            return None, None
-        meta_json = ChatManager._build_meta_from_chain(chain, base_silent=silent)
+            return None
+        meta_json = ChatManager._build_meta_from_chain(item.get("chain"), base_silent=silent)
+        due_str = due_at_utc.strftime("%Y-%m-%d %H:%M:%S")
+        return (chat_id, user_id, text_val, due_str, int(silent), meta_json, idempotency_key)
+
+    @staticmethod
+    async def schedule_reminders_bulk(
+        chat_id: int, user_id: int, items: List[Any], request_key: str | None = None
+    ) -> List[Dict[str, Any]]:
+        """Создаёт пачку напоминаний: сначала разбор всех элементов, затем одна транзакция.
+
+        Невалидные элементы пропускаются. Возвращает созданные (или уже существовавшие
+        с тем же ключом) напоминания в порядке входных элементов.
+        request_key — идентификатор запроса, стабильный при повторах: call_id вызова
+        инструмента или id сообщения Telegram. Ключ идемпотентности строки — хэш
+        request_key и номера элемента, поэтому повторная обработка того же вызова
+        возвращает уже созданные напоминания, а одинаковые напоминания из разных
+        запросов не склеиваются. Без request_key защиты от повтора нет.
+        """
+        rows = []
+        for idx, it in enumerate(items):
+            if request_key:
+                digest = hashlib.sha256(f"{chat_id}|{user_id}|{request_key}|{idx}".encode("utf-8")).hexdigest()[:32]
+            else:
+                digest = uuid.uuid4().hex
+            row = ChatManager._prepare_reminder_row(chat_id, user_id, it, f"sched_{digest}")
+            if row:
+                rows.append(row)
+        if not rows:
+            return []
+        ids = await insert_reminders_bulk(rows)
+        created = [
+            {"reminder_id": ids.get(r[6]), "when_utc": r[3], "silent": bool(r[4]), "text": r[2]}
+            for r in rows
+        ]
+        logger.info("[tool] Запланировано напоминаний: %s chat=%s user=%s ids=%s",
+                    len(created), chat_id, user_id, [c["reminder_id"] for c in created])
+        return created
+
+    @staticmethod
+    async def _handle_schedule_reminder_tool(
+        chat_id: int, user_id: int, args: Dict[str, Any], request_key: str | None = None
+    ) -> Tuple[str | None, Dict[str, Any] | None]:
         try:
-            async with get_conn() as db:
-                cur = await db.execute(
-                    "INSERT INTO reminders(chat_id, user_id, text, due_at, silent, status, meta_json) VALUES (?, ?, ?, ?, ?, 'scheduled', ?)",
-                    (chat_id, user_id, text_val[:200], due_at_utc.strftime("%Y-%m-%d %H:%M:%S"), int(silent), meta_json),
-                )
-                await db.commit()
-                reminder_id = getattr(cur, 'lastrowid', None)
-            human_time_utc = due_at_utc.strftime("%Y-%m-%d %H:%M:%S")
-            user_tz = await get_user_timezone(user_id)
-            human_time_local = utc_to_user_local(human_time_utc, user_tz)
-            logger.info("[tool] Запланировано напоминание id=%s chat=%s user=%s due_at=%s silent=%s text=%r",
-                        reminder_id, chat_id, user_id, human_time_utc, silent, text_val)
-            ack = f"✅ Напоминание запланировано на {human_time_local} ({user_tz}): {text_val}"
-            tool_output = {
-                "ok": True,
-                "reminder_id": reminder_id,
-                "chat_id": chat_id,
-                "user_id": user_id,
-                "when_utc": human_time_utc,
-                "silent": silent,
-                "text": text_val,
-            }
-            return ack, tool_output
+            created = await ChatManager.schedule_reminders_bulk(chat_id, user_id, [args], request_key)
         except Exception as e:
             logger.warning(f"Не удалось создать напоминание из tool-call: {e}")
             return None, {"ok": False, "error": str(e)}
+        if not created:
+            return None, None
+        item = created[0]
+        user_tz = await get_user_timezone(user_id)
+        human_time_local = utc_to_user_local(item["when_utc"], user_tz)
+        ack = f"✅ Напоминание запланировано на {human_time_local} ({user_tz}): {item['text']}"
+        tool_output = {
+            "ok": True,
+            "reminder_id": item["reminder_id"],
+            "chat_id": chat_id,
+            "user_id": user_id,
+            "when_utc": item["when_utc"],
+            "silent": item["silent"],
+            "text": item["text"],
+        }
+        return ack, tool_output
 
     @staticmethod
-    async def _handle_schedule_reminders_tool(chat_id: int, user_id: int, args: Dict[str, Any]) -> Tuple[List[str], Dict[str, Any] | None]:
+    async def _handle_schedule_reminders_tool(
+        chat_id: int, user_id: int, args: Dict[str, Any], request_key: str | None = None
+    ) -> Tuple[List[str], Dict[str, Any] | None]:
         items = args.get("items")
         if not isinstance(items, list) or not items:
             return [], None
-        acks: List[str] = []
-        created: List[Dict[str, Any]] = []
-        user_tz = await get_user_timezone(user_id)
-        for it in items:
-            try:
-                if not isinstance(it, dict):
-                    continue
-                when = str(it.get("when", "")).strip()
-                text_val = str(it.get("text", "")).strip()
-                silent = it.get("silent")
-                if silent is None:
-                    silent = settings.reminder_default_silent
-                silent = bool(silent)
-                chain = it.get("chain") if isinstance(it, dict) else None
-                if not when or not text_val:
-                    continue
-                due_at_utc = ChatManager._parse_when_to_utc(when)
-                if not due_at_utc:
-                    continue
-                meta_json = ChatManager._build_meta_from_chain(chain, base_silent=silent)
-                async with get_conn() as db:
-                    cur = await db.execute(
-                        "INSERT INTO reminders(chat_id, user_id, text, due_at, silent, status, meta_json) VALUES (?, ?, ?, ?, ?, 'scheduled', ?)",
-                        (chat_id, user_id, text_val[:200], due_at_utc.strftime("%Y-%m-%d %H:%M:%S"), int(silent), meta_json),
-                    )
-                    await db.commit()
-                    reminder_id = getattr(cur, 'lastrowid', None)
-                human_time_utc = due_at_utc.strftime("%Y-%m-%d %H:%M:%S")
-                human_time_local = utc_to_user_local(human_time_utc, user_tz)
-                logger.info("[tool] Запланировано напоминание id=%s chat=%s user=%s due_at=%s silent=%s text=%r",
-                            reminder_id, chat_id, user_id, human_time_utc, silent, text_val)
-                acks.append(f"✅ Напоминание запланировано на {human_time_local} ({user_tz}): {text_val}")
-                created.append({
-                    "reminder_id": reminder_id,
-                    "when_utc": human_time_utc,
-                    "silent": silent,
-                    "text": text_val,
-                })
-            except Exception as e:
-                logger.warning(f"Не удалось создать одно из пакетных напоминаний: {e}")
-                continue
+        try:
+            created = await ChatManager.schedule_reminders_bulk(chat_id, user_id, items, request_key)
+        except Exception as e:
+            logger.warning(f"Не удалось создать пакет напоминаний: {e}")
+            return [], {"ok": False, "error": str(e)}
         if not created:
             return [], {"ok": False, "error": "no_valid_items"}
+        user_tz = await get_user_timezone(user_id)
+        acks = [
+            f"✅ Напоминание запланировано на {utc_to_user_local(c['when_utc'], user_tz)} ({user_tz}): {c['text']}"
+            for c in created
+        ]
         return acks, {"ok": True, "created": created, "count": len(created)}
 
     @staticmethod
@@ -260,8 +276,9 @@ class ChatManager:
                 if not target_ids:
                     return "ℹ️ Подходящих напоминаний не найдено.", {"ok": True, "canceled": [], "count": 0}
                 placeholders = ",".join(["?"] * len(target_ids))
+                # Ключ идемпотентности освобождаем: то же напоминание можно будет создать заново
                 await db.execute(
-                    f"UPDATE reminders SET status='canceled', executed_at=CURRENT_TIMESTAMP WHERE id IN ({placeholders})",
+                    f"UPDATE reminders SET status='canceled', executed_at=CURRENT_TIMESTAMP, idempotency_key=NULL WHERE id IN ({placeholders})",
                     (*target_ids,),
                 )
                 await db.commit()
@@ -357,7 +374,9 @@ class ChatManager:
                 )
                 if name == "schedule_reminder":
                     args = ChatManager._extract_args_dict(args_obj)
-                    ack, tool_out = await ChatManager._handle_schedule_reminder_tool(chat_id, user_id, args)
+                    ack, tool_out = await ChatManager._handle_schedule_reminder_tool(
+                        chat_id, user_id, args, f"call:{call_id}" if call_id else None
+                    )
                     if ack:
                         acks.append(ack)
                     if call_id and tool_out is not None:
@@ -368,7 +387,9 @@ class ChatManager:
                         })
                 elif name == "schedule_reminders":
                     args = ChatManager._extract_args_dict(args_obj)
-                    acks_list, tool_out = await ChatManager._handle_schedule_reminders_tool(chat_id, user_id, args)
+                    acks_list, tool_out = await ChatManager._handle_schedule_reminders_tool(
+                        chat_id, user_id, args, f"call:{call_id}" if call_id else None
+                    )
                     if acks_list:
                         acks.extend(acks_list)
                     if call_id and tool_out is not None:
@@ -422,7 +443,9 @@ class ChatManager:
                             )
                             if name2 == "schedule_reminder":
                                 args = ChatManager._extract_args_dict(args2)
-                                ack, tool_out = await ChatManager._handle_schedule_reminder_tool(chat_id, user_id, args)
+                                ack, tool_out = await ChatManager._handle_schedule_reminder_tool(
+                                    chat_id, user_id, args, f"call:{call_id2}" if call_id2 else None
+                                )
                                 if ack:
                                     acks.append(ack)
                                 if call_id2 and tool_out is not None:
@@ -433,7 +456,9 @@ class ChatManager:
                                     })
                             elif name2 == "schedule_reminders":
                                 args = ChatManager._extract_args_dict(args2)
-                                acks_list, tool_out = await ChatManager._handle_schedule_reminders_tool(chat_id, user_id, args)
+                                acks_list, tool_out = await ChatManager._handle_schedule_reminders_tool(
+                                    chat_id, user_id, args, f"call:{call_id2}" if call_id2 else None
+                                )
                                 if acks_list:
                                     acks.extend(acks_list)
                                 if call_id2 and tool_out is not None:
@@ -457,6 +482,51 @@ class ChatManager:
                 continue
         return acks, fc_outputs
 
+    @staticmethod
+    def _usage_cost(response: Any, model: str) -> Tuple[int, float]:
+        """(total_tokens, cost) ответа с учётом цены закешированных входных токенов."""
+        usage = getattr(response, "usage", None)
+        total_tokens = getattr(usage, "total_tokens", 0) if usage else 0
+        prices = ModelsManager.get_model_prices(getattr(response, "model", None) or model)
+        in_price = prices.get("input", settings.openai_price_per_1k_tokens)
+        out_price = prices.get("output", settings.openai_price_per_1k_tokens)
+        cached_price = prices.get("cached_input", in_price)
+        input_tokens = getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", None)
+        output_tokens = getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", None)
+        cached_input_tokens = getattr(usage, "cached_prompt_tokens", None) or getattr(usage, "cached_input_tokens", None)
+        if input_tokens is not None and output_tokens is not None:
+            cached_t = max(0, int(cached_input_tokens)) if cached_input_tokens is not None else 0
+            regular_t = max(0, int(input_tokens) - cached_t)
+            cost = (regular_t / 1000.0) * in_price + (cached_t / 1000.0) * cached_price + (int(output_tokens) / 1000.0) * out_price
+        else:
+            cost = total_tokens / 1000.0 * settings.openai_price_per_1k_tokens
+        return total_tokens, cost
+
+    @staticmethod
+    async def complete_stateless(chat_id: int, user_id: int, instructions: str, text: str,
+                                 model: str | None = None) -> str:
+        """Разовый запрос без цепочки диалога и инструментов (store=False).
+
+        История чата не меняется, стоимость учитывается как обычно. Занимает только
+        глобальный слот OpenAI, поэтому несколько таких запросов одного чата идут параллельно.
+        """
+        model = model or await ModelsManager.get_current_model()
+        async with oai_limiter(None):
+            response = await client.responses.create(
+                model=model,
+                instructions=instructions,
+                input=[{"type": "message", "role": "user", "content": text}],
+                store=False,
+            )
+        total_tokens, cost = ChatManager._usage_cost(response, model)
+        async with get_conn() as db:
+            await db.execute(
+                "INSERT INTO usage(chat_id, user_id, tokens, cost, model) VALUES (?, ?, ?, ?, ?)",
+                (chat_id, user_id, total_tokens, cost, getattr(response, "model", model)),
+            )
+            await db.commit()
+        return ChatManager._extract_text_from_output(response)
+
     @staticmethod
     async def responses_request(
         chat_id: int,
@@ -626,8 +696,11 @@ class ChatManager:
             if tool_choice:
                 request_params["tool_choice"] = tool_choice
 
-            if getattr(settings, "debug_mode", False):
-                logger.debug(f"[DEBUG] OpenAI REQUEST: {request_params}")
+            if logger.isEnabledFor(logging.DEBUG):
+                from bot.utils.image_input import redact_data_urls
+                # Сериализация запроса — в потоке записи логов; копия защищает от правок ниже
+                logger.debug("[DEBUG] OpenAI REQUEST: %s",
+                             lazy(lambda p: redact_data_urls(str(p)), dict(request_params)))
 
             # Выполняем запрос с лечением кейса незакрытых tool-calls без сброса истории
             try:
@@ -883,21 +956,7 @@ class ChatManager:
                 return f"❌ ПроизошлаUnexpected ошибка: {str(e)[:100]}..."
 
             # Первый шаг — usage/cost
-            usage1 = getattr(response, "usage", None)
-            total_tokens1 = getattr(usage1, "total_tokens", 0) if usage1 else 0
-            prices = ModelsManager.get_model_prices(getattr(response, "model", None) or current_model)
-            in_price = prices.get("input", settings.openai_price_per_1k_tokens)
-            out_price = prices.get("output", settings.openai_price_per_1k_tokens)
-            cached_price = prices.get("cached_input", in_price)
-            input_tokens1 = getattr(usage1, "prompt_tokens", None) or getattr(usage1, "input_tokens", None)
-            output_tokens1 = getattr(usage1, "completion_tokens", None) or getattr(usage1, "output_tokens", None)
-            cached_input_tokens1 = getattr(usage1, "cached_prompt_tokens", None) or getattr(usage1, "cached_input_tokens", None)
-            if input_tokens1 is not None and output_tokens1 is not None:
-                cached_t1 = max(0, int(cached_input_tokens1)) if cached_input_tokens1 is not None else 0
-                regular_t1 = max(0, int(input_tokens1) - cached_t1)
-                cost1 = (regular_t1 / 1000.0) * in_price + (cached_t1 / 1000.0) * cached_price + (int(output_tokens1) / 1000.0) * out_price
-            else:
-                cost1 = total_tokens1 / 1000.0 * settings.openai_price_per_1k_tokens
+            total_tokens1, cost1 = ChatManager._usage_cost(response, current_model)
 
             # Итеративно обрабатываем tool-calls и продолжаем до 3 шагов
             max_loops = 3
@@ -1,34 +1,83 @@
 """Управление файлами OpenAI."""
+import asyncio
+import contextlib
 import io
-import openai
-from bot.utils.log import logger
+import os
+import uuid
+import weakref
+from typing import BinaryIO
+from bot.startup import lazy_module
+from bot.utils.log import lazy, logger
 from .base import client, oai_limiter
 
+openai = lazy_module("openai")
+
+CLAIM_POLL_SECONDS = 0.5
+# Захват старше этого считается брошенным упавшим процессом; загрузка до 100 МБ укладывается
+CLAIM_STALE_SECONDS = 600
+
+# Внутри процесса одновременные операции с одним содержимым ждут друг друга на замке,
+# а между процессами (WORKERS > 1) — на строке в openai_file_claims
+_hash_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _hash_lock(sha256: str) -> asyncio.Lock:
+    lock = _hash_locks.get(sha256)
+    if lock is None:
+        lock = asyncio.Lock()
+        _hash_locks[sha256] = lock
+    return lock
+
+
+@contextlib.asynccontextmanager
+async def _hash_claim(sha256: str):
+    """Исключительный доступ к содержимому sha256 во всех процессах бота.
+
+    Повторная загрузка ждёт первую и переиспользует её file_id, а уборка не удалит
+    файл, пока его берёт другой чат.
+    """
+    from bot.utils.db import claim_openai_file_hash, release_openai_file_hash
+
+    owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+    async with _hash_lock(sha256):
+        while not await claim_openai_file_hash(sha256, owner, CLAIM_STALE_SECONDS):
+            await asyncio.sleep(CLAIM_POLL_SECONDS)
+        try:
+            yield
+        finally:
+            await asyncio.shield(release_openai_file_hash(sha256, owner))
+
 
 class FilesManager:
     """Управление файлами OpenAI."""
     
     @staticmethod
-    async def upload_file(file_data: bytes, filename: str, purpose: str = "user_data", chat_id: int | None = None) -> str:
-        """Загружает файл в OpenAI, возвращает file_id и сохраняет его в БД если chat_id указан."""
+    async def _upload(file_data: bytes | BinaryIO, filename: str, purpose: str, chat_id: int | None,
+                      sha256: str | None, size: int | None) -> str:
+        """Загружает файл в OpenAI без проверки дублей."""
         async with oai_limiter(chat_id):
             logger.info(f"Загружаем файл {filename} в OpenAI")
-            file_obj = io.BytesIO(file_data)
-            file_obj.name = filename
+            if isinstance(file_data, (bytes, bytearray)):
+                file_obj = io.BytesIO(file_data)
+                file_obj.name = filename
+                upload = file_obj
+            else:
+                file_data.seek(0)
+                upload = (filename or "upload", file_data)
             try:
                 file_response = await client.files.create(
-                    file=file_obj,
+                    file=upload,
                     purpose=purpose
                 )
                 logger.info(f"Файл загружен с ID: {file_response.id}")
                 
                 if chat_id is not None:
                     from bot.utils.db import save_openai_file_id
-                    await save_openai_file_id(chat_id, file_response.id)
+                    await save_openai_file_id(chat_id, file_response.id, sha256=sha256, size=size)
                 
                 from bot.config import settings
                 if getattr(settings, "debug_mode", False):
-                    logger.info(f"[DEBUG] UPLOAD FILE RESPONSE: {file_response}")
+                    logger.info("[DEBUG] UPLOAD FILE RESPONSE: %s", lazy(repr, file_response))
                 
                 return file_response.id
             except openai.BadRequestError as e:
@@ -42,19 +91,76 @@ class FilesManager:
                 raise
 
     @staticmethod
-    async def delete_files_by_chat(chat_id: int):
-        """Удаляет все файлы, загруженные этим чатом в OpenAI, и очищает их из БД."""
-        from bot.utils.db import get_openai_file_ids_by_chat, delete_openai_file_ids_by_chat
-        
-        file_ids = await get_openai_file_ids_by_chat(chat_id)
-        deleted = 0
-        
-        for file_id in file_ids:
+    async def reuse_by_hash(sha256: str, size: int, chat_id: int | None) -> str | None:
+        """Возвращает file_id ранее загруженного файла с тем же содержимым, если он ещё жив в OpenAI."""
+        from bot.utils.db import find_openai_file_by_hash, save_openai_file_id, delete_openai_file_refs
+
+        file_id = await find_openai_file_by_hash(sha256, size)
+        if not file_id:
+            return None
+        try:
+            async with oai_limiter(chat_id):
+                await client.files.retrieve(file_id)
+        except openai.NotFoundError:
+            # Файл удалён в OpenAI (вручную или по сроку) — ссылки на него больше не нужны
+            logger.info(f"Файл {file_id} больше не существует в OpenAI, загружаем заново")
+            await delete_openai_file_refs(file_id)
+            return None
+        except Exception as e:
+            logger.warning(f"Не удалось проверить файл {file_id}: {e}")
+            return None
+        if chat_id is not None:
+            await save_openai_file_id(chat_id, file_id, sha256=sha256, size=size)
+        logger.info(f"Повторно используем файл {file_id} (sha256={sha256[:12]}…, {size} байт)")
+        return file_id
+
+    @staticmethod
+    async def upload_file(file_data: bytes | BinaryIO, filename: str, purpose: str = "user_data", chat_id: int | None = None,
+                          sha256: str | None = None, size: int | None = None) -> str:
+        """Загружает файл в OpenAI, возвращает file_id и сохраняет его в БД если chat_id указан.
+
+        file_data — байты или открытый файловый объект (например, буфер `download_to_spool`):
+        объект передаётся в SDK как есть и читается порциями при отправке, без копии в памяти.
+        Если передан sha256 (и size), сначала ищется уже загруженный файл с тем же содержимым.
+        """
+        if not sha256 or size is None:
+            return await FilesManager._upload(file_data, filename, purpose, chat_id, sha256, size)
+        async with _hash_claim(sha256):
+            file_id = await FilesManager.reuse_by_hash(sha256, size, chat_id)
+            if file_id:
+                return file_id
+            return await FilesManager._upload(file_data, filename, purpose, chat_id, sha256, size)
+
+    @staticmethod
+    async def delete_files_by_chat(chat_id: int) -> int:
+        """Отвязывает файлы чата и ставит осиротевшие в фоновую очередь удаления.
+
+        Сами запросы к OpenAI выполняет задача `openai_file_gc` (параллельно, с повторами),
+        поэтому /reset не ждёт N последовательных HTTP-вызовов. Файл, на который ссылаются
+        другие чаты, остаётся. Возвращает число файлов, поставленных в очередь.
+        """
+        from bot.utils.db import release_openai_files
+
+        queued = await release_openai_files(chat_id=chat_id)
+        logger.info(f"Файлов OpenAI чата {chat_id} поставлено в очередь удаления: {queued}")
+        return queued
+
+    @staticmethod
+    async def delete_remote(file_id: str, sha256: str | None = None) -> bool:
+        """Удаляет файл в OpenAI, если на него снова не появились ссылки.
+
+        Проверка ссылок и удаление идут под тем же захватом sha256, что и повторное
+        использование файла (общим для всех процессов), поэтому файл не удалится в момент,
+        когда его берёт другой чат.
+        False — файл снова используется и удалять его не нужно.
+        """
+        from bot.utils.db import count_openai_file_refs
+
+        async with (_hash_claim(sha256) if sha256 else contextlib.nullcontext()):
+            if await count_openai_file_refs(file_id) > 0:
+                return False
             try:
                 await client.files.delete(file_id)
-                deleted += 1
-            except Exception as e:
-                logger.error(f"Ошибка удаления файла {file_id} из OpenAI: {e}")
-        
-        await delete_openai_file_ids_by_chat(chat_id)
-        logger.info(f"Удалено {deleted} файлов OpenAI для чата {chat_id}")
\ No newline at end of file
+            except openai.NotFoundError:
+                logger.info(f"Файл {file_id} уже удалён в OpenAI")
+            return True
@@ -1,6 +1,7 @@
 """Модели и текущая модель для OpenAI."""
 from __future__ import annotations
-from typing import List, Dict, Tuple
+import time
+from typing import List, Dict, Optional, Tuple
 from bot.utils.db import get_conn
 from bot.config import settings
 
@@ -10,6 +11,10 @@ class ModelsManager:
 
     DEFAULT_MODEL = "gpt-4o-mini"
     SETTINGS_KEY = "current_model"
+    # Текущая модель читается на каждый запрос; кэш короткий, чтобы смена модели
+    # дошла и до других воркеров (WORKERS > 1)
+    CURRENT_MODEL_TTL = 30.0
+    _current: Optional[Tuple[str, float]] = None
 
     # Цены за 1k токенов (USD). Основано на публичном прайсе OpenAI (обновлено 2025‑08‑12).
     # Для некоторых моделей есть скидка на закешированные входные токены (cached_input).
@@ -24,6 +29,21 @@ class ModelsManager:
         "gpt-5-nano": {"input": 0.00005, "cached_input": 0.000005, "output": 0.00040},
     }
 
+    # Размер контекстного окна (токены) — для нарезки больших документов
+    CONTEXT_TOKENS: Dict[str, int] = {
+        "gpt-4o-mini": 128_000,
+        "gpt-4o": 128_000,
+        "gpt-5": 400_000,
+        "gpt-5-mini": 400_000,
+        "gpt-5-nano": 400_000,
+    }
+    DEFAULT_CONTEXT_TOKENS = 128_000
+
+    @staticmethod
+    def get_context_tokens(model: str) -> int:
+        """Контекстное окно модели; для неизвестной — консервативный дефолт."""
+        return ModelsManager.CONTEXT_TOKENS.get(model, ModelsManager.DEFAULT_CONTEXT_TOKENS)
+
     @staticmethod
     async def get_available_models() -> List[Dict[str, str]]:
         """Возвращает список доступных моделей с id и описанием.
@@ -39,15 +59,18 @@ class ModelsManager:
 
     @staticmethod
     async def get_current_model() -> str:
+        cached = ModelsManager._current
+        if cached is not None and time.monotonic() - cached[1] < ModelsManager.CURRENT_MODEL_TTL:
+            return cached[0]
         async with get_conn() as db:
             cur = await db.execute(
                 "SELECT value FROM bot_settings WHERE key = ? LIMIT 1",
                 (ModelsManager.SETTINGS_KEY,),
             )
             row = await cur.fetchone()
-            if not row or not row[0]:
-                return ModelsManager.DEFAULT_MODEL
-            return row[0]
+        model = row[0] if row and row[0] else ModelsManager.DEFAULT_MODEL
+        ModelsManager._current = (model, time.monotonic())
+        return model
 
     @staticmethod
     async def set_current_model(model_id: str) -> None:
@@ -62,6 +85,7 @@ class ModelsManager:
                 (ModelsManager.SETTINGS_KEY, model_id),
             )
             await db.commit()
+        ModelsManager._current = (model_id, time.monotonic())
 
     @staticmethod
     def get_model_pricing(model: str) -> Tuple[float, float]:
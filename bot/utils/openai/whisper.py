@@ -1,27 +1,92 @@
 """Распознавание речи через Whisper."""
+import asyncio
 import io
+
+from bot.config import settings
 from bot.utils.log import logger
-from .base import client, oai_limiter
+from bot.utils.ogg import split_opus
+from .base import client
+
+# Отдельная полоса параллельности для Whisper: длинная расшифровка не занимает
+# слоты чата и глобальный лимит запросов к модели
+_WHISPER_LANE = asyncio.Semaphore(max(1, settings.whisper_concurrency))
+
+# Вставляется на место сегмента, который не удалось распознать и после повтора
+GAP_MARKER = "[…фрагмент не распознан…]"
 
 
 class WhisperManager:
     """Управление распознаванием речи через Whisper."""
-    
+
     @staticmethod
-    async def transcribe_audio(audio_file: io.BytesIO, chat_id: int, user_id: int) -> str:
-        """Распознаёт речь с помощью OpenAI Whisper и возвращает текст."""
-        async with oai_limiter(chat_id):
-            try:
-                logger.info(f"Отправка аудио в Whisper для chat_id={chat_id}, user_id={user_id}")
-                audio_file.seek(0)
-                transcript = await client.audio.transcriptions.create(
-                    file=audio_file,
-                    model="whisper-1",
-                    response_format="text",
-                    language="ru"
-                )
-                logger.info(f"Whisper результат: {transcript}")
-                return transcript
-            except Exception as e:
-                logger.error(f"Ошибка Whisper: {e}")
-                raise
\ No newline at end of file
+    async def _record_usage(chat_id: int, user_id: int, seconds: float) -> None:
+        """Учёт стоимости одного запроса к Whisper по фактической длительности аудио."""
+        from bot.utils.db import get_conn
+
+        cost = seconds / 60 * settings.whisper_price
+        async with get_conn() as db:
+            await db.execute(
+                "INSERT INTO usage(chat_id, user_id, tokens, cost, model) VALUES (?, ?, ?, ?, ?)",
+                (chat_id, user_id, 0, cost, "whisper-1")
+            )
+            await db.commit()
+
+    @staticmethod
+    async def _transcribe_segment(data: bytes, index: int, chat_id: int, user_id: int, seconds: float) -> str:
+        audio_file = io.BytesIO(data)
+        audio_file.name = f"voice_{index}.ogg"
+        async with _WHISPER_LANE:
+            transcript = await client.audio.transcriptions.create(
+                file=audio_file,
+                model="whisper-1",
+                response_format="text",
+                language="ru"
+            )
+        await WhisperManager._record_usage(chat_id, user_id, seconds)
+        return str(transcript or "").strip()
+
+    @staticmethod
+    async def transcribe_audio(audio_file: io.BytesIO, chat_id: int, user_id: int, duration: float | None = None) -> str:
+        """Распознаёт речь с помощью OpenAI Whisper и возвращает текст.
+
+        Длинное Ogg/Opus-аудио режется по границам страниц рядом с паузами на сегменты
+        около WHISPER_SEGMENT; сегменты распознаются параллельно и склеиваются по порядку.
+        Стоимость учитывается отдельно для каждого запроса. duration — длительность из
+        Telegram, если её не удалось определить по самому файлу.
+
+        Упавший сегмент повторяется один раз; если и повтор не удался, на его месте в
+        тексте остаётся GAP_MARKER — уже оплаченные сегменты не выбрасываются. Исключение
+        поднимается, только если не распознан ни один сегмент.
+        """
+        try:
+            logger.info(f"Отправка аудио в Whisper для chat_id={chat_id}, user_id={user_id}")
+            audio_file.seek(0)
+            data = audio_file.read()
+            # Разбор и пересчёт CRC — чистый Python, уводим из event loop
+            segments = await asyncio.to_thread(split_opus, data, float(settings.whisper_segment_seconds))
+            if len(segments) > 1:
+                logger.info(f"Whisper: аудио разбито на {len(segments)} сегм. для chat_id={chat_id}")
+            jobs = [
+                (seg, i, chat_id, user_id, seconds or (duration if len(segments) == 1 else 0.0) or 0.0)
+                for i, (seg, seconds) in enumerate(segments)
+            ]
+            parts = await asyncio.gather(
+                *(WhisperManager._transcribe_segment(*job) for job in jobs), return_exceptions=True
+            )
+            for i, part in enumerate(parts):
+                if isinstance(part, BaseException):
+                    logger.warning(f"Whisper: сегмент {i} не распознан ({part}), повторяю")
+                    try:
+                        parts[i] = await WhisperManager._transcribe_segment(*jobs[i])
+                    except Exception as e:
+                        logger.warning(f"Whisper: сегмент {i} не распознан и после повтора: {e}")
+                        parts[i] = e
+            failed = [p for p in parts if isinstance(p, BaseException)]
+            if len(failed) == len(parts):
+                raise failed[0]
+            transcript = " ".join(GAP_MARKER if isinstance(p, BaseException) else p for p in parts if p)
+            logger.info(f"Whisper результат: {transcript}")
+            return transcript
+        except Exception as e:
+            logger.error(f"Ошибка Whisper: {e}")
+            raise
@@ -0,0 +1,256 @@
+"""Единый исходящий канал в Telegram: лимиты отправки, RetryAfter, склейка правок и приоритеты.
+
+Подключается как request-middleware сессии бота, поэтому через него проходят все
+вызовы отправки — `bot.send_message`, `message.answer`, `edit_message_text` и т.д.
+Ограничения Telegram: ~30 сообщений/с на бота и ~1 сообщение/с в один чат.
+Глобальный лимит — на бота целиком, поэтому при WORKERS > 1 воркеры делят
+TELEGRAM_GLOBAL_RATE поровну; лимит чата не делится — чат обслуживает один воркер.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    CopyMessage,
+    EditMessageCaption,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    ForwardMessage,
+    SendAnimation,
+    SendAudio,
+    SendDocument,
+    SendMediaGroup,
+    SendMessage,
+    SendPhoto,
+    SendSticker,
+    SendVideo,
+    SendVoice,
+    TelegramMethod,
+)
+
+from bot.config import settings
+from bot.utils import shards
+from bot.utils.log import logger
+
+
+class Priority(IntEnum):
+    """Приоритет исходящего сообщения: меньше — раньше."""
+    USER_REPLY = 0
+    NOTIFICATION = 1
+    PROGRESS = 2
+
+
+# Методы, которые расходуют лимиты отправки Telegram
+_RATE_LIMITED = (
+    SendMessage, SendPhoto, SendDocument, SendVoice, SendAudio, SendVideo, SendAnimation,
+    SendSticker, SendMediaGroup, CopyMessage, ForwardMessage,
+    EditMessageText, EditMessageCaption, EditMessageReplyMarkup,
+)
+
+CHAT_BURST = 3  # короткий всплеск в один чат без ожидания
+MAX_CHAT_BUCKETS = 10000  # после этого неактивные корзины чатов вычищаются
+
+_priority: ContextVar[int] = ContextVar("outbound_priority", default=Priority.USER_REPLY)
+
+
+@contextmanager
+def outbound_priority(priority: Priority):
+    """Задаёт приоритет для всех отправок внутри блока (в текущем контексте задачи)."""
+    token = _priority.set(int(priority))
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def set_outbound_priority(priority: Priority) -> None:
+    """Задаёт приоритет до конца текущей задачи (у каждой asyncio-задачи своя копия контекста)."""
+    _priority.set(int(priority))
+
+
+class TokenBucket:
+    """Корзина токенов с резервированием: reserve() сразу списывает токен и возвращает,
+    сколько секунд нужно подождать до его фактической доступности."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = max(0.01, float(rate))
+        self.capacity = max(1.0, float(capacity))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1.0
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def time_until_token(self) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        wait = (1.0 - self.tokens) / self.rate if self.tokens < 1.0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def take(self) -> None:
+        self._refill(time.monotonic())
+        self.tokens -= 1.0
+
+    def refund(self) -> None:
+        self.tokens = min(self.capacity, self.tokens + 1.0)
+
+    def block(self, seconds: float) -> None:
+        self.blocked_until = max(self.blocked_until, time.monotonic() + max(0.0, seconds))
+
+    def is_idle(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+
+class _PriorityGate:
+    """Глобальная очередь отправки: выдаёт токены глобальной корзины в порядке приоритета."""
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self._heap: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def pending(self) -> int:
+        return sum(1 for _, _, fut in self._heap if not fut.done())
+
+    async def acquire(self, priority: int) -> None:
+        loop = asyncio.get_running_loop()
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run(), name="outbound_gate")
+        fut = loop.create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), fut))
+        self._wakeup.set()
+        await fut
+
+    async def _run(self) -> None:
+        while True:
+            while not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            delay = self.bucket.time_until_token()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, fut = heapq.heappop(self._heap)
+            if fut.done():
+                # Отправитель отменён, пока ждал очереди
+                continue
+            self.bucket.take()
+            fut.set_result(None)
+
+
+class OutboundMiddleware(BaseRequestMiddleware):
+    """Request-middleware: пропускает отправки через корзины токенов и обрабатывает RetryAfter."""
+
+    def __init__(
+        self,
+        global_rate: Optional[float] = None,
+        chat_rate: Optional[float] = None,
+        retry_max: Optional[int] = None,
+    ):
+        if global_rate is None:
+            global_rate = settings.telegram_global_rate / shards.SHARD_COUNT
+        self.global_rate = float(global_rate)
+        self.chat_rate = float(chat_rate if chat_rate is not None else settings.telegram_chat_rate)
+        self.retry_max = int(retry_max if retry_max is not None else settings.telegram_retry_max)
+        self._gate = _PriorityGate(TokenBucket(self.global_rate, self.global_rate))
+        self._chats: Dict[Any, TokenBucket] = {}
+        # Версии ожидающих правок: более новая правка того же сообщения отменяет старую
+        self._edit_versions: Dict[Tuple[Any, int], int] = {}
+        self.stats = {"sent": 0, "coalesced": 0, "retry_after": 0}
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                for key in [k for k, b in self._chats.items() if b.is_idle()]:
+                    self._chats.pop(key, None)
+            bucket = TokenBucket(self.chat_rate, CHAT_BURST)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def pending(self) -> int:
+        """Сколько отправок сейчас ждут глобальной очереди."""
+        return self._gate.pending()
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Any:
+        if not isinstance(method, _RATE_LIMITED):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        edit_key: Optional[Tuple[Any, int]] = None
+        version = 0
+        if isinstance(method, EditMessageText) and chat_id is not None and method.message_id is not None:
+            edit_key = (chat_id, method.message_id)
+            version = self._edit_versions.get(edit_key, 0) + 1
+            self._edit_versions[edit_key] = version
+
+        def _superseded() -> bool:
+            return edit_key is not None and self._edit_versions.get(edit_key) != version
+
+        priority = _priority.get()
+        try:
+            attempt = 0
+            while True:
+                if chat_id is not None:
+                    bucket = self._chat_bucket(chat_id)
+                    wait = bucket.reserve()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    if _superseded():
+                        bucket.refund()
+                        self.stats["coalesced"] += 1
+                        return True
+                await self._gate.acquire(priority)
+                if _superseded():
+                    self.stats["coalesced"] += 1
+                    return True
+                try:
+                    result = await make_request(bot, method)
+                    self.stats["sent"] += 1
+                    return result
+                except TelegramRetryAfter as e:
+                    self.stats["retry_after"] += 1
+                    if attempt >= self.retry_max:
+                        raise
+                    attempt += 1
+                    logger.warning(
+                        f"[outbound] RetryAfter {e.retry_after}s for {type(method).__name__} "
+                        f"chat={chat_id} (попытка {attempt}/{self.retry_max})"
+                    )
+                    if chat_id is not None:
+                        self._chat_bucket(chat_id).block(e.retry_after)
+                    else:
+                        self._gate.bucket.block(e.retry_after)
+        finally:
+            if edit_key is not None and self._edit_versions.get(edit_key) == version:
+                self._edit_versions.pop(edit_key, None)
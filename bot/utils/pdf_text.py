@@ -0,0 +1,93 @@
+"""Извлечение текста из PDF в отдельном процессе.
+
+pypdf — опциональная зависимость (`poetry install -E documents`). Разбор PDF —
+чистый Python и на больших документах занимает секунды, поэтому он выполняется в
+пуле процессов и не блокирует event loop и GIL основного процесса.
+
+Дочерний процесс запускается через spawn (fork процесса с потоками aiosqlite и
+записи логов может зависнуть на унаследованной блокировке) и читает PDF сам из
+временного файла — содержимое документа не копируется в память и не передаётся
+через pipe. Упавший пул (нехватка памяти, крах на битом PDF) пересоздаётся.
+"""
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import BinaryIO, List, Optional
+
+from bot.utils.log import logger
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def is_available() -> bool:
+    """Установлен ли pypdf (без импорта в основном процессе)."""
+    return importlib.util.find_spec("pypdf") is not None
+
+
+def _extract_pages(path: str) -> List[str]:
+    """Текст каждой страницы (выполняется в дочернем процессе)."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    pages: List[str] = []
+    for page in reader.pages:
+        try:
+            pages.append(page.extract_text() or "")
+        except Exception:
+            # Битая страница не должна ронять весь документ
+            pages.append("")
+    return pages
+
+
+def _spill(file: BinaryIO) -> str:
+    """Копирует буфер документа во временный файл на диске и возвращает путь."""
+    file.seek(0)
+    with tempfile.NamedTemporaryFile(prefix="gpttg-", suffix=".pdf", delete=False) as tmp:
+        shutil.copyfileobj(file, tmp)
+    file.seek(0)
+    return tmp.name
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+async def extract_pdf_pages(file: BinaryIO) -> List[str]:
+    """Возвращает текст PDF из буфера `file` постранично; ImportError — если pypdf не установлен."""
+    global _executor
+    if not is_available():
+        raise ImportError("pypdf is not installed")
+    path = await asyncio.to_thread(_spill, file)
+    executor = _get_executor()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, _extract_pages, path)
+    except BrokenProcessPool:
+        # Следующий документ получит новый процесс, а не ту же ошибку до рестарта бота
+        logger.warning("Процесс извлечения текста из PDF упал — пул будет пересоздан")
+        if _executor is executor:
+            _executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def shutdown() -> None:
+    """Останавливает пул процессов (при завершении бота)."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
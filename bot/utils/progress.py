@@ -1,69 +1,213 @@
-"""Утилиты для отображения индикаторов прогресса."""
+"""Индикация обработки запросов: единый менеджер вместо цикла правок на каждый запрос.
+
+Сначала пользователь видит только «печатает…» (`sendChatAction`) — это не расходует
+лимиты отправки. Если ответ не готов за PROGRESS_PLACEHOLDER_DELAY, появляется
+сообщение-заглушка; оно обновляется всё реже по мере ожидания, а общий поток правок
+всех чатов ограничен PROGRESS_EDIT_RATE в секунду (при нехватке бюджета правка
+просто пропускается). Готовый ответ записывается в саму заглушку — без удаления и
+повторной отправки.
+"""
 
 import asyncio
-from bot.utils.log import logger
+import time
+from typing import Dict, List, Optional
+
+from aiogram.types import Message
+
 from bot.config import settings
+from bot.utils.html import split_long_html_message
+from bot.utils.log import logger
+from bot.utils.outbound import Priority, TokenBucket, set_outbound_priority
 
-async def show_progress_indicator(bot, chat_id, max_time: int | None = None, interval=2, message="Обрабатываю ваш запрос"):
-    """
-    Показывает индикатор загрузки для aiogram 3.x
-    
-    Args:
-        bot: Экземпляр бота aiogram
-        chat_id: ID чата для отправки сообщения
-        max_time: Максимальное время ожидания в секундах
-        interval: Интервал обновления индикатора в секундах
-        message: Текст сообщения для отображения
-    """
-    indicators = ["⏳", "🔄", "⌛", "🤔", "💭", "🧠"]
-    waiting_msg = None
-    
-    # Если max_time не задан — вычисляем умный дефолт: таймаут OpenAI + 30 сек буфера
-    if max_time is None:
-        try:
-            max_time = int(getattr(settings, "openai_timeout_seconds", 180)) + 30
-        except Exception:
-            max_time = 210
-    
-    try:
-        # Сначала отправляем сообщение о начале обработки
-        waiting_msg = await bot.send_message(
-            chat_id=chat_id, 
-            text=f"{message}... ⏳"
+INDICATORS = ["⏳", "🔄", "⌛", "🤔", "💭", "🧠"]
+TICK_SECONDS = 0.5
+TYPING_REFRESH_SECONDS = 4.5  # «печатает…» гаснет через 5 секунд
+# (ожидание, с; интервал обновления, с): чем дольше ждём, тем реже правим
+REFRESH_STEPS = ((30, 5), (90, 10), (float("inf"), 20))
+
+
+def _refresh_interval(elapsed: float) -> float:
+    for limit, interval in REFRESH_STEPS:
+        if elapsed < limit:
+            return interval
+    return REFRESH_STEPS[-1][1]
+
+
+class ProgressHandle:
+    """Индикатор одного запроса. Создаётся через `start_progress()` или `async with`."""
+
+    def __init__(self, bot, chat_id: int, message: str, max_time: int):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message = message
+        self.max_time = max_time
+        self.started = time.monotonic()
+        self.message_id: Optional[int] = None
+        self.closed = False
+        self._next_typing = 0.0
+        self._next_edit = 0.0
+        self._edits = 0
+        self._op: Optional[asyncio.Task] = None
+        self._op_kind: Optional[str] = None
+
+    # — вызывается менеджером —
+    def _due(self, now: float) -> Optional[str]:
+        if self.closed or (self._op is not None and not self._op.done()):
+            return None
+        elapsed = now - self.started
+        if self.message_id is None:
+            if elapsed >= settings.progress_placeholder_delay_seconds:
+                return "placeholder"
+            if now >= self._next_typing:
+                return "typing"
+            return None
+        if elapsed < self.max_time and now >= self._next_edit:
+            return "edit"
+        return None
+
+    async def _typing(self) -> None:
+        self._next_typing = time.monotonic() + TYPING_REFRESH_SECONDS
+        await self.bot.send_chat_action(chat_id=self.chat_id, action="typing")
+
+    async def _placeholder(self) -> None:
+        set_outbound_priority(Priority.PROGRESS)
+        msg = await self.bot.send_message(chat_id=self.chat_id, text=f"{self.message}... ⏳")
+        self.message_id = msg.message_id
+        self._next_edit = time.monotonic() + _refresh_interval(time.monotonic() - self.started)
+
+    async def _edit(self) -> None:
+        set_outbound_priority(Priority.PROGRESS)
+        now = time.monotonic()
+        elapsed = now - self.started
+        self._next_edit = now + _refresh_interval(elapsed)
+        self._edits += 1
+        await self.bot.edit_message_text(
+            text=f"{self.message}... {INDICATORS[self._edits % len(INDICATORS)]}\n"
+                 f"Прошло {int(elapsed)} сек. Пожалуйста, подождите.",
+            chat_id=self.chat_id,
+            message_id=self.message_id,
         )
-        
-        # Затем периодически обновляем его, чтобы показать прогресс
-        max_cycles = max(1, max_time // interval)
-        for i in range(max_cycles):
-            await asyncio.sleep(interval)
-            current_indicator = indicators[i % len(indicators)]
-            seconds = (i + 1) * interval
-            
-            # Обновляем сообщение разными индикаторами
-            await bot.edit_message_text(
-                text=f"{message}... {current_indicator}\n"
-                     f"Прошло {seconds} сек. Пожалуйста, подождите.",
-                chat_id=chat_id,
-                message_id=waiting_msg.message_id
-            )
-    except asyncio.CancelledError:
-        # Задача была отменена, значит ответ готов
-        if waiting_msg:
+
+    async def _settle(self) -> None:
+        """Ждёт завершения текущей операции менеджера (отправки заглушки или правки)."""
+        self.closed = True
+        _manager.discard(self)
+        op = self._op
+        if op is None or op.done():
+            return
+        if self._op_kind == "edit":
+            # Правка прогресса больше не нужна: ответ всё равно перезапишет заглушку
+            op.cancel()
+        try:
+            await asyncio.shield(op)
+        except (asyncio.CancelledError, Exception):
+            pass
+
+    # — публичный интерфейс —
+    async def finish(self, message: Message, text: str, max_length: int = 4096) -> None:
+        """Отправляет HTML-ответ; первая часть занимает место заглушки, если она уже показана."""
+        await self._settle()
+        chunks = [c for c in split_long_html_message(text or "", max_length) if c.strip()]
+        if not chunks:
+            await self.close()
+            return
+        if self.message_id is not None:
             try:
-                await bot.delete_message(chat_id=chat_id, message_id=waiting_msg.message_id)
-            except asyncio.CancelledError:
-                pass
-            except Exception:
-                pass
-    except Exception as e:
-        logger.error(f"Ошибка в индикаторе прогресса: {e}")
-        await _safe_delete_message(bot, chat_id, waiting_msg)
-
-
-async def _safe_delete_message(bot, chat_id, waiting_msg):
-    """Безопасное удаление сообщения с логированием."""
-    if waiting_msg:
+                await self.bot.edit_message_text(
+                    text=chunks[0], chat_id=self.chat_id, message_id=self.message_id, parse_mode="HTML"
+                )
+                self.message_id = None
+                chunks = chunks[1:]
+            except Exception as e:
+                logger.debug(f"Заглушку не удалось заменить ответом: {e}")
+                await self.close()
+        for chunk in chunks:
+            await message.answer(chunk, parse_mode="HTML")
+
+    async def close(self) -> None:
+        """Останавливает индикатор и убирает заглушку, если ответ в неё не записан."""
+        await self._settle()
+        if self.message_id is None:
+            return
+        message_id, self.message_id = self.message_id, None
         try:
-            await bot.delete_message(chat_id=chat_id, message_id=waiting_msg.message_id)
+            await self.bot.delete_message(chat_id=self.chat_id, message_id=message_id)
         except Exception as e:
-            logger.debug(f"Не удалось удалить сообщение прогресса: {e}")
\ No newline at end of file
+            logger.debug(f"Не удалось удалить сообщение прогресса: {e}")
+
+    async def __aenter__(self) -> "ProgressHandle":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+
+class _ProgressManager:
+    """Один фоновый цикл на все активные индикаторы и общий бюджет правок."""
+
+    def __init__(self):
+        self._active: Dict[int, ProgressHandle] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._budget: Optional[TokenBucket] = None
+
+    def add(self, handle: ProgressHandle) -> None:
+        self._active[id(handle)] = handle
+        if self._budget is None:
+            rate = max(0.1, settings.progress_edit_rate)
+            self._budget = TokenBucket(rate, rate)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="progress_manager")
+
+    def discard(self, handle: ProgressHandle) -> None:
+        self._active.pop(id(handle), None)
+
+    def __len__(self) -> int:
+        return len(self._active)
+
+    async def _guarded(self, handle: ProgressHandle, action: str) -> None:
+        try:
+            await getattr(handle, f"_{action}")()
+        except Exception as e:
+            logger.debug(f"progress {action} chat_id={handle.chat_id}: {e}")
+            if action == "edit":
+                handle._next_edit = time.monotonic() + _refresh_interval(time.monotonic() - handle.started)
+
+    def _tick(self) -> None:
+        now = time.monotonic()
+        due: List[tuple] = []
+        for handle in list(self._active.values()):
+            action = handle._due(now)
+            if action:
+                due.append((action, handle))
+        # Первыми — новые заглушки, затем правки тех, кто дольше всех не обновлялся
+        due.sort(key=lambda item: (item[0] != "placeholder", item[1]._next_edit))
+        for action, handle in due:
+            if action != "typing":
+                if self._budget.time_until_token() > 0:
+                    continue  # бюджет исчерпан — обновим на следующих тиках
+                self._budget.take()
+            handle._op_kind = action
+            handle._op = asyncio.get_running_loop().create_task(self._guarded(handle, action))
+
+    async def _run(self) -> None:
+        while self._active:
+            try:
+                self._tick()
+            except Exception as e:
+                logger.error(f"Ошибка в менеджере прогресса: {e}")
+            await asyncio.sleep(TICK_SECONDS)
+
+
+_manager = _ProgressManager()
+
+
+def start_progress(bot, chat_id: int, message: str = "Обрабатываю ваш запрос",
+                   max_time: int | None = None) -> ProgressHandle:
+    """Запускает индикатор для запроса; завершить — `finish()` с ответом или `close()`."""
+    if max_time is None:
+        # Умный дефолт: таймаут OpenAI + 30 сек буфера
+        max_time = int(getattr(settings, "openai_timeout_seconds", 180)) + 30
+    handle = ProgressHandle(bot, chat_id, message, max_time)
+    _manager.add(handle)
+    return handle
+
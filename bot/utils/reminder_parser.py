@@ -0,0 +1,288 @@
+"""Локальный разбор простых просьб о напоминании без обращения к модели.
+
+Понимает частые русские и английские формулировки с относительным («через 10 минут»,
+«in 2 hours») и абсолютным («завтра в 9:30», «at 5pm», «25.12 в 10:00») временем
+в таймзоне пользователя. Всё, что не удаётся разобрать однозначно, возвращает None —
+такие запросы по-прежнему уходят модели с инструментом schedule_reminder.
+"""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, List, Optional, Tuple
+
+from bot.config import settings
+from bot.startup import lazy_module
+from bot.utils.db import get_user_timezone
+from bot.utils.log import logger
+
+pytz = lazy_module("pytz")
+
+MAX_TEXT_LEN = 200  # как и в schedule_reminder: длиннее — пусть разбирается модель
+MAX_AHEAD = timedelta(days=366)
+
+
+@dataclass
+class ParsedReminder:
+    due_at_utc: datetime
+    text: str
+
+
+_NUM_WORDS = {
+    # ru
+    "одну": 1, "один": 1, "одна": 1, "две": 2, "два": 2, "три": 3, "четыре": 4, "пять": 5,
+    "шесть": 6, "семь": 7, "восемь": 8, "девять": 9, "десять": 10, "пятнадцать": 15,
+    "двадцать": 20, "тридцать": 30, "сорок": 40, "сорок пять": 45,
+    # en
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "fifteen": 15, "twenty": 20,
+    "thirty": 30, "forty": 40, "forty five": 45,
+}
+_NUM_WORD = r"(?:" + "|".join(sorted((re.escape(w) for w in _NUM_WORDS), key=len, reverse=True)) + r")"
+_NUM = r"(?:\d+|" + _NUM_WORD + r")"
+
+_UNITS_RU = r"(?:сек(?:унд[уы]?)?|с|мин(?:ут[уы]?)?|м|час(?:а|ов)?|ч|дн(?:я|ей)|день|сут(?:ки|ок)|недел[юиь]|нед)"
+_UNITS_EN = r"(?:s|secs?|seconds?|m|mins?|minutes?|h|hrs?|hours?|d|days?|w|weeks?)"
+
+_TRIGGER = re.compile(
+    r"^\s*(?:пожалуйста[\s,]+)?напомни(?:те)?(?:\s+мне)?[\s,:]+"
+    r"|^\s*(?:please[\s,]+)?remind\s+me[\s,:]+",
+    re.IGNORECASE,
+)
+
+# Повторы, несколько напоминаний и прочие сложные случаи — к модели
+_COMPLEX = re.compile(
+    r"кажд|ежедн|еженед|по\s+будням|по\s+выходным|раз\s+в\s|напомни|every|daily|weekly|remind",
+    re.IGNORECASE,
+)
+# Следы времени, оставшиеся в тексте после разбора, — признак неоднозначности
+_LEFTOVER_TIME = re.compile(
+    r"\d{1,2}[:.]\d{2}|\bчерез\b|\bсегодня\b|\bзавтра\b|\bпослезавтра\b|\bутра\b|\bвечера\b"
+    r"|\b[вк]\s+\d|\b\d+\s*(?:сек|мин|час|дн|сут|нед)"
+    r"|\bin\s+(?:\d+|an?\s+(?:hour|minute|day|week))\b|\bat\s+\d|\btoday\b|\btomorrow\b|\btonight\b|\d\s*(?:am|pm)\b"
+    r"|\b\d+\s*(?:secs?|seconds?|mins?|minutes?|hours?|hrs?|days?|weeks?)\b",
+    re.IGNORECASE,
+)
+_LEADING_FILLER = re.compile(r"^(?:что(?:бы)?|to|that)\s+", re.IGNORECASE)
+
+
+def _unit_seconds(unit: str) -> int:
+    u = unit.lower()
+    if u.startswith(("сек", "s")) or u == "с":
+        return 1
+    if u.startswith(("мин", "m")) or u == "м":
+        return 60
+    if u.startswith(("час", "h")) or u == "ч":
+        return 3600
+    if u.startswith(("недел", "нед", "w")):
+        return 7 * 86400
+    return 86400
+
+
+def _to_int(token: str) -> int:
+    token = token.lower().strip()
+    return int(token) if token.isdigit() else _NUM_WORDS[token]
+
+
+# ——— Шаблоны выражений времени ——————————————————————————————————— #
+
+_REL_RU = re.compile(
+    r"через\s+(?P<rel>(?:" + _NUM + r"\s*" + _UNITS_RU + r"\.?(?:\s+и)?\s*)+"
+    r"|полчаса|полтора\s+часа|минуту|час|секунду|день|сутки|неделю)",
+    re.IGNORECASE,
+)
+_REL_EN = re.compile(
+    r"in\s+(?P<rel>(?:" + _NUM + r"\s*" + _UNITS_EN + r"(?:\s+and)?\s*)+|half\s+an\s+hour)",
+    re.IGNORECASE,
+)
+_DATE_RU = re.compile(
+    r"(?P<d>\d{1,2})\.(?P<mo>\d{1,2})(?:\.(?P<y>\d{2}|\d{4}))?\s+в\s+(?P<h>\d{1,2})[:.](?P<m>\d{2})",
+    re.IGNORECASE,
+)
+_ABS_RU = re.compile(
+    r"(?:(?P<day>сегодня|завтра|послезавтра)\s+)?в\s+(?P<h>\d{1,2})(?:[:.](?P<m>\d{2}))?"
+    r"(?:\s*час(?:а|ов)?)?(?:\s+(?P<part>утра|дня|вечера|ночи))?",
+    re.IGNORECASE,
+)
+_ABS_EN = re.compile(
+    r"(?:(?P<day>today|tomorrow)\s+)?at\s+(?P<h>\d{1,2})(?::(?P<m>\d{2}))?\s*(?P<part>am|pm|a\.m\.|p\.m\.)?",
+    re.IGNORECASE,
+)
+
+
+def _resolve_relative(m: re.Match, now_utc: datetime, tz) -> Optional[datetime]:
+    rel = m.group("rel").lower()
+    fixed = {
+        "полчаса": 1800, "полтора часа": 5400, "минуту": 60, "час": 3600, "секунду": 1,
+        "день": 86400, "сутки": 86400, "неделю": 7 * 86400, "half an hour": 1800,
+    }
+    key = re.sub(r"\s+", " ", rel.strip())
+    if key in fixed:
+        return now_utc + timedelta(seconds=fixed[key])
+    # Число словом — отдельное слово, иначе «and» читается как «an d» (день); цифры
+    # могут идти вплотную к предыдущей единице («1ч30м»)
+    pair = re.compile(
+        r"(\d+|(?<![^\W\d_])" + _NUM_WORD + r"\s)\s*(" + _UNITS_RU + "|" + _UNITS_EN + r")(?![^\W\d_])",
+        re.IGNORECASE,
+    )
+    total = 0
+    for num, unit in pair.findall(rel):
+        total += _to_int(num) * _unit_seconds(unit)
+    return now_utc + timedelta(seconds=total) if total > 0 else None
+
+
+def _local_candidate(now_utc: datetime, tz, day_offset: Optional[int], hour: int, minute: int) -> Optional[datetime]:
+    """Ближайший момент hh:mm в таймзоне пользователя.
+
+    Без явного дня — сегодня, а если время уже прошло — завтра. С явным днём прошедшее
+    время считается неоднозначным.
+    """
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        return None
+    now_local = now_utc.astimezone(tz)
+    base = now_local.date() + timedelta(days=day_offset or 0)
+    candidate = tz.localize(datetime(base.year, base.month, base.day, hour, minute))
+    if candidate <= now_local:
+        if day_offset is not None:
+            return None
+        candidate = tz.localize(datetime(base.year, base.month, base.day, hour, minute) + timedelta(days=1))
+    return candidate.astimezone(timezone.utc)
+
+
+_DAY_OFFSETS = {"сегодня": 0, "завтра": 1, "послезавтра": 2, "today": 0, "tomorrow": 1}
+
+
+def _apply_day_part(hour: int, part: Optional[str]) -> Optional[int]:
+    if not part:
+        return hour
+    p = part.lower().replace(".", "")
+    if p in ("утра", "am"):
+        if hour == 12:
+            return 0
+        return hour if 1 <= hour <= 11 else None
+    if p in ("дня", "вечера", "pm"):
+        if hour == 12 and p != "вечера":
+            return 12
+        return hour + 12 if 1 <= hour <= 11 else None
+    if p == "ночи":
+        if hour == 12:
+            return 0
+        return hour if 0 <= hour <= 5 else None
+    return None
+
+
+def _resolve_absolute(m: re.Match, now_utc: datetime, tz) -> Optional[datetime]:
+    hour = int(m.group("h"))
+    minute_raw = m.group("m")
+    part = m.group("part")
+    # «в 7» без минут и без уточнения — то ли утро, то ли вечер
+    if minute_raw is None and not part and hour < 13:
+        return None
+    hour = _apply_day_part(hour, part)
+    if hour is None:
+        return None
+    day = m.group("day")
+    return _local_candidate(now_utc, tz, _DAY_OFFSETS.get(day.lower()) if day else None, hour, int(minute_raw or 0))
+
+
+def _resolve_date(m: re.Match, now_utc: datetime, tz) -> Optional[datetime]:
+    now_local = now_utc.astimezone(tz)
+    year_raw = m.group("y")
+    year = int(year_raw) + (2000 if year_raw and len(year_raw) == 2 else 0) if year_raw else now_local.year
+    try:
+        naive = datetime(year, int(m.group("mo")), int(m.group("d")), int(m.group("h")), int(m.group("m")))
+    except ValueError:
+        return None
+    candidate = tz.localize(naive)
+    if candidate <= now_local:
+        if year_raw:
+            return None
+        try:
+            candidate = tz.localize(naive.replace(year=year + 1))
+        except ValueError:
+            return None
+    return candidate.astimezone(timezone.utc)
+
+
+_PATTERNS: List[Tuple[re.Pattern, Callable[[re.Match, datetime, object], Optional[datetime]]]] = [
+    (_REL_RU, _resolve_relative),
+    (_REL_EN, _resolve_relative),
+    (_DATE_RU, _resolve_date),
+    (_ABS_RU, _resolve_absolute),
+    (_ABS_EN, _resolve_absolute),
+]
+
+
+def _split_time(rest: str) -> Optional[Tuple[re.Match, Callable, str]]:
+    """Ищет выражение времени в начале или в конце фразы; возвращает (match, resolver, текст)."""
+    for pattern, resolver in _PATTERNS:
+        m = re.match(pattern.pattern + r"(?:[\s,]+|$)", rest, re.IGNORECASE)
+        if m:
+            return m, resolver, rest[m.end():]
+        m = re.search(r"[\s,]+(?:" + pattern.pattern + r")[\s.!]*$", rest, re.IGNORECASE)
+        if m:
+            return m, resolver, rest[:m.start()]
+    return None
+
+
+def parse_reminder_request(message: str, user_tz: str, now: Optional[datetime] = None) -> Optional[ParsedReminder]:
+    """Разбирает «напомни …»/«remind me …» в момент срабатывания (UTC) и текст напоминания.
+
+    Возвращает None, если фраза не похожа на простую одноразовую просьбу или время
+    можно понять по-разному.
+    """
+    if not message or len(message) > 500 or "\n" in message.strip():
+        return None
+    trig = _TRIGGER.match(message)
+    if not trig:
+        return None
+    rest = message[trig.end():].strip()
+    if not rest or _COMPLEX.search(rest):
+        return None
+    try:
+        tz = pytz.timezone(user_tz)
+    except Exception:
+        return None
+    now_utc = (now or datetime.now(timezone.utc)).astimezone(timezone.utc)
+
+    found = _split_time(rest)
+    if not found:
+        return None
+    match, resolver, body = found
+    due = resolver(match, now_utc, tz)
+    if due is None or due <= now_utc or due - now_utc > MAX_AHEAD:
+        return None
+
+    body = _LEADING_FILLER.sub("", body.strip(" ,.!:;—-")).strip(" ,.!:;—-\"'«»")
+    if not body or len(body) > MAX_TEXT_LEN or _LEFTOVER_TIME.search(body):
+        return None
+    return ParsedReminder(due_at_utc=due, text=body[0].upper() + body[1:])
+
+
+async def try_schedule_reminder_locally(chat_id: int, user_id: int, message: str, message_id: int) -> Optional[str]:
+    """Создаёт напоминание без модели, если просьба простая. Возвращает текст подтверждения или None.
+
+    message_id — id сообщения Telegram: повторная доставка того же сообщения не создаст дубль.
+    """
+    if not settings.reminder_fast_path:
+        return None
+    # Импорт здесь: модуль openai тянет клиента, а разбор должен оставаться дешёвым
+    from bot.utils.openai.chat import ChatManager
+
+    if not ChatManager._has_reminder_intent([{"role": "user", "content": message}]):
+        return None
+    user_tz = await get_user_timezone(user_id)
+    parsed = parse_reminder_request(message, user_tz)
+    if parsed is None:
+        return None
+    ack, tool_output = await ChatManager._handle_schedule_reminder_tool(
+        chat_id,
+        user_id,
+        {"when": parsed.due_at_utc.strftime("%Y-%m-%dT%H:%M:%S+00:00"), "text": parsed.text},
+        f"msg:{message_id}",
+    )
+    if not ack:
+        return None
+    logger.info(f"[reminders] fast-path chat={chat_id} user={user_id} due_at={parsed.due_at_utc:%Y-%m-%d %H:%M:%S}")
+    return ack
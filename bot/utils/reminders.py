@@ -1,4 +1,4 @@
-"""Reminders scheduler: polls DB for due reminders and sends messages to chat."""
+"""Напоминания и самовызовы: обработчики задач для общего движка `bot.utils.jobs`."""
 from __future__ import annotations
 
 import asyncio
@@ -7,20 +7,19 @@ import random
 import re
 from dataclasses import dataclass
 from datetime import datetime, timezone, timedelta
-from typing import List, Optional, Tuple
+from typing import Optional, Tuple
 
 from aiogram import Bot
 
 from bot.utils.db import get_conn, get_user_timezone
+from bot.utils.jobs import JobKind, register_job_kind, parse_utc as _parse_dt, utcnow_str
 from bot.utils.log import logger
 from bot.utils.openai import OpenAIClient
+from bot.utils.outbound import Priority, outbound_priority
 from bot.config import settings
 from bot.utils.datetime_context import utc_to_user_local
 
 
-STALE_PICK_SECONDS = 60  # если picked_at старше — считаем задачу «осиротевшей»
-
-
 @dataclass
 class Reminder:
     id: int
@@ -33,74 +32,6 @@ class Reminder:
     meta_json: Optional[str] = None
 
 
-def _utcnow_str() -> str:
-    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
-
-
-def _parse_dt(s: str) -> datetime:
-    return datetime.strptime(s, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
-
-
-async def _fetch_due(limit: int) -> List[Reminder]:
-    # lookahead и анти-дрейф, исключаем недавно взятые задачи
-    now = datetime.now(timezone.utc)
-    now_plus = now + timedelta(seconds=settings.reminder_lookahead_seconds)
-    stale_limit = (now - timedelta(seconds=STALE_PICK_SECONDS)).strftime("%Y-%m-%d %H:%M:%S")
-    now_plus_str = now_plus.strftime("%Y-%m-%d %H:%M:%S")
-    async with get_conn() as db:
-        cur = await db.execute(
-            """
-            SELECT id, chat_id, user_id, text, due_at, silent, idempotency_key, meta_json
-            FROM reminders
-            WHERE status = 'scheduled'
-              AND due_at <= ?
-              AND (picked_at IS NULL OR picked_at <= ?)
-            ORDER BY due_at ASC
-            LIMIT ?
-            """,
-            (now_plus_str, stale_limit, limit),
-        )
-        rows = await cur.fetchall()
-    return [
-        Reminder(
-            id=r[0], chat_id=r[1], user_id=r[2], text=r[3], due_at=r[4], silent=bool(r[5]),
-            idempotency_key=r[6], meta_json=r[7]
-        ) for r in rows
-    ]
-
-
-async def _mark_status(reminder_id: int, status: str) -> None:
-    async with get_conn() as db:
-        if status == "done":
-            await db.execute(
-                "UPDATE reminders SET status='done', executed_at=CURRENT_TIMESTAMP, fired_at=CURRENT_TIMESTAMP WHERE id=?",
-                (reminder_id,),
-            )
-        else:
-            await db.execute(
-                "UPDATE reminders SET status=?, executed_at=CURRENT_TIMESTAMP WHERE id=?",
-                (status, reminder_id),
-            )
-        await db.commit()
-
-
-async def _claim(reminder_id: int) -> bool:
-    """Атомарно отмечает задачу как взятую воркером, чтобы избежать гонок (single process — защита от дублей)."""
-    async with get_conn() as db:
-        await db.execute(
-            """
-            UPDATE reminders
-               SET picked_at=CURRENT_TIMESTAMP
-             WHERE id=? AND (picked_at IS NULL OR picked_at <= DATETIME('now', ?))
-            """,
-            (reminder_id, f'-{STALE_PICK_SECONDS} seconds'),
-        )
-        await db.commit()
-        cur = await db.execute("SELECT picked_at FROM reminders WHERE id=?", (reminder_id,))
-        row = await cur.fetchone()
-        return bool(row and row[0])
-
-
 def _build_idempotency_key(r: Reminder) -> str:
     base = f"rem_{r.id}:{r.chat_id}:{r.user_id}:{r.due_at}"
     return base
@@ -175,39 +106,25 @@ async def _spawn_next_if_needed(r: Reminder) -> None:
     logger.info(f"[reminders] chained next created for chat={r.chat_id} user={r.user_id} due_at={due_str}")
 
 
-async def _handle_one(bot: Bot, r: Reminder) -> None:
-    """Формирует текст уведомления через модель и отправляет его пользователю."""
-    # идемпотентность на уровне ключа (локально)
-    idemp = r.idempotency_key or _build_idempotency_key(r)
-    try:
-        # Блокируем задачу (single-process), чтобы не схватили параллельно
-        if not await _claim(r.id):
-            return
+def _tz_label(user_tz: Optional[str]) -> str:
+    return "Мск" if (user_tz or "").lower() in {"europe/moscow", "europe\\moscow"} else user_tz or "лок. время"
 
-        # Джиттер ±settings.reminder_jitter_seconds
-        jitter = settings.reminder_jitter_seconds
-        if jitter > 0:
-            shift = random.uniform(-jitter, jitter)
-            await asyncio.sleep(max(0.0, shift))
 
-        # Локальное время пользователя для понятного текста
-        user_tz = await get_user_timezone(r.user_id)
-        local_time = utc_to_user_local(r.due_at, user_tz)
-        tz_label = "Мск" if (user_tz or "").lower() in {"europe/moscow", "europe\moscow"} else user_tz or "лок. время"
+async def _generate_text(r: Reminder, local_time: str, tz_label: str) -> Optional[str]:
+    """Просит модель сформировать текст уведомления. None — если не получилось."""
+    instruction = (
+        "Сформируй одно короткое уведомление по сработавшему напоминанию. "
+        "Сообщение должно быть лаконичным и понятным. Если уместно, можешь добавить полезный контекст (например, краткую сводку погоды, дорожную ситуацию, время), но избегай лишней болтовни."
+    )
+    user_msg = f"Напоминание: {r.text}. Сработало в {local_time} ({tz_label})."
+    content = [{
+        "type": "message",
+        "role": "user",
+        "content": f"{instruction}\n\n{user_msg}"
+    }]
 
-        # Формируем краткий запрос к модели на основе напоминания
-        instruction = (
-            "Сформируй одно короткое уведомление по сработавшему напоминанию. "
-            "Сообщение должно быть лаконичным и понятным. Если уместно, можешь добавить полезный контекст (например, краткую сводку погоды, дорожную ситуацию, время), но избегай лишней болтовни."
-        )
-        user_msg = f"Напоминание: {r.text}. Сработало в {local_time} ({tz_label})."
-        content = [{
-            "type": "message",
-            "role": "user",
-            "content": f"{instruction}\n\n{user_msg}"
-        }]
-
-        # Просим модель; отключаем инструменты напоминаний, можно оставить web_search=auto
+    # Просим модель; отключаем инструменты напоминаний, можно оставить web_search=auto
+    try:
         response_text = await OpenAIClient.responses_request(
             r.chat_id,
             r.user_id,
@@ -216,46 +133,92 @@ async def _handle_one(bot: Bot, r: Reminder) -> None:
             enable_web_search=True,
             include_reminder_tools=False,
         )
+    except Exception as e:
+        logger.error(f"reminder {r.id} generation failed: {e}")
+        return None
+    return response_text if response_text and response_text.strip() else None
+
+
+async def _pregen_one(bot: Bot, r: Reminder) -> None:
+    """Заранее готовит текст уведомления и сохраняет его в строке напоминания.
+
+    pregen_at проставляется в любом случае, чтобы неудачная попытка не повторялась:
+    при срабатывании без готового текста он будет сгенерирован «вживую».
+    """
+    user_tz = await get_user_timezone(r.user_id)
+    local_time = utc_to_user_local(r.due_at, user_tz)
+    text = await _generate_text(r, local_time, _tz_label(user_tz))
+    async with get_conn() as db:
+        await db.execute(
+            "UPDATE reminders SET pregen_text=?, pregen_at=CURRENT_TIMESTAMP WHERE id=? AND status='scheduled'",
+            (text, r.id),
+        )
+        await db.commit()
+    logger.info(f"[reminders] pregen id={r.id} chat={r.chat_id} {'ready' if text else 'failed, live fallback'}")
+
+
+async def _load_pregen_text(reminder_id: int) -> Optional[str]:
+    async with get_conn() as db:
+        cur = await db.execute("SELECT pregen_text FROM reminders WHERE id=?", (reminder_id,))
+        row = await cur.fetchone()
+    return row[0] if row and row[0] and str(row[0]).strip() else None
 
-        # Идемпотентная попытка отправки: записываем ключ перед send
-        async with get_conn() as db:
-            await db.execute(
-                "UPDATE reminders SET idempotency_key=? WHERE id=? AND idempotency_key IS NULL",
-                (idemp, r.id),
-            )
-            await db.commit()
-
-        # Отправляем
-        if response_text and response_text.strip():
-            await bot.send_message(r.chat_id, response_text, disable_notification=r.silent)
+
+async def _handle_one(bot: Bot, r: Reminder) -> None:
+    """Отправляет уведомление по напоминанию в момент due_at.
+
+    Если текст был подготовлен заранее (`_pregen_one`), срабатывание — это одна отправка
+    в Telegram; иначе текст формируется моделью на месте. Захват задачи и итоговый статус
+    выставляет движок задач; исключение отсюда означает, что не удалось отправить даже
+    простое уведомление, и движок повторит задачу с экспоненциальной паузой.
+    """
+    # идемпотентность на уровне ключа (локально)
+    idemp = r.idempotency_key or _build_idempotency_key(r)
+
+    # Локальное время пользователя для понятного текста
+    user_tz = await get_user_timezone(r.user_id)
+    local_time = utc_to_user_local(r.due_at, user_tz)
+    tz_label = _tz_label(user_tz)
+    # Фолбэк — понятное уведомление с временем
+    plain = f"🔔 Напоминание: {r.text}\nСработало в {local_time} ({tz_label})."
+
+    response_text = await _load_pregen_text(r.id)
+    if response_text is None:
+        # Джиттер ±settings.reminder_jitter_seconds сглаживает пики живой генерации
+        jitter = settings.reminder_jitter_seconds
+        if jitter > 0:
+            shift = random.uniform(-jitter, jitter)
+            await asyncio.sleep(max(0.0, shift))
+        response_text = await _generate_text(r, local_time, tz_label)
+
+    # Идемпотентная попытка отправки: записываем ключ перед send
+    async with get_conn() as db:
+        await db.execute(
+            "UPDATE reminders SET idempotency_key=? WHERE id=? AND idempotency_key IS NULL",
+            (idemp, r.id),
+        )
+        await db.commit()
+
+    # Отправляем; при ошибке отправки сгенерированного текста — простое уведомление.
+    # Уведомления уступают очередь ответам пользователям.
+    with outbound_priority(Priority.NOTIFICATION):
+        if response_text:
+            try:
+                await bot.send_message(r.chat_id, response_text, disable_notification=r.silent)
+            except Exception as e:
+                logger.warning(f"reminder {r.id} send failed, sending plain text: {e}")
+                await bot.send_message(r.chat_id, plain, disable_notification=r.silent)
         else:
-            # Фолбэк — всё равно отправим понятное уведомление с временем
-            plain = f"🔔 Напоминание: {r.text}\nСработало в {local_time} ({tz_label})."
             await bot.send_message(r.chat_id, plain, disable_notification=r.silent)
 
-        # Помечаем статус и fired_at
-        await _mark_status(r.id, "done")
-        fired_at = _utcnow_str()
-        logger.info(f"[reminders] sent id={r.id} chat={r.chat_id} user={r.user_id} fired_at_utc={fired_at}")
+    logger.info(f"[reminders] sent id={r.id} chat={r.chat_id} user={r.user_id} fired_at_utc={utcnow_str()}")
 
-        # Чейним следующий, если нужно
+    # Чейним следующий, если нужно. Уведомление уже отправлено — ошибка здесь
+    # не должна приводить к повтору задачи и дублю сообщения.
+    try:
         await _spawn_next_if_needed(r)
-
     except Exception as e:
-        logger.error(f"reminder {r.id} handling failed: {e}")
-        # Фолбэк: не блокируем остальные напоминания
-        try:
-            user_tz = await get_user_timezone(r.user_id)
-            local_time = utc_to_user_local(r.due_at, user_tz)
-            tz_label = "Мск" if (user_tz or "").lower() in {"europe/moscow", "europe\moscow"} else user_tz or "лок. время"
-            text = f"🔔 Напоминание: {r.text}\nСработало в {local_time} ({tz_label})."
-            await bot.send_message(r.chat_id, text, disable_notification=r.silent)
-            await _mark_status(r.id, "done")
-        except Exception:
-            try:
-                await _mark_status(r.id, "error")
-            except Exception:
-                pass
+        logger.error(f"[reminders] chain next failed for id={r.id}: {e}")
 
 
 # ------------------------
@@ -272,59 +235,6 @@ class SelfCall:
     payload_json: Optional[str]
 
 
-async def _self_fetch_due(limit: int) -> List[SelfCall]:
-    now = datetime.now(timezone.utc)
-    now_plus = now + timedelta(seconds=settings.reminder_lookahead_seconds)
-    stale_limit = (now - timedelta(seconds=STALE_PICK_SECONDS)).strftime("%Y-%m-%d %H:%M:%S")
-    now_plus_str = now_plus.strftime("%Y-%m-%d %H:%M:%S")
-    async with get_conn() as db:
-        cur = await db.execute(
-            """
-            SELECT id, chat_id, user_id, due_at, topic, payload_json
-              FROM self_calls
-             WHERE status='scheduled'
-               AND due_at <= ?
-               AND (picked_at IS NULL OR picked_at <= ?)
-             ORDER BY due_at ASC
-             LIMIT ?
-            """,
-            (now_plus_str, stale_limit, limit),
-        )
-        rows = await cur.fetchall()
-    return [SelfCall(id=r[0], chat_id=r[1], user_id=r[2], due_at=r[3], topic=r[4], payload_json=r[5]) for r in rows]
-
-
-async def _self_claim(id_: int) -> bool:
-    async with get_conn() as db:
-        await db.execute(
-            """
-            UPDATE self_calls
-               SET picked_at=CURRENT_TIMESTAMP
-             WHERE id=? AND (picked_at IS NULL OR picked_at <= DATETIME('now', ?))
-            """,
-            (id_, f'-{STALE_PICK_SECONDS} seconds'),
-        )
-        await db.commit()
-        cur = await db.execute("SELECT picked_at FROM self_calls WHERE id=?", (id_,))
-        row = await cur.fetchone()
-        return bool(row and row[0])
-
-
-async def _self_mark_status(id_: int, status: str) -> None:
-    async with get_conn() as db:
-        if status == 'done':
-            await db.execute(
-                "UPDATE self_calls SET status='done', executed_at=CURRENT_TIMESTAMP, fired_at=CURRENT_TIMESTAMP WHERE id=?",
-                (id_,),
-            )
-        else:
-            await db.execute(
-                "UPDATE self_calls SET status=?, executed_at=CURRENT_TIMESTAMP WHERE id=?",
-                (status, id_),
-            )
-        await db.commit()
-
-
 def _extract_next_self_call(text: str) -> Optional[Tuple[datetime, Optional[str], Optional[dict]]]:
     """Парсит из ответа ассистента инструкцию следующего самовызова.
     Формат: в конце сообщения отдельной строкой JSON-маркер: 
@@ -373,119 +283,112 @@ def _extract_next_self_call(text: str) -> Optional[Tuple[datetime, Optional[str]
 
 
 async def _self_handle_one(bot: Bot, sc: SelfCall) -> None:
-    try:
-        if not await _self_claim(sc.id):
-            return
-        # Формируем запрос к модели: тема + произвольный payload
-        instr = (
-            "Это отложенный самовызов ассистента. Сформируй одно содержательное сообщение для пользователя по теме, "
-            "которую ты считаешь актуальной на текущий момент на основе контекста темы/пейлоада. Ты можешь свободно вести беседу. "
-            "Если хочешь продолжить беседу позже, добавь в конце сообщения JSON-маркер в HTML-комментарии, например: \n"
-            "<!--self_call:{\"in\":\"in 30m\",\"topic\":\"forex\"}}-->" 
-        )
-        payload_text = sc.payload_json or "{}"
-        content = [{
-            "type": "message",
-            "role": "user",
-            "content": f"{instr}\n\nТема: {sc.topic or '-'}\nPayload: {payload_text}"
-        }]
-        # Берём previous_response_id из истории
-        prev_id = None
-        async with get_conn() as db:
-            cur = await db.execute("SELECT last_response FROM chat_history WHERE chat_id=?", (sc.chat_id,))
-            row = await cur.fetchone()
-            prev_id = row[0] if row else None
-        text = await OpenAIClient.responses_request(
-            sc.chat_id, sc.user_id, content, previous_response_id=prev_id, enable_web_search=True, include_reminder_tools=False
-        )
+    # Формируем запрос к модели: тема + произвольный payload
+    instr = (
+        "Это отложенный самовызов ассистента. Сформируй одно содержательное сообщение для пользователя по теме, "
+        "которую ты считаешь актуальной на текущий момент на основе контекста темы/пейлоада. Ты можешь свободно вести беседу. "
+        "Если хочешь продолжить беседу позже, добавь в конце сообщения JSON-маркер в HTML-комментарии, например: \n"
+        "<!--self_call:{\"in\":\"in 30m\",\"topic\":\"forex\"}}-->" 
+    )
+    payload_text = sc.payload_json or "{}"
+    content = [{
+        "type": "message",
+        "role": "user",
+        "content": f"{instr}\n\nТема: {sc.topic or '-'}\nPayload: {payload_text}"
+    }]
+    # Берём previous_response_id из истории
+    prev_id = None
+    async with get_conn() as db:
+        cur = await db.execute("SELECT last_response FROM chat_history WHERE chat_id=?", (sc.chat_id,))
+        row = await cur.fetchone()
+        prev_id = row[0] if row else None
+    text = await OpenAIClient.responses_request(
+        sc.chat_id, sc.user_id, content, previous_response_id=prev_id, enable_web_search=True, include_reminder_tools=False
+    )
+    with outbound_priority(Priority.NOTIFICATION):
         await bot.send_message(sc.chat_id, text)
-        await _self_mark_status(sc.id, 'done')
-        # Спарсить следующий самовызов
-        nxt = _extract_next_self_call(text)
-        if nxt:
-            due, topic, payload = nxt
+    # Спарсить следующий самовызов
+    nxt = _extract_next_self_call(text)
+    if nxt:
+        due, topic, payload = nxt
+        # Сообщение уже отправлено — ошибка планирования следующего не повторяет задачу
+        try:
             async with get_conn() as db:
                 await db.execute(
                     "INSERT INTO self_calls(chat_id, user_id, due_at, topic, payload_json, status) VALUES(?,?,?,?,?, 'scheduled')",
                     (sc.chat_id, sc.user_id, due.strftime("%Y-%m-%d %H:%M:%S"), topic, json.dumps(payload or {}, ensure_ascii=False)),
                 )
                 await db.commit()
-            logger.info(f"[self_calls] scheduled next for chat={sc.chat_id} at {due}")
-    except Exception as e:
-        logger.warning(f"self_call {sc.id} handling failed: {e}")
-        try:
-            await _self_mark_status(sc.id, 'error')
-        except Exception:
-            pass
-
-
-def start_self_calls_scheduler(bot: Bot) -> asyncio.Task:
-    stop_event = asyncio.Event()
-
-    async def _loop():
-        logger.info("🤖 Self-calls scheduler started")
-        try:
-            while not stop_event.is_set():
-                try:
-                    due = await _self_fetch_due(limit=max(1, settings.reminder_batch_limit))
-                    for sc in due:
-                        await _self_handle_one(bot, sc)
-                except Exception as e:
-                    logger.debug(f"self_calls loop warn: {e}")
-                try:
-                    await asyncio.wait_for(stop_event.wait(), timeout=float(settings.reminder_poll_interval_seconds))
-                except asyncio.TimeoutError:
-                    pass
-        finally:
-            logger.info("⏹ Self-calls scheduler stopped")
-
-    task = asyncio.create_task(_loop(), name="self_calls_scheduler")
-    setattr(task, "_gpttg_stop_event", stop_event)
-    return task
+        except Exception as e:
+            logger.error(f"[self_calls] schedule next failed for id={sc.id}: {e}")
+            return
+        logger.info(f"[self_calls] scheduled next for chat={sc.chat_id} at {due}")
 
 
 # ------------------------
-# Reminders scheduler main entry
+# Регистрация видов задач в общем движке
 # ------------------------
 
-def start_reminders_scheduler(bot: Bot) -> asyncio.Task:
-    stop_event = asyncio.Event()
-
-    async def _loop():
-        logger.info("⏰ Reminders scheduler started")
-        sent = skipped = failed = 0
-        lag_sum = 0.0
-        lag_count = 0
-        try:
-            while not stop_event.is_set():
-                try:
-                    batch_limit = max(1, settings.reminder_batch_limit)
-                    due = await _fetch_due(limit=batch_limit)
-                    if not due:
-                        skipped += 1
-                    now = datetime.now(timezone.utc)
-                    for r in due:
-                        try:
-                            lag = max(0.0, (now - _parse_dt(r.due_at)).total_seconds())
-                            lag_sum += lag
-                            lag_count += 1
-                        except Exception:
-                            pass
-                        await _handle_one(bot, r)
-                        sent += 1
-                except Exception as e:
-                    logger.warning(f"reminders loop warn: {e}")
-                    failed += 1
-                # Пауза между итерациями
-                try:
-                    await asyncio.wait_for(stop_event.wait(), timeout=float(settings.reminder_poll_interval_seconds))
-                except asyncio.TimeoutError:
-                    pass
-        finally:
-            avg_lag = (lag_sum / lag_count) if lag_count else 0.0
-            logger.info(f"⏹ Reminders scheduler stopped (sent={sent}, skipped={skipped}, failed={failed}, avg_lag_s={avg_lag:.2f})")
-
-    task = asyncio.create_task(_loop(), name="reminders_scheduler")
-    # Помечаем стоп-событие для корректной остановки снаружи
-    setattr(task, "_gpttg_stop_event", stop_event)
-    return task
+def _fire_horizon_seconds() -> float:
+    # Берём задачу заранее, чтобы отправить ровно в due_at, а не через интервал опроса
+    return float(settings.reminder_poll_interval_seconds + settings.reminder_lookahead_seconds)
+
+
+_REMINDER_COLUMNS = ("id", "chat_id", "user_id", "text", "due_at", "silent", "idempotency_key", "meta_json")
+
+
+def _reminder_from_row(r: tuple) -> Reminder:
+    return Reminder(
+        id=r[0], chat_id=r[1], user_id=r[2], text=r[3], due_at=r[4], silent=bool(r[5]),
+        idempotency_key=r[6], meta_json=r[7]
+    )
+
+
+REMINDER_JOB = JobKind(
+    name="reminders",
+    table="reminders",
+    columns=_REMINDER_COLUMNS,
+    factory=_reminder_from_row,
+    handler=_handle_one,
+    lookahead_seconds=_fire_horizon_seconds,
+    exact_time=True,
+    shard_column="chat_id",
+)
+
+# Предгенерация: за REMINDER_PREGEN_LEAD до срабатывания. Напоминания, которые отправка
+# уже забирает (ближе горизонта срабатывания), не трогаем — их текст сформируется на месте.
+# Запросы к модели идут секундами, поэтому у вида свой семафор: общий JOBS_CONCURRENCY
+# остаётся за срабатываниями.
+REMINDER_PREGEN_JOB = JobKind(
+    name="reminders_pregen",
+    table="reminders",
+    columns=_REMINDER_COLUMNS,
+    factory=_reminder_from_row,
+    handler=_pregen_one,
+    lookahead_seconds=lambda: float(settings.reminder_pregen_lead_seconds),
+    extra_where=(
+        "pregen_at IS NULL AND due_at > DATETIME('now', "
+        f"'+{settings.reminder_poll_interval_seconds + settings.reminder_lookahead_seconds} seconds')"
+    ),
+    lease_column="pregen_picked_at",
+    finalize=False,
+    shard_column="chat_id",
+    concurrency=settings.reminder_pregen_concurrency,
+)
+
+SELF_CALL_JOB = JobKind(
+    name="self_calls",
+    table="self_calls",
+    columns=("id", "chat_id", "user_id", "due_at", "topic", "payload_json"),
+    factory=lambda r: SelfCall(id=r[0], chat_id=r[1], user_id=r[2], due_at=r[3], topic=r[4], payload_json=r[5]),
+    handler=_self_handle_one,
+    shard_column="chat_id",
+)
+
+
+def register_reminder_jobs() -> None:
+    """Регистрирует напоминания и самовызовы как виды задач общего планировщика."""
+    if settings.reminder_pregen_lead_seconds > 0:
+        register_job_kind(REMINDER_PREGEN_JOB)
+    register_job_kind(REMINDER_JOB)
+    register_job_kind(SELF_CALL_JOB)
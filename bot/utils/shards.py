@@ -0,0 +1,102 @@
+"""Шардирование по чатам для многопроцессного запуска (WORKERS > 1).
+
+Супервизор (`bot/supervisor.py`) запускает WORKERS процессов-воркеров и передаёт
+каждому номер шарда через окружение. Апдейты и фоновые задачи чата попадают в шард
+`|chat_id| % WORKERS`, поэтому очередь чата, альбомы и кэши остаются в одном процессе.
+Задачи без чата и периодическая работа выполняются только в шарде 0. Захват задач в
+SQLite и так атомарен (условный UPDATE), фильтр лишь убирает гонки между шардами.
+
+Каждый воркер раз в STATS_INTERVAL_SECONDS пишет свои метрики в `worker_stats` —
+из неё /status собирает картину по всем процессам.
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+
+from bot.utils.db import get_conn
+
+SHARD_INDEX = int(os.getenv("GPTTG_SHARD", "0"))
+SHARD_COUNT = max(1, int(os.getenv("GPTTG_SHARDS", "1")))
+SHARD_PORT = int(os.getenv("GPTTG_SHARD_PORT", "0"))
+SHARD_SECRET = os.getenv("GPTTG_SHARD_SECRET", "")
+
+STATS_INTERVAL_SECONDS = 15
+
+
+def is_worker() -> bool:
+    """Процесс запущен супервизором как воркер шарда."""
+    return SHARD_PORT > 0
+
+
+def is_primary() -> bool:
+    """Шард, который выполняет общую работу (периодические задачи, задачи без чата)."""
+    return SHARD_INDEX == 0
+
+
+def shard_for(chat_id: Optional[int], count: int = SHARD_COUNT) -> int:
+    return abs(int(chat_id or 0)) % max(1, count)
+
+
+def shard_where(column: Optional[str]) -> str:
+    """SQL-условие «строка принадлежит этому шарду» (пустое при одном процессе)."""
+    if SHARD_COUNT <= 1:
+        return ""
+    if column is None:
+        return "1=1" if is_primary() else "0=1"
+    return f"ABS(COALESCE({column}, 0)) % {SHARD_COUNT} = {SHARD_INDEX}"
+
+
+async def publish_stats(bot: Bot) -> None:
+    """Сохраняет метрики процесса для /status (периодическая задача каждого шарда)."""
+    from bot.utils.jobs import get_jobs_metrics
+
+    payload = json.dumps({"jobs": get_jobs_metrics()}, ensure_ascii=False)
+    async with get_conn() as db:
+        await db.execute(
+            "INSERT OR REPLACE INTO worker_stats(shard, pid, payload, updated_at) "
+            "VALUES (?, ?, ?, CURRENT_TIMESTAMP)",
+            (SHARD_INDEX, os.getpid(), payload),
+        )
+        await db.commit()
+
+
+async def collect_stats() -> List[Dict[str, Any]]:
+    """Последние метрики всех шардов: shard, pid, age_s, jobs."""
+    async with get_conn() as db:
+        rows = await (await db.execute(
+            "SELECT shard, pid, payload, CAST(strftime('%s','now') - strftime('%s', updated_at) AS INTEGER) "
+            "FROM worker_stats WHERE shard < ? ORDER BY shard",
+            (SHARD_COUNT,),
+        )).fetchall()
+    result = []
+    for shard, pid, payload, age in rows:
+        try:
+            data = json.loads(payload or "{}")
+        except ValueError:
+            data = {}
+        result.append({"shard": shard, "pid": pid, "age_s": age, "jobs": data.get("jobs", {})})
+    return result
+
+
+def merge_jobs_metrics(per_shard: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Сумма счётчиков задач по шардам; средняя задержка — максимум по шардам."""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for item in per_shard:
+        for name, m in item["jobs"].items():
+            acc = merged.setdefault(name, {"done": 0, "failed": 0, "retried": 0, "dead": 0,
+                                           "inflight": 0, "avg_lag_s": 0.0})
+            for key in ("done", "failed", "retried", "dead", "inflight"):
+                acc[key] += int(m.get(key) or 0)
+            acc["avg_lag_s"] = max(acc["avg_lag_s"], float(m.get("avg_lag_s") or 0.0))
+    return merged
+
+
+def register_shard_jobs() -> None:
+    if SHARD_COUNT > 1:
+        from bot.utils.jobs import register_periodic
+
+        register_periodic("worker_stats", STATS_INTERVAL_SECONDS, publish_stats, every_shard=True)
@@ -0,0 +1,175 @@
+"""Кэш файлов Telegram по file_unique_id.
+
+file_unique_id одинаков для одного и того же файла у всех пользователей и при
+пересылке, поэтому повторное медиа узнаётся без скачивания. Три уровня:
+
+* пути файлов (`getFile`) — в памяти на FILE_PATH_TTL (ссылка живёт не меньше часа);
+* содержимое небольших файлов — в памяти, LRU с бюджетом TG_CACHE_MB;
+* производные результаты (расшифровка Whisper; sha256, размер и число страниц
+  документа — по ним переиспользуется файл OpenAI или готовый индекс) — в SQLite,
+  переживают перезапуск и хранятся ARTIFACT_TTL_DAYS.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from aiogram import Bot
+
+from bot.config import settings
+from bot.utils.db import get_conn
+from bot.utils.http_client import download_to_spool
+from bot.utils.log import logger
+
+FILE_PATH_TTL = 50 * 60
+MAX_CACHED_FILE_BYTES = 2 * 1024 * 1024  # больше — не держим в памяти, только метаданные
+ARTIFACT_TTL_DAYS = 30
+
+# Виды производных результатов
+ARTIFACT_TRANSCRIPT = "whisper_transcript"
+ARTIFACT_DOCUMENT = "document"  # JSON {"sha256", "size", "pages"}
+
+
+class ByteLRU:
+    """LRU со счётом занятой памяти: вытесняет самые старые записи сверх бюджета."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, int(max_bytes))
+        self.size = 0
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self._items.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self._items[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes and self._items:
+            _, evicted = self._items.popitem(last=False)
+            self.size -= len(evicted)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+_bytes = ByteLRU(settings.tg_cache_mb * 1024 * 1024)
+_paths: Dict[str, Tuple[str, float]] = {}
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+async def get_file_path(bot: Bot, file_id: str, file_unique_id: str) -> str:
+    """Путь файла на серверах Telegram; повторный getFile в течение FILE_PATH_TTL не нужен."""
+    cached = _paths.get(file_unique_id)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    file = await bot.get_file(file_id)
+    if len(_paths) > 10000:
+        now = time.monotonic()
+        for key in [k for k, (_, exp) in _paths.items() if exp <= now]:
+            _paths.pop(key, None)
+    _paths[file_unique_id] = (file.file_path, time.monotonic() + FILE_PATH_TTL)
+    return file.file_path
+
+
+def file_url(file_path: str) -> str:
+    return f"https://api.telegram.org/file/bot{settings.bot_token}/{file_path}"
+
+
+async def _fetch(bot: Bot, file_id: str, file_unique_id: str, max_bytes: int) -> bytes:
+    path = await get_file_path(bot, file_id, file_unique_id)
+    download = await download_to_spool(file_url(path), max_bytes)
+    try:
+        return download.file.read()
+    finally:
+        download.close()
+
+
+async def download(bot: Bot, file_id: str, file_unique_id: str, max_bytes: int) -> bytes:
+    """Содержимое файла Telegram; небольшие файлы отдаются из памяти.
+
+    Одновременные запросы одного файла скачивают его один раз.
+    """
+    data = _bytes.get(file_unique_id)
+    if data is not None:
+        return data
+    pending = _inflight.get(file_unique_id)
+    if pending is not None:
+        return await asyncio.shield(pending)
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[file_unique_id] = fut
+    try:
+        data = await _fetch(bot, file_id, file_unique_id, max_bytes)
+        if len(data) <= MAX_CACHED_FILE_BYTES:
+            _bytes.put(file_unique_id, data)
+        fut.set_result(data)
+        return data
+    except BaseException as e:
+        fut.set_exception(e)
+        fut.exception()  # ошибка уже проброшена вызывающему
+        raise
+    finally:
+        _inflight.pop(file_unique_id, None)
+
+
+async def get_artifact(file_unique_id: str, kind: str) -> Optional[str]:
+    """Сохранённый производный результат для файла (или None)."""
+    async with get_conn() as db:
+        row = await (await db.execute(
+            "SELECT value FROM tg_file_artifacts WHERE file_unique_id = ? AND kind = ? "
+            "AND created_at > DATETIME('now', ?)",
+            (file_unique_id, kind, f"-{ARTIFACT_TTL_DAYS} days"),
+        )).fetchone()
+    return row[0] if row else None
+
+
+async def put_artifact(file_unique_id: str, kind: str, value: str) -> None:
+    async with get_conn() as db:
+        await db.execute(
+            "INSERT OR REPLACE INTO tg_file_artifacts(file_unique_id, kind, value) VALUES (?, ?, ?)",
+            (file_unique_id, kind, value),
+        )
+        await db.commit()
+
+
+async def trim_artifacts(bot: Optional[Bot] = None) -> None:
+    """Удаляет устаревшие производные результаты (периодическая задача)."""
+    async with get_conn() as db:
+        cur = await db.execute(
+            "DELETE FROM tg_file_artifacts WHERE created_at <= DATETIME('now', ?)", (f"-{ARTIFACT_TTL_DAYS} days",)
+        )
+        await db.commit()
+    if cur.rowcount:
+        logger.info(f"[tg_cache] удалено устаревших записей: {cur.rowcount}")
+
+
+def get_cache_stats() -> Dict[str, int]:
+    """Состояние кэша в памяти (для /status)."""
+    return {
+        "items": len(_bytes),
+        "bytes": _bytes.size,
+        "budget": _bytes.max_bytes,
+        "hits": _bytes.hits,
+        "misses": _bytes.misses,
+        "paths": len(_paths),
+    }
+
+
+def register_tg_cache_jobs() -> None:
+    from bot.utils.jobs import register_periodic
+
+    register_periodic("tg_cache_trim", 24 * 3600, trim_artifacts)
@@ -0,0 +1,79 @@
+"""Прогрев соединений и кэшей перед приёмом апдейтов.
+
+Без прогрева первое сообщение после рестарта платит за открытие соединений SQLite,
+TLS-рукопожатия с OpenAI и Telegram и пустые кэши. Здесь это делается заранее и
+параллельно, а приём апдейтов начинается после прогрева — но не позже
+WARMUP_TIMEOUT: медленная сеть задерживает старт, но не блокирует его.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from aiogram import Bot
+
+from bot.config import settings
+from bot.utils.log import logger
+
+HOT_USERS_LIMIT = 500
+
+
+async def _warm_openai() -> str:
+    from bot.utils.openai.base import client
+    from bot.utils.openai.models import ModelsManager
+
+    # Лёгкий запрос: открывает keep-alive соединение в пуле клиента и проверяет ключ
+    model = await ModelsManager.get_current_model()
+    await client.models.retrieve(model)
+    return model
+
+
+async def _warm_telegram(bot: Bot) -> str:
+    me = await bot.get_me()
+    return f"@{me.username}"
+
+
+async def _warm_downloads() -> None:
+    from bot.utils.http_client import get_session
+
+    # Файлы Telegram качаются общей aiohttp-сессией — соединение с api.telegram.org
+    # открываем заранее
+    async with get_session().head("https://api.telegram.org") as resp:
+        await resp.read()
+
+
+async def warm_up(bot: Bot) -> None:
+    """Прогревает пул БД, кэши и соединения; пишет в лог, сколько занял каждый шаг."""
+    timeout = settings.warmup_timeout_seconds
+    if timeout <= 0:
+        return
+    from bot.utils.db import prime_user_cache, warm_pool
+    from bot.utils.openai.models import ModelsManager
+
+    steps: Dict[str, Callable[[], Awaitable[object]]] = {
+        "db": warm_pool,
+        "users": lambda: prime_user_cache(HOT_USERS_LIMIT),
+        "model": ModelsManager.get_current_model,
+        "openai": _warm_openai,
+        "telegram": lambda: _warm_telegram(bot),
+        "downloads": _warm_downloads,
+    }
+    results: Dict[str, str] = {}
+
+    async def run(name: str, step: Callable[[], Awaitable[object]]) -> None:
+        started = time.perf_counter()
+        try:
+            value: Optional[object] = await step()
+            detail = f" ({value})" if value is not None else ""
+            results[name] = f"{name} {time.perf_counter() - started:.2f}{detail}"
+        except Exception as e:
+            results[name] = f"{name} ✗"
+            logger.warning(f"Прогрев {name} не удался: {type(e).__name__}: {e}")
+
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(run(name, step)) for name, step in steps.items()]
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    parts = ", ".join(results.get(name, f"{name} — таймаут") for name in steps)
+    logger.info(f"🔥 Прогрев за {time.perf_counter() - started:.2f} с: {parts}")
@@ -0,0 +1,182 @@
+"""Приём обновлений через webhook (aiohttp) вместо long polling.
+
+Telegram присылает каждый апдейт POST-запросом на WEBHOOK_PATH с заголовком
+`X-Telegram-Bot-Api-Secret-Token`; запрос без верного секрета отклоняется. Ответ 200
+отдаётся сразу, а апдейт попадает в очередь, откуда его забирают не больше
+WEBHOOK_WORKERS одновременно обрабатываемых задач — в порядке поступления.
+Апдейт, который ждёт очереди своего чата (`ChatMailboxMiddleware`), слот не
+держит: иначе несколько чатов с пачками сообщений заняли бы весь пул.
+
+Локально режим проверяется без Telegram: при пустом WEBHOOK_URL вебхук не
+регистрируется, а апдейты можно слать скриптом `scripts/fake_telegram_post.py`.
+"""
+from __future__ import annotations
+
+import asyncio
+import hmac
+import json
+from typing import Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from bot.config import settings
+from bot.middlewares import ProcessingSlot, processing_slot
+from bot.utils import drain
+from bot.utils.log import logger
+
+ALLOWED_UPDATES = ["message", "callback_query"]
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+QUEUE_LIMIT = 1000  # при переполнении отвечаем 503 — Telegram повторит доставку позже
+
+
+class WebhookServer:
+    """HTTP-приёмник апдейтов и пул их обработки."""
+
+    def __init__(self, dp: Dispatcher, bot: Bot, secret: str, workers: int, accept_during_drain: bool = False):
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self.accept_during_drain = accept_during_drain
+        self.queue: asyncio.Queue[Update] = asyncio.Queue(maxsize=QUEUE_LIMIT)
+        self._slots = asyncio.Semaphore(max(1, workers))
+        self._tasks: Set[asyncio.Task] = set()
+        self._pump: Optional[asyncio.Task] = None
+        # Принятые, но ещё не начатые апдейты drain должен дождаться
+        drain.register_backlog(self.queue.qsize)
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(settings.webhook_path, self.handle_update)
+        app.router.add_get("/healthz", self.handle_health)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if self.secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            logger.warning(f"webhook: отклонён запрос без верного секрета от {request.remote}")
+            return web.Response(status=401)
+        if drain.is_draining() and not self.accept_during_drain:
+            # Telegram повторит доставку — апдейт получит уже новый процесс
+            return web.Response(status=503)
+        try:
+            update = Update.model_validate(await request.json(loads=json.loads), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning(f"webhook: некорректное тело запроса: {e}")
+            return web.Response(status=400)
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            logger.warning(f"webhook: очередь заполнена ({QUEUE_LIMIT}), апдейт {update.update_id} вернётся позже")
+            return web.Response(status=503)
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({"queue": self.queue.qsize(), "inflight": len(self._tasks)})
+
+    async def _process(self, update: Update, slot: ProcessingSlot) -> None:
+        processing_slot.set(slot)
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            logger.error(f"webhook: ошибка обработки апдейта {update.update_id}: {e}")
+        finally:
+            slot.release()
+
+    async def _run_pump(self) -> None:
+        # Задачи создаются строго в порядке поступления — на этом держится очередь чата
+        while True:
+            update = await self.queue.get()
+            await self._slots.acquire()
+            slot = ProcessingSlot(self._slots)
+            task = asyncio.create_task(self._process(update, slot), name=f"update:{update.update_id}")
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _on_startup(self, app: web.Application) -> None:
+        self._pump = asyncio.create_task(self._run_pump(), name="webhook_pump")
+
+    async def _on_cleanup(self, app: web.Application) -> None:
+        if self._pump is not None:
+            self._pump.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def register_webhook(bot: Bot) -> None:
+    """Сообщает Telegram адрес вебхука (при пустом WEBHOOK_URL — только предупреждение)."""
+    if not settings.webhook_url:
+        logger.warning("WEBHOOK_URL не задан — вебхук в Telegram не регистрируется (локальная проверка)")
+        return
+    await bot.set_webhook(
+        url=settings.webhook_url.rstrip("/") + settings.webhook_path,
+        secret_token=settings.webhook_secret or None,
+        allowed_updates=ALLOWED_UPDATES,
+        max_connections=min(100, max(1, settings.webhook_workers)),
+    )
+    logger.info(f"Webhook зарегистрирован в Telegram: {settings.webhook_url}")
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, host: Optional[str] = None, port: Optional[int] = None,
+                      secret: Optional[str] = None, register: bool = True) -> None:
+    """Поднимает HTTP-сервер, регистрирует вебхук и работает до отмены.
+
+    Воркер шарда (WORKERS > 1) вызывает его со своим локальным портом и секретом
+    супервизора и без регистрации: апдейты ему пересылает супервизор. Воркер
+    принимает их и во время drain — от Telegram они уже подтверждены супервизором.
+    """
+    host = host or settings.webhook_host
+    port = port or settings.webhook_port
+    secret = settings.webhook_secret if secret is None else secret
+    server = WebhookServer(dp, bot, secret, settings.webhook_workers, accept_during_drain=not register)
+    runner = web.AppRunner(server.create_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(
+        f"🌐 Webhook слушает {host}:{port}{settings.webhook_path} "
+        f"(обработчиков: {settings.webhook_workers})"
+    )
+    try:
+        if register:
+            await register_webhook(bot)
+        await asyncio.Event().wait()
+    finally:
+        # Вебхук не снимаем: пока бот перезапускается, Telegram копит апдейты у себя
+        await runner.cleanup()
+
+
+async def run_polling(dp: Dispatcher, bot: Bot) -> None:
+    """Long polling; ранее установленный вебхук снимается, иначе getUpdates вернёт конфликт."""
+    try:
+        await bot.delete_webhook(drop_pending_updates=False)
+    except Exception as e:
+        logger.warning(f"Не удалось снять webhook перед polling: {e}")
+    # Сигналы обрабатывает drain, сессию бота закрывает main() — после завершения хендлеров
+    await dp.start_polling(bot, allowed_updates=ALLOWED_UPDATES, handle_signals=False, close_bot_session=False)
+
+
+async def confirm_updates(bot: Bot, last_update_id: Optional[int]) -> None:
+    """Подтверждает Telegram уже полученные апдейты.
+
+    getUpdates подтверждает пачку только следующим запросом; без этого последняя
+    пачка после рестарта пришла бы повторно.
+    """
+    if last_update_id is None:
+        return
+    try:
+        await bot.get_updates(offset=last_update_id + 1, limit=1, timeout=0, allowed_updates=ALLOWED_UPDATES)
+    except Exception as e:
+        logger.warning(f"Не удалось подтвердить полученные апдейты: {e}")
+
+
+async def stop_polling(dp: Dispatcher, bot: Bot) -> None:
+    """Останавливает long polling и подтверждает последнюю пачку апдейтов."""
+    try:
+        await dp.stop_polling()
+    except RuntimeError:
+        pass  # polling ещё не запущен или уже остановлен
+    await confirm_updates(bot, drain.last_update_id)
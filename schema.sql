@@ -35,7 +35,9 @@ CREATE TABLE IF NOT EXISTS openai_files (
     id         INTEGER PRIMARY KEY AUTOINCREMENT,
     chat_id    INTEGER NOT NULL,
     file_id    TEXT NOT NULL,
-    uploaded   DATETIME DEFAULT CURRENT_TIMESTAMP
+    uploaded   DATETIME DEFAULT CURRENT_TIMESTAMP,
+    sha256     TEXT,                          -- хэш содержимого для повторного использования file_id
+    size       INTEGER
 );
 
 CREATE INDEX IF NOT EXISTS idx_usage_chat_id ON usage(chat_id);
@@ -60,10 +62,86 @@ CREATE TABLE IF NOT EXISTS reminders (
     picked_at        DATETIME,            -- когда задача взята воркером
     fired_at         DATETIME,            -- когда сообщение фактически отправлено
     idempotency_key  TEXT,                -- ключ для защиты от повторной отправки
-    meta_json        TEXT                 -- JSON: {next_offset, next_at, steps_left, end_at, silent, ...}
+    meta_json        TEXT,                -- JSON: {next_offset, next_at, steps_left, end_at, silent, ...}
+    -- предгенерация текста уведомления
+    pregen_text      TEXT,                -- готовый текст (NULL — генерировать при срабатывании)
+    pregen_at        DATETIME,            -- когда предгенерация завершена (успешно или нет)
+    pregen_picked_at DATETIME,            -- когда предгенерация взята воркером
+    -- повторы и dead-letter
+    attempts         INTEGER DEFAULT 0,   -- число неудачных попыток
+    last_error       TEXT,                -- текст последней ошибки
+    retry_at         DATETIME             -- не раньше этого времени (UTC) повторить
 );
 CREATE INDEX IF NOT EXISTS idx_reminders_due_status ON reminders(status, due_at);
-CREATE INDEX IF NOT EXISTS idx_reminders_chat ON reminders(chat_id);
+-- Список /reminders по страницам: ключ (due_at, id) — id входит в индекс как rowid.
+-- Он же обслуживает запросы по chat_id (прежний idx_reminders_chat не нужен).
+CREATE INDEX IF NOT EXISTS idx_reminders_list ON reminders(chat_id, user_id, status, due_at);
+
+-- Очередь удаления файлов OpenAI (фоновая задача openai_file_gc, с повторами и dead-letter)
+CREATE TABLE IF NOT EXISTS openai_file_deletions (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id      INTEGER,                 -- чат, из-за которого файл стал не нужен
+    file_id      TEXT    NOT NULL,
+    sha256       TEXT,
+    status       TEXT    DEFAULT 'scheduled',
+    due_at       DATETIME NOT NULL,       -- UTC
+    created_at   DATETIME DEFAULT CURRENT_TIMESTAMP,
+    picked_at    DATETIME,
+    executed_at  DATETIME,
+    fired_at     DATETIME,
+    attempts     INTEGER DEFAULT 0,
+    last_error   TEXT,
+    retry_at     DATETIME
+);
+CREATE INDEX IF NOT EXISTS idx_openai_file_deletions_due ON openai_file_deletions(status, due_at);
+CREATE INDEX IF NOT EXISTS idx_openai_file_deletions_file ON openai_file_deletions(file_id);
+
+-- Захват содержимого (sha256) на время загрузки в OpenAI или удаления файла: общий для
+-- всех процессов замок, чтобы воркеры не загружали один файл дважды и уборка не удалила
+-- файл, который в этот момент переиспользует другой чат
+CREATE TABLE IF NOT EXISTS openai_file_claims (
+    sha256      TEXT PRIMARY KEY,
+    owner       TEXT NOT NULL,            -- pid и случайный токен захватившего
+    claimed_at  DATETIME DEFAULT CURRENT_TIMESTAMP
+) WITHOUT ROWID;
+
+-- Поисковый индекс документов (DOCUMENT_MODE=index): фрагменты и инвертированный индекс
+CREATE TABLE IF NOT EXISTS doc_chunks (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id     INTEGER NOT NULL,
+    doc_sha256  TEXT    NOT NULL,
+    file_name   TEXT,
+    seq         INTEGER NOT NULL,         -- порядковый номер фрагмента в документе
+    page        INTEGER,
+    length      INTEGER NOT NULL,         -- число термов (для BM25)
+    text        TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_doc_chunks_chat ON doc_chunks(chat_id, doc_sha256, seq);
+
+CREATE TABLE IF NOT EXISTS doc_terms (
+    chat_id   INTEGER NOT NULL,
+    term      TEXT    NOT NULL,
+    chunk_id  INTEGER NOT NULL,
+    tf        INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, term, chunk_id)
+) WITHOUT ROWID;
+
+-- Производные результаты по файлам Telegram (file_unique_id): расшифровки, хэши документов
+CREATE TABLE IF NOT EXISTS tg_file_artifacts (
+    file_unique_id  TEXT NOT NULL,
+    kind            TEXT NOT NULL,
+    value           TEXT NOT NULL,
+    created_at      DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (file_unique_id, kind)
+) WITHOUT ROWID;
+
+-- Метрики процессов-воркеров (WORKERS > 1) для /status
+CREATE TABLE IF NOT EXISTS worker_stats (
+    shard       INTEGER PRIMARY KEY,
+    pid         INTEGER,
+    payload     TEXT,
+    updated_at  DATETIME DEFAULT CURRENT_TIMESTAMP
+);
 
 -- Вставляем дефолтную модель
 INSERT OR IGNORE INTO bot_settings (key, value) VALUES ('current_model', 'gpt-4o-mini');
\ No newline at end of file
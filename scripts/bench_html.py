@@ -0,0 +1,90 @@
+"""Микробенчмарк форматирования ответов: прежние escape/split против рендерера Markdown.
+
+Запуск из корня проекта:  python scripts/bench_html.py [размер_ответа_КБ]
+Модуль bot/utils/html.py загружается напрямую, без конфигурации бота (.env не нужен).
+"""
+import importlib.util
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+_spec = importlib.util.spec_from_file_location("tg_html", ROOT / "bot" / "utils" / "html.py")
+html = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(html)
+
+SAMPLE = """## Итоги & выводы
+Модель ответила **подробно**: см. `config <prod>` и [документацию](https://example.com/?a=1&b=2).
+- пункт *первый* — 2 < 3 > 1
+- пункт второй с "кавычками"
+> цитата из источника
+```python
+def f(x):
+    return x < 10 and x > 0
+```
+"""
+
+
+_TABLE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"})
+
+
+def translate_escape(text: str) -> str:
+    """Однопроходная альтернатива: на кириллице медленнее цепочки replace."""
+    return text.translate(_TABLE)
+
+
+def old_escape_html(text: str) -> str:
+    return (text
+            .replace('&', '&amp;')
+            .replace('<', '&lt;')
+            .replace('>', '&gt;')
+            .replace('"', '&quot;'))
+
+
+def old_split(text: str, max_length: int = 4096) -> list:
+    if len(text) <= max_length:
+        return [text]
+    chunks = []
+    current_pos = 0
+    while current_pos < len(text):
+        end_pos = current_pos + max_length
+        if end_pos >= len(text):
+            chunks.append(text[current_pos:])
+            break
+        safe_break = text.rfind('\n', current_pos, end_pos)
+        if safe_break == -1 or safe_break == current_pos:
+            safe_break = text.rfind(' ', current_pos, end_pos)
+        if safe_break == -1 or safe_break == current_pos:
+            safe_break = end_pos
+        chunks.append(text[current_pos:safe_break])
+        current_pos = safe_break + (1 if text[safe_break:safe_break+1] in ['\n', ' '] else 0)
+    return chunks
+
+
+def _stream(text: str, piece: int = 256) -> list:
+    renderer, chunker = html.MarkdownRenderer(), html.HTMLChunker()
+    out = []
+    for i in range(0, len(text), piece):
+        out += chunker.feed(renderer.feed(text[i:i + piece]))
+    return out + chunker.feed(renderer.close()) + chunker.close()
+
+
+def main() -> None:
+    size_kb = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    text = SAMPLE * (size_kb * 1024 // len(SAMPLE) + 1)
+    cases = {
+        "escape_html (4×replace)": lambda: html.escape_html(text),
+        "escape: str.translate": lambda: translate_escape(text),
+        "old escape + split": lambda: old_split(old_escape_html(text)),
+        "render_markdown + split": lambda: html.split_long_html_message(html.render_markdown(text)),
+        "stream render + chunker": lambda: _stream(text),
+    }
+    print(f"Ответ {len(text) // 1024} КБ, лучшее из 5 повторов:")
+    for name, fn in cases.items():
+        number = 10
+        best = min(timeit.repeat(fn, number=number, repeat=5)) / number
+        print(f"  {name:<26} {best * 1000:8.2f} мс  ({len(text) / best / 1e6:6.1f} МБ/с)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Имитация Telegram для локальной проверки webhook-режима.
+
+Шлёт на локальный вебхук текстовые апдейты так же, как это делает Telegram
+(POST JSON + заголовок X-Telegram-Bot-Api-Secret-Token), и печатает коды ответов.
+
+    BOT_MODE=webhook WEBHOOK_SECRET=s3cret python -m bot.main
+    python scripts/fake_telegram_post.py --secret s3cret --chats 3 --count 10
+
+Ответы бота уходят в настоящий Bot API, поэтому для полной проверки нужен рабочий
+BOT_TOKEN и chat_id, где бот может писать (--chat-base).
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import aiohttp
+from yarl import URL
+
+
+def make_update(update_id: int, chat_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": "Test"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8080/telegram")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--chats", type=int, default=1, help="сколько разных чатов")
+    parser.add_argument("--count", type=int, default=5, help="сообщений в каждый чат")
+    parser.add_argument("--chat-base", type=int, default=100000, help="chat_id первого чата")
+    parser.add_argument("--text", default="Привет! Сообщение {n} из чата {chat}")
+    args = parser.parse_args()
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    codes: Counter = Counter()
+    started = time.monotonic()
+    async with aiohttp.ClientSession(headers=headers) as session:
+        update_id = int(time.time())
+        for n in range(1, args.count + 1):
+            for c in range(args.chats):
+                chat_id = args.chat_base + c
+                update_id += 1
+                body = make_update(update_id, chat_id, args.text.format(n=n, chat=chat_id))
+                async with session.post(args.url, json=body) as resp:
+                    codes[resp.status] += 1
+        async with session.get(URL(args.url).with_path("/healthz")) as resp:
+            health = await resp.text() if resp.status == 200 else resp.status
+    elapsed = time.monotonic() - started
+    print(f"Отправлено {sum(codes.values())} апдейтов за {elapsed:.2f} с, коды ответов: {dict(codes)}")
+    print(f"healthz: {health}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
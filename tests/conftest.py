@@ -0,0 +1,16 @@
+"""Общее окружение тестов.
+
+Модули бота при импорте читают настройки и создают каталог logs, поэтому до сбора
+тестов задаём обязательные переменные и уходим во временный каталог — рабочие .env
+и логи проекта тестами не затрагиваются.
+"""
+import os
+import tempfile
+
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("ADMIN_ID", "1")
+
+
+def pytest_sessionstart(session):
+    os.chdir(tempfile.mkdtemp(prefix="gpttg-tests-"))
@@ -0,0 +1,135 @@
+"""Тесты MarkdownRenderer и HTMLChunker (bot/utils/html.py)."""
+import random
+import re
+
+import pytest
+
+from bot.utils.html import HTMLChunker, MarkdownRenderer, render_markdown, split_long_html_message
+
+_TAG_RE = re.compile(r"<(/?)([a-z]+)[^>]*>")
+_WORDS = [
+    "hello", "мир", "a&b", "<x>", "**bold**", "*it*", "`co de`", "[link](https://example.com/a/b?x=1&y=2)",
+    "~~s~~", "\n", "\n\n", "- item", "# Head", "```py\nx = 1\n```", "```\n", "> quote",
+    "longwordwithoutspaces" * 3,
+]
+
+
+def _strip_tags(html: str) -> str:
+    return re.sub(r"<[^>]*>", "", html)
+
+
+def _assert_valid_chunks(chunks, max_length):
+    for chunk in chunks:
+        assert len(chunk) <= max_length, chunk
+        stack = []
+        for m in _TAG_RE.finditer(chunk):
+            if m.group(1):
+                assert stack and stack[-1] == m.group(2), f"несбалансированные теги: {chunk!r}"
+                stack.pop()
+            else:
+                stack.append(m.group(2))
+        assert not stack, f"незакрытые теги: {chunk!r}"
+        # Каждый & в тексте — начало целой сущности
+        text = _strip_tags(chunk)
+        assert all(re.match(r"&#?\w+;", text[i:]) for i in range(len(text)) if text[i] == "&"), chunk
+        # Пустой элемент в конце куска — след разрыва сразу после открывающего тега
+        assert not re.search(r"<([a-z]+)[^>]*></\1>$", chunk), chunk
+
+
+def _random_markdown(rng):
+    return " ".join(rng.choice(_WORDS) for _ in range(rng.randint(1, 60)))
+
+
+def _feed_randomly(chunker, html, rng):
+    chunks, pos = [], 0
+    while pos < len(html):
+        step = rng.randint(1, 30)
+        chunks += chunker.feed(html[pos:pos + step])
+        pos += step
+    return chunks + chunker.close()
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("**жирный** и *курсив*, `код`", "<b>жирный</b> и <i>курсив</i>, <code>код</code>"),
+        ("[ссылка](https://example.com/?a=1&b=2)", '<a href="https://example.com/?a=1&amp;b=2">ссылка</a>'),
+        ("# Заголовок", "<b>Заголовок</b>"),
+        ("> цитата\n> ещё", "<blockquote>цитата\nещё</blockquote>"),
+        ("- пункт\n* второй", "• пункт\n• второй"),
+        ("a < b & c", "a &lt; b &amp; c"),
+        ("```python\nif a < b:\n    pass\n```", '<pre><code class="language-python">if a &lt; b:\n    pass</code></pre>'),
+        ("```py extra words\nx\n```", '<pre><code class="language-py">x</code></pre>'),
+        ("```\n\nx\n```", "<pre><code>\nx</code></pre>"),
+    ],
+)
+def test_render_markdown(text, expected):
+    assert render_markdown(text) == expected
+
+
+@pytest.mark.parametrize("text", ["```\n```", "текст\n```", "```py\n\n\n"])
+def test_render_markdown_skips_empty_code_block(text):
+    assert "<pre>" not in render_markdown(text)
+
+
+def test_render_markdown_limits_language_name():
+    html = render_markdown("```" + "x" * 500 + "\ncode\n```")
+    assert html == f'<pre><code class="language-{"x" * 20}">code</code></pre>'
+
+
+def test_renderer_streaming_matches_whole_text():
+    rng = random.Random(1)
+    for _ in range(200):
+        text = _random_markdown(rng)
+        renderer = MarkdownRenderer()
+        out, pos = [], 0
+        while pos < len(text):
+            step = rng.randint(1, 20)
+            out.append(renderer.feed(text[pos:pos + step]))
+            pos += step
+        out.append(renderer.close())
+        assert "".join(out) == render_markdown(text)
+
+
+@pytest.mark.parametrize("max_length", [50, 64, 100, 4096])
+def test_chunker_invariants_on_random_markdown(max_length):
+    rng = random.Random(max_length)
+    for _ in range(500):
+        html = render_markdown(_random_markdown(rng))
+        chunks = _feed_randomly(HTMLChunker(max_length), html, rng)
+        _assert_valid_chunks(chunks, max_length)
+        # Режется только разметка лишних тегов, текст сохраняется целиком
+        assert _strip_tags("".join(chunks)).strip() == _strip_tags(html).strip()
+
+
+def test_chunker_drops_markup_that_does_not_fit():
+    href = "https://example.com/" + "x" * 40
+    html = f'<a href="{href}">ссылка</a> ' + "слово " * 20
+    chunks = split_long_html_message(html, 50)
+    _assert_valid_chunks(chunks, 50)
+    assert chunks[0].startswith("ссылка ")
+
+
+def test_chunker_reopens_tags_across_chunks():
+    html = "<b>" + "слово " * 30 + "</b>"
+    chunks = split_long_html_message(html, 50)
+    assert len(chunks) > 1
+    _assert_valid_chunks(chunks, 50)
+    assert all(c.startswith("<b>") and c.endswith("</b>") for c in chunks)
+
+
+def test_chunker_prefers_line_breaks():
+    html = "первая строка текста\nвторая строка текста\nтретья"
+    assert split_long_html_message(html, 45) == ["первая строка текста\nвторая строка текста\n", "третья"]
+
+
+def test_chunker_keeps_entities_whole():
+    html = "x" * 47 + "&amp;&lt;&gt;"
+    chunks = split_long_html_message(html, 50)
+    _assert_valid_chunks(chunks, 50)
+    assert "".join(chunks) == html
+
+
+def test_short_message_is_not_split():
+    html = "<b>коротко</b> &amp; ясно"
+    assert split_long_html_message(html) == [html]
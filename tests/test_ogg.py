@@ -0,0 +1,101 @@
+"""Тесты нарезки Ogg/Opus (bot/utils/ogg.py) на синтетическом потоке."""
+import struct
+
+import pytest
+
+from bot.utils.ogg import FLAG_BOS, FLAG_EOS, OggPage, ogg_crc, parse_opus, parse_pages, split_opus
+
+PRE_SKIP = 312
+FRAME = 960            # 20 мс при 48 кГц
+PAGE_PACKETS = 50      # одна страница — ровно секунда
+LOUD, QUIET = 120, 3   # размеры пакетов речи и паузы
+
+
+def _reference_crc(data: bytes) -> int:
+    """Побитовый CRC Ogg — независимая от табличной реализации проверка."""
+    crc = 0
+    for byte in data:
+        crc ^= byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else crc << 1
+            crc &= 0xFFFFFFFF
+    return crc
+
+
+def _opus_stream(seconds: int, quiet_pages=()) -> bytes:
+    head = b"OpusHead" + struct.pack("<BBHIhB", 1, 1, PRE_SKIP, 48000, 0, 0)
+    vendor = b"test"
+    tags = b"OpusTags" + struct.pack("<I", len(vendor)) + vendor + struct.pack("<I", 0)
+    pages = [
+        OggPage(FLAG_BOS, 0, 7, 0, bytes([len(head)]), head),
+        OggPage(0, 0, 7, 1, bytes([len(tags)]), tags),
+    ]
+    granule = PRE_SKIP
+    for i in range(seconds):
+        size = QUIET if i in quiet_pages else LOUD
+        granule += FRAME * PAGE_PACKETS
+        htype = FLAG_EOS if i == seconds - 1 else 0
+        pages.append(OggPage(htype, granule, 7, i + 2, bytes([size] * PAGE_PACKETS), bytes(size * PAGE_PACKETS)))
+    return b"".join(p.to_bytes() for p in pages)
+
+
+def _assert_valid_segment(data: bytes):
+    pages = parse_pages(data)
+    pos = 0
+    for seq, page in enumerate(pages):
+        raw = page.to_bytes()
+        stored = struct.unpack_from("<I", data, pos + 22)[0]
+        unsigned = data[pos:pos + 22] + b"\0\0\0\0" + data[pos + 26:pos + len(raw)]
+        assert stored == _reference_crc(unsigned)
+        assert page.seq == seq
+        pos += len(raw)
+    assert pages[0].header_type & FLAG_BOS
+    assert pages[0].body.startswith(b"OpusHead")
+    assert [bool(p.header_type & FLAG_EOS) for p in pages] == [False] * (len(pages) - 1) + [True]
+    assert all(not p.header_type & FLAG_BOS for p in pages[1:])
+
+
+def test_ogg_crc_matches_reference():
+    for data in (b"", b"OggS", bytes(range(256)) * 3):
+        assert ogg_crc(data) == _reference_crc(data)
+
+
+def test_parse_opus_duration():
+    stream = parse_opus(_opus_stream(5))
+    assert stream is not None
+    assert len(stream.headers) == 2
+    assert len(stream.audio) == 5
+    assert stream.pre_skip == PRE_SKIP
+    assert stream.duration == pytest.approx(5.0)
+
+
+def test_split_opus_keeps_short_or_foreign_data():
+    short = _opus_stream(20)
+    assert split_opus(short, 20) == [(short, pytest.approx(20.0))]
+    assert split_opus(b"not ogg at all", 20) == [(b"not ogg at all", 0.0)]
+
+
+def test_split_opus_segments_are_standalone_streams():
+    data = _opus_stream(75)
+    segments = split_opus(data, 20)
+    assert len(segments) > 1
+    for segment, duration in segments:
+        _assert_valid_segment(segment)
+        stream = parse_opus(segment)
+        assert stream is not None
+        assert stream.duration == pytest.approx(duration)
+        # Каждый сегмент начинается с нуля: granule первой страницы — ровно её длина
+        assert stream.audio[0].granule - PRE_SKIP == FRAME * PAGE_PACKETS
+    for _, duration in segments[:-1]:
+        assert 15.0 <= duration <= 25.0
+    assert sum(duration for _, duration in segments) == pytest.approx(75.0)
+    # Аудио переносится без изменений
+    original = parse_opus(data).audio
+    bodies = [page.body for segment, _ in segments for page in parse_opus(segment).audio]
+    assert bodies == [page.body for page in original]
+
+
+def test_split_opus_cuts_at_quietest_boundary():
+    segments = split_opus(_opus_stream(60, quiet_pages={22, 23}), 20)
+    # Самая тихая граница в окне 15–25 с — между двумя страницами паузы (конец 23-й секунды)
+    assert segments[0][1] == pytest.approx(23.0)
@@ -0,0 +1,64 @@
+"""Тесты локального разбора просьб о напоминании (bot/utils/reminder_parser.py)."""
+from datetime import datetime, timezone
+
+import pytest
+
+from bot.utils.reminder_parser import parse_reminder_request
+
+# Вторник, 13:00 по Москве
+NOW = datetime(2026, 3, 10, 10, 0, tzinfo=timezone.utc)
+
+
+def _utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize(
+    "message, user_tz, due, text",
+    [
+        ("напомни через 10 минут позвонить маме", "Europe/Moscow", _utc(2026, 3, 10, 10, 10), "Позвонить маме"),
+        ("Напомни мне позвонить маме через 2 часа", "Europe/Moscow", _utc(2026, 3, 10, 12, 0), "Позвонить маме"),
+        ("напомни через 1ч30м выйти", "Europe/Moscow", _utc(2026, 3, 10, 11, 30), "Выйти"),
+        ("напомни через полчаса проверить духовку", "Europe/Moscow", _utc(2026, 3, 10, 10, 30), "Проверить духовку"),
+        ("напомни завтра в 9:30 купить хлеб", "Europe/Moscow", _utc(2026, 3, 11, 6, 30), "Купить хлеб"),
+        ("напомни в 15:00 созвон", "Europe/Moscow", _utc(2026, 3, 10, 12, 0), "Созвон"),
+        # Время уже прошло и день не назван — завтра
+        ("напомни в 12:00 обед", "Europe/Moscow", _utc(2026, 3, 11, 9, 0), "Обед"),
+        ("напомни в 8 вечера выключить духовку", "Europe/Moscow", _utc(2026, 3, 10, 17, 0), "Выключить духовку"),
+        ("напомни 25.12 в 10:00 поздравить Олю", "Europe/Moscow", _utc(2026, 12, 25, 7, 0), "Поздравить Олю"),
+        ("remind me in 2 hours to stretch", "UTC", _utc(2026, 3, 10, 12, 0), "Stretch"),
+        ("remind me in an hour and 5 minutes to leave", "UTC", _utc(2026, 3, 10, 11, 5), "Leave"),
+        ("remind me at 5pm to call Bob", "America/New_York", _utc(2026, 3, 10, 21, 0), "Call Bob"),
+    ],
+)
+def test_parses_simple_requests(message, user_tz, due, text):
+    parsed = parse_reminder_request(message, user_tz, NOW)
+    assert parsed is not None
+    assert parsed.due_at_utc == due
+    assert parsed.text == text
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "привет через 5 минут",
+        "напомни через 5 минут",
+        "напомни каждый день пить воду",
+        # «в 7» — то ли утро, то ли вечер
+        "напомни в 7 позвонить",
+        # Явно названный день, время которого уже прошло
+        "напомни сегодня в 9:00 зарядка",
+        "напомни через 400 дней продлить",
+        # Второе указание времени осталось в тексте
+        "напомни через 2 мин позвонить в 5",
+        "напомни через 2 мин прийти к 5",
+        "напомни через 5 минут завтра созвон",
+        "напомни через час и 15 минут выйти",
+    ],
+)
+def test_ambiguous_requests_go_to_model(message):
+    assert parse_reminder_request(message, "Europe/Moscow", NOW) is None
+
+
+def test_unknown_timezone():
+    assert parse_reminder_request("напомни через 10 минут позвонить", "Nowhere/City", NOW) is None
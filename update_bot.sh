@@ -4,6 +4,9 @@
 #   --no-restart     — отложить рестарт бота через systemd‑run (нужно, когда
 #                      скрипт вызывается самим ботом и нельзя убивать текущий
 #                      процесс).
+#   --skip-restart   — не перезапускать бота вовсе: его вызывает /update, бот
+#                      сам завершится после drain, а systemd (Restart=always)
+#                      поднимет его уже с новым кодом.
 #   --branch=<ветка> — обновиться до указанной ветки (по умолчанию master).
 #   --force          — принудительное обновление без проверки изменений.
 
@@ -14,12 +17,14 @@ REPO_DIR="/root/GPTTG"
 LOG_FILE="/var/log/gpttg-update.log"
 TARGET_BRANCH="master"
 RESTART=true
+SKIP_RESTART=false
 FORCE_UPDATE=false
 
 # ── Обработка аргументов ──────────────────────────────────────────────
 for arg in "$@"; do
   case "$arg" in
     --no-restart) RESTART=false ;;
+    --skip-restart) SKIP_RESTART=true ;;
     --branch=*)   TARGET_BRANCH="${arg#*=}" ;;
     --force)      FORCE_UPDATE=true ;;
   esac
@@ -93,6 +98,10 @@ poetry lock --no-interaction --no-ansi
 log "🔄  Устанавливаю зависимости"
 poetry install --only=main --no-interaction --no-ansi
 
+# Байткод компилируем до рестарта: иначе бот после обновления тратит старт на это сам
+log "⚙️  Компилирую байткод"
+poetry run python -m compileall -q bot || log "⚠️  compileall завершился с ошибкой"
+
 # ── Обновляем unit‑файл бота ──────────────────────────────────────────
 UNIT_SRC="$REPO_DIR/gpttg-bot.service"
 UNIT_DST="/etc/systemd/system/gpttg-bot.service"
@@ -110,7 +119,9 @@ log "📝  gpttg-update.timer"
 systemctl daemon-reload
 
 # ── Перезапуск бота ───────────────────────────────────────────────────
-if $RESTART; then
+if $SKIP_RESTART; then
+  log "⏳  Рестарт пропущен: бот перезапустится сам после завершения текущих запросов"
+elif $RESTART; then
   log "🚀  Перезапускаю $SERVICE_NAME немедленно"
   systemctl restart "$SERVICE_NAME"
 else